@@ -1,7 +1,93 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 1000
+
+
+class LedgerCursorPagination(CursorPagination):
+    """
+    Keyset pagination for append-heavy tables (ledger, sales, payments).
+    Pages are keyed on (created_at, id), newest first: the cursor holds both values of the
+    row a page ended on and the next page starts strictly after that pair, so rows sharing a
+    created_at (bulk_create batches) are neither repeated nor skipped when rows are inserted
+    between two requests. No COUNT(*) and no OFFSET, so page N costs the same index range
+    scan as page 1. DRF's CursorPagination only keys on the first ordering field plus an offset.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    separator = '|'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = [self._flip(field) for field in self.ordering] if reverse else list(self.ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = queryset.filter(self._after(queryset.model, ordering, self.cursor.position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            # walking back from a page that had rows before it
+            self.page.reverse()
+            self.has_next, self.has_previous = bool(self.page), has_following
+        else:
+            self.has_next, self.has_previous = has_following, self.cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # past the end: the previous page is the last one
+            return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.cursor.position))
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _position(self, instance):
+        return self.separator.join(str(getattr(instance, field.lstrip('-'))) for field in self.ordering)
+
+    def _after(self, model, ordering, position):
+        """
+        Q of the rows strictly after `position` in `ordering` (a lexicographic comparison of the key columns).
+        """
+        values = position.split(self.separator)
+        if len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [model._meta.get_field(field.lstrip('-')).to_python(value)
+                      for field, value in zip(ordering, values)]
+        except (ValidationError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition, equal = Q(), {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
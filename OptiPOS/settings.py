@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -57,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.IdempotencyMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +93,33 @@ DATABASES = {
     }
 }
 
+# Cache backend, chosen with CACHE_BACKEND: database (default; shared by every worker, the table is
+# created by `manage.py createcachetable`), redis (Django's RedisCache, needs the `redis` package; any
+# Redis-compatible server at CACHE_LOCATION works), file (shared by the processes of one host) or
+# locmem (per process: only for a single-process server, the catalog cache stays off on it unless
+# CATALOG_CACHE['ALLOW_LOCAL'] is set).
+CACHE_BACKENDS = {
+    'database': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'optipos_cache'),
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'optipos',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379/0'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'database')],
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -168,3 +197,31 @@ SPECTACULAR_SETTINGS = {
     'TAGS_SORT': 'alpha',  # optional: sort tags alphabetically
     'TAGS_BY_CLASS': True
 }
+
+# Inventory row locking (see inventory/locking.py)
+INVENTORY_LOCKS = {
+    'MAX_RETRIES': 3,  # retries after a deadlock / serialization failure
+    'BACKOFF_BASE': 0.05,  # seconds, doubled on every retry (with full jitter)
+    'BACKOFF_MAX': 1.0,  # seconds, upper bound for a single backoff
+    'WAIT_WARNING': 0.5,  # seconds, log a warning when acquiring row locks takes longer
+}
+
+# Read-through cache of the catalog list / detail responses (see core/cache.py)
+CATALOG_CACHE = {
+    'ALIAS': 'default',  # entry of CACHES to use; must be shared by all workers (not locmem)
+    'TIMEOUT': 300,  # seconds; entries are also invalidated on every change
+    'ALLOW_LOCAL': False,  # cache on a locmem backend anyway (single-process servers only)
+}
+
+# Delta sync for terminals (see inventory/sync.py)
+SYNC = {
+    'LAG': 5,  # seconds; rows changed more recently wait for the next pull
+    'PAGE_SIZE': 1000,  # rows per table and request
+    'MAX_PAGE_SIZE': 10000,
+}
+
+# Idempotency-Key header on POST / PUT / PATCH / DELETE (see core/middleware.py)
+IDEMPOTENCY = {
+    'TTL': 24 * 3600,  # seconds a stored response is replayed
+    'LOCK_TIMEOUT': 60,  # seconds after which an unfinished request no longer blocks its key
+}
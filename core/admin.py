@@ -1,9 +1,37 @@
 from django.contrib import admin
 
-from core.models import Store, StoreUser, Category, Brand, Product
+from core.models import Store, StoreUser, Category, Brand, Product, IdempotencyKey
+
+
+@admin.register(Store)
+class StoreAdmin(admin.ModelAdmin):
+    list_display = ('name', 'location', 'creator', 'created_at')
+    list_select_related = ('creator',)
+    search_fields = ('name', 'location')
+
+
+@admin.register(StoreUser)
+class StoreUserAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'is_manager', 'is_default', 'created_at')
+    list_select_related = ('store', 'user')
+    list_filter = ('is_manager', 'is_default')
+    raw_id_fields = ('store', 'user')
+
 
-admin.site.register(Store)
-admin.site.register(StoreUser)
 admin.site.register(Category)
 admin.site.register(Brand)
-admin.site.register(Product)
\ No newline at end of file
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'sku', 'category', 'brand', 'unit_price', 'is_active')
+    list_select_related = ('category', 'brand')
+    list_filter = ('is_active',)
+    search_fields = ('sku', 'name')
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'scope', 'status_code', 'created_at', 'expires_at')
+    search_fields = ('key',)
+    exclude = ('body',)
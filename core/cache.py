@@ -0,0 +1,138 @@
+"""
+Versioned read-through cache for the catalog endpoints (store, category, brand, product).
+
+Every model has a version number in the cache; responses are cached under keys that include
+it, and saving / deleting a row bumps it (core.signals), so stale entries are never read again
+and simply expire. The ETag of a response is derived from the version and the URL, so a
+client revalidating with If-None-Match gets a 304 without any query or serialization.
+
+The versions must be shared by every worker, or a write would only invalidate the cache of
+the process that handled it: on a per-process (locmem) backend the cache is off unless
+CATALOG_CACHE["ALLOW_LOCAL"] says the server runs a single process.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ALIAS": "default",
+    "TIMEOUT": 300,
+    "ALLOW_LOCAL": False,
+}
+
+
+class CatalogCache:
+    def __init__(self, **options):
+        conf = {**DEFAULTS, **getattr(settings, "CATALOG_CACHE", {}), **options}
+        self.alias = conf["ALIAS"]
+        self.timeout = conf["TIMEOUT"]
+        self.allow_local = conf["ALLOW_LOCAL"]
+        self._warned = False
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        if self.allow_local or not isinstance(self.cache, LocMemCache):
+            return True
+        if not self._warned:
+            self._warned = True
+            logger.warning("Catalog cache disabled: cache %r is per process (locmem); use a shared backend.",
+                           self.alias)
+        return False
+
+    def _version_key(self, model):
+        return f"catalog:version:{model._meta.label_lower}"
+
+    def version(self, model):
+        key = self._version_key(model)
+        version = self.cache.get(key)
+        if version is None:
+            # evicted or first use: start from a value no earlier version can have had
+            self.cache.add(key, time.time_ns(), None)
+            version = self.cache.get(key)
+        return version
+
+    def bump(self, model):
+        """
+        Invalidate every cached response of `model`, once the current transaction commits
+        (bumping earlier would let a concurrent request cache the old rows under the new version).
+        """
+        if not self.enabled:
+            return
+
+        def bump():
+            try:
+                self.cache.incr(self._version_key(model))
+            except ValueError:
+                self.cache.set(self._version_key(model), time.time_ns(), None)
+
+        transaction.on_commit(bump)
+
+    def etag(self, model, request):
+        digest = hashlib.md5(request.build_absolute_uri().encode(), usedforsecurity=False).hexdigest()
+        return f'"{model._meta.model_name}-{self.version(model)}-{digest}"'
+
+    def get(self, etag):
+        return self.cache.get(f"catalog:response:{etag}")
+
+    def set(self, etag, data):
+        self.cache.set(f"catalog:response:{etag}", data, self.timeout)
+
+
+catalog_cache = CatalogCache()
+
+
+def cached_response(view):
+    """
+    Serve a GET list / retrieve action from the catalog cache, with ETag / If-None-Match.
+    """
+
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        if not catalog_cache.enabled:
+            return view(self, request, *args, **kwargs)
+        etag = catalog_cache.etag(self.queryset.model, request)
+        if etag in request.headers.get("If-None-Match", ""):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        data = catalog_cache.get(etag)
+        if data is None:
+            response = view(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            catalog_cache.set(etag, response.data)
+        else:
+            response = Response(data)
+        response["ETag"] = etag
+        # clients may keep the response but must revalidate it
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    return wrapper
+
+
+class CatalogCacheMixin:
+    """
+    Caches list and retrieve of a ModelViewSet whose model is registered in core.signals.
+    """
+
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
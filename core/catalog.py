@@ -0,0 +1,198 @@
+"""
+Streaming product catalog import / export (CSV or JSONL).
+
+Rows are parsed incrementally, categories and brands are resolved through in-memory
+name -> id maps, and products are upserted by SKU in chunked
+bulk_create(update_conflicts=True) batches. A bad row is reported with its line number and
+skipped; it never aborts the import.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError, transaction
+
+from core.cache import catalog_cache
+from core.models import Brand, Category, Product
+from core.search import product_search
+from inventory.scan import scan_cache
+
+EXPORT_FIELDS = ('sku', 'name', 'category', 'brand', 'description', 'unit_price', 'unit_cost', 'tax_method',
+                 'tax_rate', 'is_active')
+# columns updated when the SKU already exists
+UPSERT_FIELDS = ['name', 'category', 'brand', 'description', 'unit_price', 'unit_cost', 'tax_method', 'tax_rate',
+                 'is_active', 'updated_at']
+FORMATS = ('csv', 'jsonl')
+TAX_METHODS = {choice for choice, _ in Product._meta.get_field('tax_method').choices}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(filename, default='csv'):
+    for fmt in FORMATS:
+        if filename and filename.lower().endswith(f'.{fmt}'):
+            return fmt
+    return default
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line_number, row_dict) from a binary or text stream without loading it in memory.
+    """
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or hasattr(stream, 'chunks'):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield line_number, exc
+
+
+def _decimal(row, field, default=None):
+    value = row.get(field)
+    if value in (None, ''):
+        if default is None:
+            raise RowError(f"{field} is required")
+        return default
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f"{field} is not a number: {value!r}")
+    if not number.is_finite():
+        raise RowError(f"{field} is not a number: {value!r}")
+    if number < 0:
+        raise RowError(f"{field} must be >= 0")
+    return number
+
+
+class ProductImporter:
+    def __init__(self, batch_size=1000, max_errors=1000, on_error=None):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.on_error = on_error  # called with (line_number, message) for every rejected row
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.brands = dict(Brand.objects.values_list('name', 'id'))
+        self.upserted = 0
+        self.error_count = 0
+        self.errors = []  # first max_errors (line, message)
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if self.on_error is not None:
+            self.on_error(line_number, message)
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def _resolve(self, names, model, name):
+        if not name:
+            raise RowError(f"{model._meta.verbose_name} is required")
+        if name not in names:
+            names[name] = model.objects.get_or_create(name=name)[0].pk
+        return names[name]
+
+    def build(self, row):
+        sku = (row.get('sku') or '').strip()
+        name = (row.get('name') or '').strip()
+        if not sku or len(sku) > 100:
+            raise RowError("sku is required (max 100 characters)")
+        if not name or len(name) > 100:
+            raise RowError("name is required (max 100 characters)")
+        tax_method = row.get('tax_method') or 'exclusive'
+        if tax_method not in TAX_METHODS:
+            raise RowError(f"tax_method must be one of {sorted(TAX_METHODS)}")
+        is_active = row.get('is_active', True)
+        if isinstance(is_active, str):
+            is_active = is_active.strip().lower() in TRUE_VALUES
+
+        return Product(
+            sku=sku,
+            name=name,
+            category_id=self._resolve(self.categories, Category, (row.get('category') or '').strip()),
+            brand_id=self._resolve(self.brands, Brand, (row.get('brand') or '').strip()),
+            description=row.get('description') or '',
+            unit_price=_decimal(row, 'unit_price'),
+            unit_cost=_decimal(row, 'unit_cost'),
+            tax_method=tax_method,
+            tax_rate=_decimal(row, 'tax_rate', Decimal('0')),
+            is_active=bool(is_active),
+        )
+
+    def flush(self, batch):
+        # the same SKU twice in one INSERT .. ON CONFLICT is an error: last row wins
+        products = list({line_product[1].sku: line_product for line_product in batch}.values())
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create([product for _, product in products], update_conflicts=True,
+                                            unique_fields=['sku'], update_fields=UPSERT_FIELDS)
+        except DatabaseError as exc:
+            for line_number, _ in products:
+                self.error(line_number, f"batch rejected by the database: {exc}")
+            return
+        self.upserted += len(products)
+        # bulk_create sends no post_save
+        product_search.index(Product.objects.filter(sku__in=[product.sku for _, product in products]))
+        scan_cache.clear()
+        catalog_cache.bump(Product)
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in rows:
+            try:
+                if isinstance(row, Exception):
+                    raise RowError(f"invalid JSON: {row}")
+                if not isinstance(row, dict):
+                    raise RowError("expected an object")
+                batch.append((line_number, self.build(row)))
+            except RowError as exc:
+                self.error(line_number, str(exc))
+                continue
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        return self.summary()
+
+    def summary(self):
+        return {'upserted': self.upserted, 'error_count': self.error_count, 'errors': self.errors}
+
+
+def export_rows(queryset=None, chunk_size=2000):
+    """
+    Yield one dict per product (category / brand by name), streamed from a server-side cursor.
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    values = queryset.order_by('sku').values_list(
+        'sku', 'name', 'category__name', 'brand__name', 'description', 'unit_price', 'unit_cost', 'tax_method',
+        'tax_rate', 'is_active')
+    for row in values.iterator(chunk_size=chunk_size):
+        yield dict(zip(EXPORT_FIELDS, row))
+
+
+def export_lines(fmt, queryset=None):
+    """
+    Encoded CSV / JSONL lines for a StreamingHttpResponse.
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for row in export_rows(queryset):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for row in export_rows(queryset):
+            yield json.dumps(row, default=str) + "\n"
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import catalog
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog as CSV or JSONL to stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=catalog.FORMATS, default='csv')
+
+    def handle(self, *args, **options):
+        for line in catalog.export_lines(options['format']):
+            self.stdout.write(line, ending='')
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import catalog
+
+
+class Command(BaseCommand):
+    help = "Upsert products by SKU from a CSV or JSONL file (category / brand by name, created when missing)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import; '-' reads stdin.")
+        parser.add_argument('--format', choices=catalog.FORMATS, help="Default: from the file extension, else csv.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or catalog.guess_format(path)
+        # every rejected row is printed, none kept in memory
+        importer = catalog.ProductImporter(batch_size=options['batch_size'], max_errors=0,
+                                           on_error=lambda line, message: self.stderr.write(f"line {line}: {message}"))
+
+        if path == '-':
+            summary = importer.run(catalog.read_rows(sys.stdin, fmt))
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as stream:
+                    summary = importer.run(catalog.read_rows(stream, fmt))
+            except OSError as exc:
+                raise CommandError(exc)
+
+        self.stdout.write(self.style.SUCCESS(f"upserted {summary['upserted']} product(s)"))
+        if summary['error_count']:
+            raise CommandError(f"{summary['error_count']} row(s) rejected.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import product_search
+
+
+class Command(BaseCommand):
+    help = "Create the product search index if needed and re-index the whole catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not product_search.install():
+            raise CommandError(f"No full text search support on {product_search.vendor}; search uses icontains.")
+        count = product_search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"indexed {count} product(s)"))
@@ -0,0 +1,51 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from purchase.models import PurchaseOrder
+from sales.models import Sales
+
+ORDER_MODELS = {
+    'sales': Sales,
+    'purchase': PurchaseOrder,
+}
+
+
+class Command(BaseCommand):
+    help = "Recompute (or verify) the stored subtotal / vat / total of Sales and PurchaseOrder from their lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(ORDER_MODELS), action='append',
+                            help="Limit to sales or purchase orders (repeatable). Default: both.")
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report orders whose stored totals are out of sync; change nothing.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        out_of_sync = 0
+        for name in options['model'] or sorted(ORDER_MODELS):
+            model = ORDER_MODELS[name]
+            if options['verify']:
+                out_of_sync += self.verify(name, model)
+            else:
+                self.recalculate(name, model, options['batch_size'])
+
+        if out_of_sync:
+            raise CommandError(f"{out_of_sync} order(s) have out of sync totals.")
+
+    def verify(self, name, model):
+        count = 0
+        for pk in model.objects.out_of_sync_totals().values_list('pk', flat=True).iterator():
+            self.stdout.write(f"{name} {pk}: stored totals out of sync")
+            count += 1
+        self.stdout.write(f"{name}: {count} out of sync")
+        return count
+
+    def recalculate(self, name, model, batch_size):
+        pks = model.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        updated = 0
+        while batch := list(islice(pks, batch_size)):
+            with transaction.atomic():
+                updated += model.objects.filter(pk__in=batch).recalculate_totals()
+        self.stdout.write(self.style.SUCCESS(f"{name}: recalculated {updated} order(s)"))
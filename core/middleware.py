@@ -0,0 +1,147 @@
+"""
+Idempotency-Key support for unsafe requests (POST, PUT, PATCH, DELETE).
+
+The first request with a given key claims it by inserting an IdempotencyKey row (a short
+autocommitted INSERT, so no lock is held while the view runs), then stores its response there.
+A retry with the same key and the same request gets the stored response replayed without the
+view running again; a concurrent duplicate gets 409 and should retry; the same key with a
+different request gets 422. Server errors (5xx) and authentication failures (401 / 403) release
+the key so the request can be retried. A replay carries the stored headers (Location, ETag, ...).
+Rows expire after IDEMPOTENCY["TTL"] seconds (see `manage.py purge_idempotency_keys`).
+"""
+import hashlib
+import tempfile
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+DEFAULTS = {
+    "HEADER": "Idempotency-Key",
+    "TTL": 24 * 3600,  # seconds a stored response is replayed
+    "LOCK_TIMEOUT": 60,  # seconds after which an unfinished claim is considered abandoned
+    "METHODS": ("POST", "PUT", "PATCH", "DELETE"),
+}
+CONF = {**DEFAULTS, **getattr(settings, "IDEMPOTENCY", {})}
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+RELEASE_STATUSES = {401, 403}
+# set per response (or by the replay itself), not part of what is replayed
+UNSTORED_HEADERS = {"content-type", "content-length", "set-cookie", "date"}
+CHUNK_SIZE = 64 * 1024
+
+
+def _scope(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    credentials = request.headers.get("Authorization", "") + request.COOKIES.get(settings.SESSION_COOKIE_NAME, "")
+    return "anon:" + hashlib.sha256(credentials.encode()).hexdigest()[:32]
+
+
+def _fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method, request.get_full_path()):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    try:
+        digest.update(request.body)
+    except RequestDataTooBig:
+        _hash_stream(request, digest)
+    return digest.hexdigest()
+
+
+def _hash_stream(request, digest):
+    """
+    Hash a body too large for request.body by reading the stream into a spooled temporary file
+    (on disk past FILE_UPLOAD_MAX_MEMORY_SIZE), which then replaces the stream for the view.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    for chunk in iter(lambda: request.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    request._stream = spool
+    # the upload parsers refuse a request whose stream was already read
+    request._read_started = False
+
+
+def _replay(record):
+    response = HttpResponse(zlib.decompress(record.body) if record.body else b"", status=record.status_code,
+                            content_type=record.content_type or None)
+    for name, value in record.headers.items():
+        response[name] = value
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+class IdempotencyMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = request.headers.get(CONF["HEADER"])
+        if key is None or request.method not in CONF["METHODS"]:
+            return self.get_response(request)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({"detail": f"{CONF['HEADER']} must be 1 to {MAX_KEY_LENGTH} characters."},
+                                status=400)
+
+        scope, fingerprint = _scope(request), _fingerprint(request)
+        record, conflict = self.claim(scope, key, fingerprint)
+        if conflict is not None:
+            return conflict
+
+        try:
+            response = self.get_response(request)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500 or response.status_code in RELEASE_STATUSES or response.streaming:
+            record.delete()
+            return response
+
+        record.status_code = response.status_code
+        record.content_type = response.get("Content-Type", "")
+        record.headers = {name: value for name, value in response.items() if name.lower() not in UNSTORED_HEADERS}
+        record.body = zlib.compress(response.content)
+        record.save(update_fields=["status_code", "content_type", "headers", "body"])
+        return response
+
+    def claim(self, scope, key, fingerprint):
+        """
+        (record, None) when this request owns the key, else (None, response to return instead).
+        """
+        now = timezone.now()
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    return IdempotencyKey.objects.create(
+                        scope=scope, key=key, fingerprint=fingerprint,
+                        expires_at=now + timedelta(seconds=CONF["TTL"]),
+                    ), None
+            except IntegrityError:
+                pass
+
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None:
+                continue  # released in the meantime
+            abandoned = record.status_code is None \
+                and record.created_at < now - timedelta(seconds=CONF["LOCK_TIMEOUT"])
+            if record.expires_at <= now or abandoned:
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+                continue
+            if record.fingerprint != fingerprint:
+                return None, JsonResponse(
+                    {"detail": f"{CONF['HEADER']} was already used for a different request."}, status=422)
+            if record.status_code is None:
+                response = JsonResponse({"detail": "A request with this key is still being processed."}, status=409)
+                response["Retry-After"] = "1"
+                return None, response
+            return None, _replay(record)
+        return None, JsonResponse({"detail": "A request with this key is still being processed."}, status=409)
@@ -81,34 +81,33 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=["sku"]),
             models.Index(fields=["name"]),
+            # /sync/ keyset pages
+            models.Index(fields=["updated_at", "id"]),
         ]
 
     def __str__(self):
         return self.name
 
-#
-# class MovementType(models.TextChoices):
-#     RECEIPT = "RECEIPT", "Receipt"
-#     ISSUE = "ISSUE", "Issue"
-#     TRANSFER = "TRANSFER", "Transfer"
-#     ADJUST = "ADJUST", "Adjust"
-#     COUNT = "COUNT", "Stocktake"
-#
-#
-# class Transfer(models.Model):
-#     from_store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='transfer_from')
-#     to_store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='transfer_to')
-#     quantity = models.PositiveIntegerField()
-#     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='transfer_product')
-#     type = models.CharField(max_length=16, choices=MovementType.choices)
-#     ref_type = models.CharField(max_length=24)  # "PO","RCPT","SO","SHIP","ADJ","XFER","COUNT"
-#     ref_id = models.UUIDField()  # links to header doc
-#     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
-#     note = models.TextField(blank=True)
-#     created_at = models.DateTimeField(auto_now_add=True)
-#
-#     class Meta:
-#         indexes = [models.Index(fields=["product", "created_at"])]
-#
-#     def __str__(self):
-#         return self.from_store.name
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response of a request sent with an Idempotency-Key header (see core.middleware).
+    status_code is null while the first request is still running.
+    """
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=64)  # user id, or a hash of the credentials
+    fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    headers = models.JSONField(default=dict, blank=True)  # replayed response headers (Location, ETag, ...)
+    body = models.BinaryField(blank=True)  # zlib-compressed response content
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="uniq_idempotency_scope_key")
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'processing'})"
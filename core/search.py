@@ -0,0 +1,261 @@
+"""
+Product search index over name, SKU, brand and category.
+
+- SQLite: an FTS5 table (prefix indexes on 2 and 3 characters) ranked with bm25,
+- PostgreSQL: a weighted tsvector table with a GIN index, ranked with ts_rank,
+- anything else: the previous icontains scan.
+
+The tables are not Django models (FTS5 tables cannot be); they are created after migrate and
+kept up to date incrementally by the Product / Category / Brand signals in core.signals.
+Paths that bypass signals (bulk_create, update) call `product_search.index(...)` themselves.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+
+from core.models import Product
+
+TABLE = 'core_product_search'
+KEY_TABLE = 'core_product_search_key'  # FTS5 rowids are integers, product ids are UUIDs
+TOKEN = re.compile(r'\w+', re.UNICODE)
+DEFAULT_LIMIT = getattr(settings, 'PRODUCT_SEARCH_LIMIT', 50)
+CHUNK = 500  # stays under SQLite's bound-parameter limit
+
+
+def tokens(query):
+    return TOKEN.findall((query or '').lower())
+
+
+def _chunks(items, size=CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ProductSearchIndex:
+    def __init__(self, using='default'):
+        self.using = using
+        self._installed = None
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    @property
+    def vendor(self):
+        return self.connection.vendor
+
+    def _db_id(self, pk):
+        return Product._meta.pk.get_db_prep_value(pk, self.connection)
+
+    @property
+    def installed(self):
+        if self._installed is None:
+            self._installed = (self.vendor in ('sqlite', 'postgresql')
+                               and TABLE in self.connection.introspection.table_names())
+        return self._installed
+
+    def install(self):
+        """
+        Create the index tables if missing (idempotent, run after every migrate).
+        Returns False when the database has no full text support; search then falls back to icontains.
+        """
+        if self.vendor == 'sqlite':
+            statements = [
+                f"CREATE TABLE IF NOT EXISTS {KEY_TABLE} (rowid INTEGER PRIMARY KEY, product_id char(32) NOT NULL UNIQUE)",
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                f"name, sku, brand, category, category_id UNINDEXED, brand_id UNINDEXED, "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            ]
+        elif self.vendor == 'postgresql':
+            statements = [
+                f"CREATE TABLE IF NOT EXISTS {TABLE} (product_id uuid PRIMARY KEY REFERENCES core_product(id) "
+                f"ON DELETE CASCADE, category_id bigint NOT NULL, brand_id bigint NOT NULL, document tsvector NOT NULL)",
+                f"CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING GIN (document)",
+            ]
+        else:
+            return False
+        try:
+            with self.connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+        except Exception:
+            # e.g. SQLite compiled without FTS5
+            self._installed = False
+            return False
+        self._installed = True
+        return True
+
+    def _rows(self, products):
+        return products.order_by().values_list('pk', 'name', 'sku', 'brand__name', 'category__name', 'category_id',
+                                               'brand_id')
+
+    def index(self, products):
+        """
+        (Re)index a Product queryset.
+        """
+        if not self.installed:
+            return
+        rows = list(self._rows(products))
+        with self.connection.cursor() as cursor:
+            for chunk in _chunks(rows):
+                if self.vendor == 'sqlite':
+                    self._index_sqlite(cursor, chunk)
+                else:
+                    self._index_postgres(cursor, chunk)
+
+    def _index_sqlite(self, cursor, rows):
+        ids = [self._db_id(row[0]) for row in rows]
+        cursor.executemany(f"INSERT OR IGNORE INTO {KEY_TABLE} (product_id) VALUES (%s)", [(pk,) for pk in ids])
+        cursor.execute(f"SELECT product_id, rowid FROM {KEY_TABLE} WHERE product_id IN ({', '.join(['%s'] * len(ids))})",
+                       ids)
+        rowids = dict(cursor.fetchall())
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(rowids[pk],) for pk in ids])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, name, sku, brand, category, category_id, brand_id) "
+            f"VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            [(rowids[pk], *row[1:]) for pk, row in zip(ids, rows)],
+        )
+
+    def _index_postgres(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (product_id, category_id, brand_id, document) VALUES (%s, %s, %s, "
+            f"setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+            f"setweight(to_tsvector('simple', %s || ' ' || %s), 'C')) "
+            f"ON CONFLICT (product_id) DO UPDATE SET category_id = EXCLUDED.category_id, "
+            f"brand_id = EXCLUDED.brand_id, document = EXCLUDED.document",
+            [(pk, category_id, brand_id, sku, name, brand, category)
+             for pk, name, sku, brand, category, category_id, brand_id in rows],
+        )
+
+    def remove(self, pks):
+        if not self.installed or self.vendor != 'sqlite':
+            # PostgreSQL rows go with the product (ON DELETE CASCADE)
+            return
+        with self.connection.cursor() as cursor:
+            for chunk in _chunks(self._db_id(pk) for pk in pks):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN "
+                               f"(SELECT rowid FROM {KEY_TABLE} WHERE product_id IN ({placeholders}))", chunk)
+                cursor.execute(f"DELETE FROM {KEY_TABLE} WHERE product_id IN ({placeholders})", chunk)
+
+    def rebuild(self, batch_size=2000):
+        """
+        Drop every entry and index the whole catalog again. Returns the number of products indexed.
+        """
+        if not self.installed:
+            return 0
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE}")
+            if self.vendor == 'sqlite':
+                cursor.execute(f"DELETE FROM {KEY_TABLE}")
+        pks = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            self.index(Product.objects.filter(pk__in=pks[start:start + batch_size]))
+        return len(pks)
+
+    def search_ids(self, query, limit=DEFAULT_LIMIT, category=None, brand=None):
+        """
+        Ids of the best `limit` products for `query`, best first. Every word is a prefix match and
+        all words must match (in any of name, SKU, brand, category); SKU hits rank above name hits.
+        """
+        words = tokens(query)
+        if not words:
+            return []
+        if not self.installed:
+            return self._search_fallback(words, limit, category, brand)
+
+        filters, params = [], []
+        if self.vendor == 'sqlite':
+            params.append(self._match(words))
+            # FTS5 needs the table name (not an alias) in MATCH and bm25()
+            sql = (f"SELECT k.product_id FROM {TABLE} JOIN {KEY_TABLE} k ON k.rowid = {TABLE}.rowid "
+                   f"WHERE {TABLE} MATCH %s")
+            order = f"bm25({TABLE}, 4.0, 10.0, 1.0, 1.0)"
+        else:
+            params.append(self._match(words))
+            sql = f"SELECT product_id FROM {TABLE} WHERE document @@ to_tsquery('simple', %s)"
+            order = "ts_rank(document, to_tsquery('simple', %s)) DESC"
+        if category is not None:
+            filters.append(f"{TABLE}.category_id = %s")
+            params.append(getattr(category, 'pk', category))
+        if brand is not None:
+            filters.append(f"{TABLE}.brand_id = %s")
+            params.append(getattr(brand, 'pk', brand))
+        if self.vendor == 'postgresql':
+            params.append(params[0])
+        params.append(limit)
+
+        sql = ' AND '.join([sql, *filters]) + f" ORDER BY {order} LIMIT %s"
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [Product._meta.pk.to_python(row[0]) for row in cursor.fetchall()]
+
+    def _match(self, words):
+        # every word is a prefix and all must match
+        if self.vendor == 'sqlite':
+            return ' '.join(f'"{word}"*' for word in words)
+        return ' & '.join(f"{word}:*" for word in words)
+
+    @staticmethod
+    def _filter_fallback(products, words, category, brand):
+        for word in words:
+            products = products.filter(Q(name__icontains=word) | Q(sku__icontains=word)
+                                       | Q(brand__name__icontains=word) | Q(category__name__icontains=word))
+        if category is not None:
+            products = products.filter(category=category)
+        if brand is not None:
+            products = products.filter(brand=brand)
+        return products.order_by('name', 'pk')
+
+    def _search_fallback(self, words, limit, category, brand):
+        return list(self._filter_fallback(Product.objects.all(), words, category, brand)
+                    .values_list('pk', flat=True)[:limit])
+
+    def search(self, query, limit=DEFAULT_LIMIT, queryset=None, **filters):
+        """
+        The best `limit` products (from `queryset`, default all) matching `query`, in rank order.
+        For the typeahead; paginated lists use ranked().
+        """
+        ids = self.search_ids(query, limit, **filters)
+        products = (Product.objects.all() if queryset is None else queryset).in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+    def ranked(self, query, queryset=None, category=None, brand=None):
+        """
+        Every product (from `queryset`, default all) matching `query`, as a queryset joined to the index,
+        annotated with `search_rank` (lower is better) and ordered by it, so it can be paginated
+        (LIMIT / OFFSET and COUNT run in the database) without losing the matches past a fixed limit.
+        """
+        products = Product.objects.all() if queryset is None else queryset
+        words = tokens(query)
+        if not words:
+            return products.none()
+        if not self.installed:
+            return self._filter_fallback(products, words, category, brand)
+
+        product_id = f"{Product._meta.db_table}.{Product._meta.pk.column}"
+        if self.vendor == 'sqlite':
+            tables = [TABLE, KEY_TABLE]
+            where = [f"{KEY_TABLE}.product_id = {product_id}", f"{TABLE}.rowid = {KEY_TABLE}.rowid",
+                     f"{TABLE} MATCH %s"]
+            rank, rank_params = f"bm25({TABLE}, 4.0, 10.0, 1.0, 1.0)", []
+        else:
+            tables = [TABLE]
+            where = [f"{TABLE}.product_id = {product_id}", f"{TABLE}.document @@ to_tsquery('simple', %s)"]
+            rank, rank_params = f"-ts_rank({TABLE}.document, to_tsquery('simple', %s))", [self._match(words)]
+        params = [self._match(words)]
+        if category is not None:
+            where.append(f"{TABLE}.category_id = %s")
+            params.append(getattr(category, 'pk', category))
+        if brand is not None:
+            where.append(f"{TABLE}.brand_id = %s")
+            params.append(getattr(brand, 'pk', brand))
+        # FTS5 tables cannot be joined through the ORM (see the module docstring)
+        return products.extra(select={'search_rank': rank}, select_params=rank_params, tables=tables,
+                              where=where, params=params).order_by('search_rank', 'pk')
+
+
+product_search = ProductSearchIndex()
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import catalog_cache
+from core.models import Product, Category, Brand, Store
+from core.search import product_search
+
+
+def install_search_index(sender, using, **kwargs):
+    # the index tables are not models, so migrate does not create them
+    if using == product_search.using:
+        product_search.install()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        product_search.index(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    product_search.remove([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def reindex_products(sender, instance, created, raw=False, **kwargs):
+    # a renamed category / brand changes the indexed text of its products
+    if not created and not raw:
+        product_search.index(instance.products.all())
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, **kwargs):
+    catalog_cache.bump(sender)
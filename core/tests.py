@@ -1,3 +1,213 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from core.middleware import IdempotencyMiddleware
+from core.models import Store, StoreUser, Category, Brand, Product
+from core.search import product_search
+from inventory.models import StockTransaction
+from purchase.models import Supplier, PurchaseOrder, PurchaseOrderLine
+from sales.models import Customer, Sales
+from user.models import User
+
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class QueryBudgetMixin:
+    """
+    Asserts that an endpoint runs a fixed number of queries, whatever the page size.
+    A count that grows with the page size means a relation is loaded per row (N+1).
+    """
+    page_sizes = (1, 25)
+
+    def assertQueryBudget(self, url, budget):
+        counts = []
+        for page_size in self.page_sizes:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(response.status_code, 200, f"{url}: {response.status_code}")
+            queries = "\n".join(query['sql'] for query in ctx.captured_queries)
+            self.assertLessEqual(len(ctx), budget,
+                                 f"{url} ran {len(ctx)} queries (budget {budget}) with page_size={page_size}:\n{queries}")
+            counts.append(len(ctx))
+        self.assertEqual(len(set(counts)), 1, f"{url}: query count depends on the page size {counts}")
+
+
+# the view's own queries: on a per-process cache the catalog cache is off (see core.cache)
+@override_settings(CACHES=LOCAL_CACHES)
+class ListEndpointQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    rows = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='budget', password='budget', role='Admin')
+        store = Store.objects.create(name='Main', creator=cls.user)
+        category = Category.objects.create(name='Grocery')
+        brand = Brand.objects.create(name='Acme')
+        products = Product.objects.bulk_create([
+            Product(sku=f'SKU-{i}', name=f'Product {i}', category=category, brand=brand, unit_price=Decimal('10'),
+                    unit_cost=Decimal('6'), tax_method='exclusive')
+            for i in range(cls.rows)
+        ])
+        StockTransaction.create_transactions([
+            dict(product=product, store=store, quantity=Decimal('100'), created_by=cls.user) for product in products
+        ])
+
+        members = User.objects.bulk_create([User(username=f'member-{i}') for i in range(cls.rows)])
+        StoreUser.objects.bulk_create([StoreUser(store=store, user=member) for member in members])
+
+        customer = Customer.objects.create(name='Walk-in', phone='0000')
+        for product in products:
+            Sales.checkout(customer=customer, store=store, created_by=cls.user,
+                           lines=[{'product': product.pk, 'quantity': Decimal('1')}],
+                           payments=[{'amount': Decimal('10'), 'method': 'Cash'}])
+
+        supplier = Supplier.objects.create(name='Wholesale')
+        for product in products:
+            order = PurchaseOrder.objects.create(supplier=supplier, store=store)
+            PurchaseOrderLine.objects.create(purchase=order, product=product, quantity=1, unit_price=Decimal('6'))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_list_endpoints_have_fixed_query_budget(self):
+        # page-number lists: COUNT + page; cursor-paginated lists: page only
+        budgets = {
+            '/v1/api/store/': 2,
+            '/v1/api/store-user/': 2,
+            '/v1/api/category/': 2,
+            '/v1/api/brand/': 2,
+            '/v1/api/product/': 2,
+            '/v1/api/customer/': 2,
+            '/v1/api/sales/': 1,
+            '/v1/api/sales_item/': 2,
+            '/v1/api/transaction/': 1,
+            '/v1/api/supplier/': 2,
+            '/v1/api/purchase/': 2,
+            '/v1/api/inventory/': 2,
+            '/v1/api/stock-transactions/': 1,
+            '/v1/api/auth/user/': 0,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                self.assertQueryBudget(url, budget)
+
+
+class ProductSearchTests(APITestCase):
+    matches = 60  # more than PRODUCT_SEARCH_LIMIT
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='search', password='search', role='Admin')
+        cls.category = Category.objects.create(name='Hardware')
+        brand = Brand.objects.create(name='Acme')
+        products = Product.objects.bulk_create([
+            Product(sku=f'W-{i}', name=f'Widget {i}', category=cls.category, brand=brand, unit_price=Decimal('1'),
+                    unit_cost=Decimal('1'), tax_method='exclusive')
+            for i in range(cls.matches)
+        ] + [
+            Product(sku='WIDGET', name='Gadget', category=cls.category, brand=brand, unit_price=Decimal('1'),
+                    unit_cost=Decimal('1'), tax_method='exclusive'),
+            Product(sku='G-1', name='Gizmo', category=cls.category, brand=brand, unit_price=Decimal('1'),
+                    unit_cost=Decimal('1'), tax_method='exclusive'),
+        ])
+        product_search.index(Product.objects.filter(pk__in=[product.pk for product in products]))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            page = self.client.get(url).json()
+            self.assertEqual(page['count'], self.matches + 1)
+            ids += [row['id'] for row in page['results']]
+            url = page['next']
+        return ids
+
+    def test_paginated_search_returns_every_match_in_rank_order(self):
+        ids = self.collect('/v1/api/product/?search=widget&page_size=25')
+        self.assertEqual(len(ids), self.matches + 1)
+        self.assertEqual(len(set(ids)), len(ids))
+        # a SKU hit ranks above name hits
+        self.assertEqual(ids[0], str(Product.objects.get(sku='WIDGET').pk))
+
+    def test_category_products_search_is_not_capped(self):
+        ids = self.collect(f'/v1/api/category/{self.category.pk}/product/?search=widget&page_size=25')
+        self.assertEqual(len(set(ids)), self.matches + 1)
+
+    def test_typeahead_keeps_its_limit(self):
+        response = self.client.get('/v1/api/product/search/', {'q': 'widget', 'limit': 10})
+        self.assertEqual(len(response.json()), 10)
+
+
+class CatalogCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cache', password='cache', role='Admin')
+        Category.objects.create(name='Grocery')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_write_invalidates_the_shared_cache(self):
+        etag = self.client.get('/v1/api/category/')['ETag']
+        self.assertEqual(self.client.get('/v1/api/category/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Hardware')
+        response = self.client.get('/v1/api/category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_per_process_cache_is_not_used(self):
+        response = self.client.get('/v1/api/category/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class IdempotencyMiddlewareTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def view(request):
+            self.calls.append(request.read())
+            response = JsonResponse({'call': len(self.calls)}, status=201)
+            response['Location'] = f'/orders/{len(self.calls)}/'
+            response['ETag'] = '"v1"'
+            return response
+
+        self.middleware = IdempotencyMiddleware(view)
+
+    def post(self, body, key='key-1'):
+        request = RequestFactory().post('/orders/', data=body, content_type='application/octet-stream',
+                                        headers={'Idempotency-Key': key})
+        return self.middleware(request)
+
+    def test_replay_returns_the_stored_response_and_headers(self):
+        first = self.post(b'{"total": 1}')
+        replayed = self.post(b'{"total": 1}')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual((replayed.status_code, replayed.content), (201, first.content))
+        self.assertEqual(replayed['Location'], '/orders/1/')
+        self.assertEqual(replayed['ETag'], '"v1"')
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+
+    def test_same_key_with_a_different_body_is_rejected(self):
+        self.post(b'{"total": 1}')
+        self.assertEqual(self.post(b'{"total": 2}').status_code, 422)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=16)
+    def test_large_bodies_are_fingerprinted_by_content(self):
+        first, second = b'a' * 100, b'b' * 100
+        self.assertEqual(self.post(first).status_code, 201)
+        # the view still reads the whole body after it was hashed
+        self.assertEqual(self.calls, [first])
+        self.assertEqual(self.post(second).status_code, 422)
+        self.assertEqual(self.post(first)['Idempotent-Replayed'], 'true')
@@ -1,3 +1,4 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import redirect
 from django.views import View
 from drf_spectacular.types import OpenApiTypes
@@ -8,6 +9,9 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from core import catalog
+from core.cache import CatalogCacheMixin, cached_response
+from core.search import product_search
 from core.models import Store, Category, Brand, Product, StoreUser
 from core.serializer import StoreSerializer, CategorySerializer, BrandSerializer, ProductSerializer, \
     StoreUserViewSerializer, StoreUserSerializer
@@ -20,7 +24,7 @@ class IndexView(View):
 
 
 @extend_schema(tags=['Store'])
-class StoreAPIView(ModelViewSet):
+class StoreAPIView(CatalogCacheMixin, ModelViewSet):
     queryset = Store.objects.all()
     serializer_class = StoreSerializer
 
@@ -30,7 +34,8 @@ class StoreAPIView(ModelViewSet):
 
 @extend_schema(tags=['Store User'])
 class StoreUserAPIView(ModelViewSet):
-    queryset = StoreUser.objects.all()
+    # list/retrieve nest the store and the user
+    queryset = StoreUser.objects.select_related('store', 'user').all()
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
@@ -39,7 +44,7 @@ class StoreUserAPIView(ModelViewSet):
 
 
 @extend_schema(tags=['Category'])
-class CategoryAPIView(ModelViewSet):
+class CategoryAPIView(CatalogCacheMixin, ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     parser_classes = (MultiPartParser, FormParser)
@@ -48,7 +53,7 @@ class CategoryAPIView(ModelViewSet):
         tags=['Category'],
         parameters=[
             OpenApiParameter(name="search", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
-                             description="Filter products by name", required=False),
+                             description="Ranked search on name, SKU, brand and category", required=False),
         ],
         responses=ProductSerializer(many=True),
     )
@@ -58,7 +63,7 @@ class CategoryAPIView(ModelViewSet):
         queryset = cat.products.all()
         search = request.query_params.get('search')
         if search:
-            queryset = queryset.filter(name__icontains=search)
+            queryset = product_search.ranked(search, queryset=queryset, category=cat)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = ProductSerializer(page, many=True)
@@ -70,7 +75,7 @@ class CategoryAPIView(ModelViewSet):
 
 @extend_schema(tags=['Brand'],
                request={'multipart/form-data': BrandSerializer})
-class BrandAPIView(ModelViewSet):
+class BrandAPIView(CatalogCacheMixin, ModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     parser_classes = [MultiPartParser, FormParser]
@@ -79,7 +84,7 @@ class BrandAPIView(ModelViewSet):
         tags=['Brand'],
         parameters=[
             OpenApiParameter(name="search", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
-                             description="Filter products by name", required=False),
+                             description="Ranked search on name, SKU, brand and category", required=False),
         ],
         responses=ProductSerializer(many=True),
     )
@@ -89,7 +94,7 @@ class BrandAPIView(ModelViewSet):
         queryset = cat.products.all()
         search = request.query_params.get('search')
         if search:
-            queryset = queryset.filter(name__icontains=search)
+            queryset = product_search.ranked(search, queryset=queryset, brand=cat)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = ProductSerializer(page, many=True)
@@ -100,7 +105,7 @@ class BrandAPIView(ModelViewSet):
 
 
 @extend_schema(tags=['Products'])
-class ProductAPIView(ModelViewSet):
+class ProductAPIView(CatalogCacheMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     parser_classes = [MultiPartParser, FormParser]
@@ -109,18 +114,91 @@ class ProductAPIView(ModelViewSet):
     @extend_schema(
         parameters=[
             OpenApiParameter(name="search", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
-                             description="Filter products by name", required=False),
+                             description="Ranked search on name, SKU, brand and category", required=False),
         ],
         responses=ProductSerializer(many=True),
     )
+    @cached_response
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset();
         if request.query_params.get('search'):
-            queryset = queryset.filter(name__icontains=request.query_params.get('search'))
+            queryset = product_search.ranked(request.query_params.get('search'), queryset=queryset)
 
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = ProductSerializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        return Response(ProductSerializer(queryset, many=True).data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(ProductSerializer(queryset, many=True).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name="q", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name="limit", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             description="Number of results (default 20, max 100)", required=False),
+        ],
+        responses=ProductSerializer(many=True),
+    )
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Best matches first for the POS search box: every word is a prefix of the name, SKU, brand or category.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({'limit': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        products = product_search.search(request.query_params.get('q', ''), limit=limit)
+        return Response(ProductSerializer(products, many=True).data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        request={'multipart/form-data': {'type': 'object', 'properties': {'file': {'type': 'string', 'format': 'binary'}}}},
+        parameters=[
+            OpenApiParameter(name="file_type", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             enum=catalog.FORMATS, description="csv or jsonl (default: from the file name)",
+                             required=False),
+            OpenApiParameter(name="batch_size", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             required=False),
+        ],
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_catalog(self, request):
+        """
+        Upsert products by SKU from a CSV / JSONL upload. Bad rows are reported, not fatal.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('file_type') or catalog.guess_format(upload.name)
+        if fmt not in catalog.FORMATS:
+            return Response({'file_type': [f'Must be one of {", ".join(catalog.FORMATS)}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            batch_size = min(max(int(request.query_params.get('batch_size', 1000)), 1), 5000)
+        except ValueError:
+            return Response({'batch_size': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        summary = catalog.ProductImporter(batch_size=batch_size).run(catalog.read_rows(upload, fmt))
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name="file_type", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             enum=catalog.FORMATS, required=False),
+        ],
+        responses={(200, 'text/csv'): OpenApiTypes.STR},
+    )
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_catalog(self, request):
+        """
+        The whole catalog as CSV / JSONL, streamed (not paginated).
+        """
+        fmt = request.query_params.get('file_type', 'csv')
+        if fmt not in catalog.FORMATS:
+            return Response({'file_type': [f'Must be one of {", ".join(catalog.FORMATS)}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(catalog.export_lines(fmt), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
@@ -1,7 +1,80 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Inventory, StockTransaction
+from .models import Inventory, StockTransaction, StockSnapshot, SyncTombstone, StockAlert, Transfer, TransferLine, \
+    Stocktake, StocktakeLine, StocktakeCount
 
-admin.site.register(Inventory)
-admin.site.register(StockTransaction)
\ No newline at end of file
+
+@admin.register(Inventory)
+class InventoryAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'store', 'quantity', 'stock_alert', 'is_active', 'updated_at')
+    list_select_related = ('product', 'store')
+    list_filter = ('is_active',)
+    search_fields = ('product__sku', 'product__name')
+    raw_id_fields = ('product', 'store')
+
+
+@admin.register(StockTransaction)
+class StockTransactionAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'movement_type', 'reference_type', 'balance_after', 'created_by', 'created_at')
+    list_select_related = ('product', 'store', 'created_by')
+    list_filter = ('movement_type',)
+    search_fields = ('product__sku', 'reference_type')
+    raw_id_fields = ('product', 'store', 'created_by')
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('product', 'store', 'period', 'taken_at', 'quantity')
+    list_select_related = ('product', 'store')
+    list_filter = ('period',)
+    raw_id_fields = ('product', 'store')
+
+
+@admin.register(SyncTombstone)
+class SyncTombstoneAdmin(admin.ModelAdmin):
+    list_display = ('table', 'object_id', 'store_id', 'deleted_at')
+    list_filter = ('table',)
+
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'store', 'threshold', 'quantity', 'created_at', 'resolved_at')
+    list_select_related = ('store',)
+    search_fields = ('product__sku', 'product__name')
+    raw_id_fields = ('inventory', 'product', 'store', 'opened_by', 'resolved_by')
+
+
+class TransferLineInline(admin.TabularInline):
+    model = TransferLine
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(Transfer)
+class TransferAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'from_store', 'to_store', 'status', 'created_at', 'dispatched_at', 'received_at')
+    list_select_related = ('from_store', 'to_store')
+    list_filter = ('status',)
+    raw_id_fields = ('from_store', 'to_store', 'created_by')
+    inlines = (TransferLineInline,)
+
+
+@admin.register(Stocktake)
+class StocktakeAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'store', 'status', 'started_at', 'posted_at')
+    list_select_related = ('store',)
+    list_filter = ('status',)
+    raw_id_fields = ('store', 'created_by')
+
+
+@admin.register(StocktakeLine)
+class StocktakeLineAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'stocktake', 'frozen_quantity', 'counted_quantity', 'posted_variance')
+    raw_id_fields = ('stocktake', 'product')
+
+
+@admin.register(StocktakeCount)
+class StocktakeCountAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'stocktake', 'device', 'created_at')
+    raw_id_fields = ('stocktake', 'product')
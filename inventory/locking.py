@@ -0,0 +1,147 @@
+"""
+Central lock manager for Inventory rows.
+
+Every code path that changes stock (ledger posting, receipts, shipments, ...) takes its
+Inventory row locks through here so that the locks are always acquired in the same
+(store, product) order. Two documents touching the same products can then only queue
+behind each other, never deadlock.
+
+Failures the database reports as deadlocks / serialization conflicts are retried with a
+bounded, jittered exponential backoff, and the time spent waiting for row locks is logged
+and accumulated so contention can be observed.
+"""
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MAX_RETRIES": 3,
+    "BACKOFF_BASE": 0.05,  # seconds
+    "BACKOFF_MAX": 1.0,  # seconds
+    "WAIT_WARNING": 0.5,  # log a warning when a single lock acquisition waits longer (seconds)
+}
+
+# PostgreSQL SQLSTATEs: serialization_failure, deadlock_detected, lock_not_available
+RETRYABLE_SQLSTATES = {"40001", "40P01", "55P03"}
+# MySQL: lock wait timeout, deadlock
+RETRYABLE_MYSQL_CODES = {1205, 1213}
+
+
+def is_retryable(exc):
+    """
+    True if the database error means "try the whole transaction again".
+    """
+    if not isinstance(exc, OperationalError):
+        return False
+    cause = exc.__cause__
+    sqlstate = getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return True
+    if cause is not None and getattr(cause, "args", None) and cause.args[0] in RETRYABLE_MYSQL_CODES:
+        return True
+    message = str(exc).lower()
+    return "deadlock" in message or "database is locked" in message or "could not serialize" in message
+
+
+class InventoryLockManager:
+    def __init__(self, **options):
+        conf = {**DEFAULTS, **getattr(settings, "INVENTORY_LOCKS", {}), **options}
+        self.max_retries = conf["MAX_RETRIES"]
+        self.backoff_base = conf["BACKOFF_BASE"]
+        self.backoff_max = conf["BACKOFF_MAX"]
+        self.wait_warning = conf["WAIT_WARNING"]
+        self._stats_lock = threading.Lock()
+        self._stats = {"acquisitions": 0, "rows_locked": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+                       "retries": 0}
+
+    def lock(self, keys):
+        """
+        select_for_update the Inventory rows for the given (product_id, store_id) keys in one query,
+        always in (store, product) order.
+        Returns a dict of Inventory rows keyed by (product_id, store_id); keys without a row are absent.
+        """
+        from inventory.models import Inventory
+
+        by_store = {}
+        for product_id, store_id in keys:
+            by_store.setdefault(store_id, set()).add(product_id)
+        if not by_store:
+            return {}
+
+        condition = Q()
+        for store_id in sorted(by_store, key=str):
+            condition |= Q(store_id=store_id, product_id__in=sorted(by_store[store_id], key=str))
+
+        qs = Inventory.objects.select_for_update().filter(condition).order_by("store_id", "product_id")
+        started = time.monotonic()
+        rows = {(inv.product_id, inv.store_id): inv for inv in qs}
+        self._record_wait(time.monotonic() - started, len(rows))
+        return rows
+
+    def _record_wait(self, waited, rows):
+        with self._stats_lock:
+            self._stats["acquisitions"] += 1
+            self._stats["rows_locked"] += rows
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        if waited >= self.wait_warning:
+            logger.warning("Waited %.3fs for %d inventory row locks", waited, rows)
+        else:
+            logger.debug("Waited %.3fs for %d inventory row locks", waited, rows)
+
+    def stats(self):
+        """
+        Snapshot of the lock counters collected by this process.
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def backoff(self, attempt):
+        # "full jitter": a random delay up to the capped exponential step
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def run(self, func, *args, **kwargs):
+        """
+        Call func, retrying it when the database reports a deadlock / serialization failure.
+        Retrying is only possible when func owns the whole transaction, so inside an existing
+        atomic block the error is left to the outermost caller.
+        """
+        if connection.in_atomic_block:
+            return func(*args, **kwargs)
+
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt >= self.max_retries or not is_retryable(exc):
+                    raise
+                delay = self.backoff(attempt)
+                attempt += 1
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                logger.warning("Inventory transaction conflict (%s), retry %d/%d in %.3fs",
+                               exc, attempt, self.max_retries, delay)
+                time.sleep(delay)
+
+    def retrying(self, func):
+        """
+        Decorator form of run().
+        """
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func, *args, **kwargs)
+
+        return wrapper
+
+
+inventory_locks = InventoryLockManager()
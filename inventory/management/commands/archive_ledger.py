@@ -0,0 +1,50 @@
+import gzip
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from inventory.models import StockSnapshot, StockTransaction, StockTransactionArchive
+
+ARCHIVE_FIELDS = [field.attname for field in StockTransactionArchive._meta.concrete_fields if field.name != 'archived_at']
+
+
+class Command(BaseCommand):
+    help = ("Move StockTransaction rows older than a snapshot boundary out of the hot ledger, "
+            "into StockTransactionArchive or a gzipped JSONL file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True,
+                            help="Snapshot boundary (StockSnapshot.taken_at, ISO format); older rows are archived.")
+        parser.add_argument('--to-file', help="Write the rows to this .jsonl.gz file instead of the archive table.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        snapshots = StockSnapshot.objects.filter(taken_at=options['before'])
+        boundary = snapshots.values_list('taken_at', flat=True).first()
+        if boundary is None:
+            raise CommandError(f"No snapshot taken at {options['before']}; run snapshot_inventory first.")
+
+        out = gzip.open(options['to_file'], 'at', encoding='utf-8') if options['to_file'] else None
+        archived = 0
+        try:
+            while True:
+                with transaction.atomic():
+                    rows = list(StockTransaction.objects.filter(created_at__lt=boundary)
+                                .order_by('created_at').values(*ARCHIVE_FIELDS)[:options['batch_size']])
+                    if not rows:
+                        break
+                    if out is not None:
+                        out.writelines(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows)
+                    else:
+                        StockTransactionArchive.objects.bulk_create(
+                            [StockTransactionArchive(**row) for row in rows], ignore_conflicts=True)
+                    StockTransaction.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+                archived += len(rows)
+                self.stdout.write(f"archived {archived} row(s)")
+        finally:
+            if out is not None:
+                out.close()
+
+        self.stdout.write(self.style.SUCCESS(f"{archived} ledger row(s) older than {boundary} archived"))
@@ -0,0 +1,86 @@
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.models import Product, Store
+from inventory.reconciliation import DRIFT_FIELDS, find_drift, repair_drift
+
+
+def _init_worker():
+    # forked workers must not share the parent's database connections; spawned ones need Django set up
+    django.setup()
+    for conn in connections.all(initialized_only=True):
+        conn.close()
+
+
+class Command(BaseCommand):
+    help = ("Verify Inventory.quantity against the stock ledger (snapshot + movements, last balance_after) "
+            "and stream a CSV drift report. Partitions run in a process pool.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partition', choices=['store', 'product'], default='store',
+                            help="Split the work per store, or into product id ranges.")
+        parser.add_argument('--chunks', type=int, default=64, help="Number of product ranges (--partition product).")
+        parser.add_argument('--store', action='append', help="Only reconcile these store ids (repeatable).")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes; 1 runs inline.")
+        parser.add_argument('--repair', action='store_true',
+                            help="Post ADJUST transactions so the ledger matches Inventory.quantity.")
+        parser.add_argument('--user', help="Username recorded as creator of repair transactions.")
+
+    def handle(self, *args, **options):
+        created_by = None
+        if options['repair']:
+            if not options['user']:
+                raise CommandError("--repair needs --user.")
+            created_by = get_user_model().objects.get(username=options['user'])
+
+        partitions = self.partitions(options)
+        writer = csv.writer(self.stdout)
+        writer.writerow(DRIFT_FIELDS + ('delta',))
+
+        drifted = []
+        for rows in self.run(partitions, options['workers']):
+            for product_id, store_id, quantity, expected, last_balance in rows:
+                writer.writerow((product_id, store_id, quantity, expected, last_balance, quantity - expected))
+                drifted.append((product_id, store_id))
+
+        if created_by is not None and drifted:
+            repaired, restated = repair_drift(drifted, created_by)
+            self.stderr.write(f"posted {len(repaired)} ADJUST transaction(s), "
+                              f"restated {len(restated)} balance_after value(s)")
+        self.stderr.write(f"{len(drifted)} drifted inventory row(s) in {len(partitions)} partition(s)")
+
+    def partitions(self, options):
+        stores = options['store'] or list(Store.objects.values_list('pk', flat=True))
+        if options['partition'] == 'store':
+            return [{'store_id': store} for store in stores]
+
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        size = max(1, -(-len(product_ids) // max(1, options['chunks'])))
+        return [
+            {'store_id__in': stores, 'product_id__gte': chunk[0], 'product_id__lte': chunk[-1]}
+            for chunk in (product_ids[i:i + size] for i in range(0, len(product_ids), size))
+        ]
+
+    def run(self, partitions, workers):
+        """
+        Yield each partition's drift rows as soon as it finishes.
+        """
+        if workers <= 1 or len(partitions) <= 1:
+            for partition in partitions:
+                yield find_drift(partition)
+            return
+
+        connections.close_all()
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+            futures = [pool.submit(find_drift, partition) for partition in partitions]
+            for future in as_completed(futures):
+                yield future.result()
@@ -0,0 +1,33 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.models import StockSnapshot, SnapshotPeriod
+
+
+def period_boundary(period, day):
+    """
+    Start of the period containing `day` (local midnight), i.e. the moment the previous period closed.
+    """
+    if period == SnapshotPeriod.MONTHLY:
+        day = day.replace(day=1)
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+class Command(BaseCommand):
+    help = "Write per-(product, store) closing balances at a period boundary into StockSnapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=[choice.lower() for choice in SnapshotPeriod.values], default='daily')
+        parser.add_argument('--date', type=datetime.fromisoformat,
+                            help="Any day inside the period to close at its start (default: today).")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        period = SnapshotPeriod(options['period'].upper())
+        day = options['date'].date() if options['date'] else timezone.localdate()
+        taken_at = period_boundary(period, day)
+
+        written = StockSnapshot.objects.take(taken_at, period, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{written} {period.label.lower()} snapshot(s) taken at {taken_at}"))
@@ -1,13 +1,19 @@
+import bisect
 import uuid
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import F, Q, Case, Max, OuterRef, Subquery, When
+from django.db.models.functions import TruncDate, Coalesce
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 from core.models import Product, Store
+from inventory.locking import inventory_locks
+from inventory.scan import scan_cache
 
 
 # Create your models here.
@@ -20,6 +26,57 @@ class MovementType(models.TextChoices):
     COUNT = "COUNT", "Stocktake"
 
 
+class InventoryQuerySet(models.QuerySet):
+    def seed(self, store, products, batch_size=1000, **defaults):
+        """
+        Create the Inventory rows `store` is missing for `products` (a Product queryset),
+        with `defaults` (stock_alert, discount_method, ...), in chunked bulk inserts.
+        Returns the number of rows created.
+        """
+        existing = Inventory.objects.filter(store=store).values('product')
+        missing = list(products.exclude(pk__in=existing).order_by().values_list('pk', flat=True))
+        defaults.setdefault('discount_method', 'percentage')
+        for start in range(0, len(missing), batch_size):
+            Inventory.objects.bulk_create(
+                [Inventory(product_id=pk, store=store, **defaults) for pk in missing[start:start + batch_size]],
+                ignore_conflicts=True,
+            )
+        scan_cache.clear()
+        return len(missing)
+
+    def validate_bulk_set(self, values):
+        """
+        Check inventory_discount_rate_bounds for an UPDATE of `values` over this queryset before running it,
+        so one bad row cannot fail the whole statement with an IntegrityError.
+        """
+        method, rate = values.get('discount_method'), values.get('discount_rate')
+        if method == 'percentage':
+            if rate is not None and rate > 100:
+                raise ValidationError("A percentage discount_rate must be between 0 and 100.")
+            if rate is None and self.filter(discount_rate__gt=100).exists():
+                raise ValidationError("Some rows have a discount_rate above 100; set discount_rate as well.")
+        elif method is None and rate is not None and rate > 100 \
+                and self.filter(discount_method='percentage').exists():
+            raise ValidationError("discount_rate above 100 on rows with a percentage discount.")
+
+    def bulk_set(self, **values):
+        """
+        Set-based update of stock_alert / discount_method / discount_rate / is_active in a single UPDATE.
+        Returns the number of rows updated.
+        """
+        self.validate_bulk_set(values)
+        # update() bypasses auto_now and post_save
+        updated = self.update(updated_at=timezone.now(), **values)
+        scan_cache.clear()
+        return updated
+
+    def low_stock(self):
+        """
+        Active rows at or below their (non-zero) stock_alert; served by the inventory_low_stock partial index.
+        """
+        return self.filter(is_active=True, stock_alert__gt=0, quantity__lte=F("stock_alert"))
+
+
 class Inventory(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='inventories')
@@ -33,6 +90,8 @@ class Inventory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = InventoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Inventory"
         verbose_name_plural = "Inventory"
@@ -54,11 +113,23 @@ class Inventory(models.Model):
             models.Index(fields=["product", "store"]),
             models.Index(fields=["updated_at"]),
             models.Index(fields=["is_active"]),
+            # /sync/ keyset pages per store
+            models.Index(fields=["store", "updated_at", "id"]),
+            # /inventory/low-stock/: only the rows currently low are in the index
+            models.Index(fields=["store", "product"], name="inventory_low_stock",
+                         condition=Q(is_active=True, stock_alert__gt=0, quantity__lte=F("stock_alert"))),
         ]
 
     def __str__(self):
         return self.product.name
 
+    def is_low(self, quantity=None):
+        """
+        Whether `quantity` (default: the row's quantity) is at or below stock_alert; 0 disables the alert.
+        """
+        quantity = self.quantity if quantity is None else quantity
+        return self.is_active and self.stock_alert > 0 and quantity <= self.stock_alert
+
     def adjust_quantity(self, delta, created_by, movement_type=MovementType.ADJUST, ref_type=None, ref_id=None,
                         note=""):
         """
@@ -78,12 +149,99 @@ class Inventory(models.Model):
         )
 
 
+class StockTransactionQuerySet(models.QuerySet):
+    """
+    Point-in-time reads over the ledger. Every movement caches balance_after, so the stock at
+    any moment is the balance_after of the last movement before it: one seek on the
+    (product, store, created_at) index instead of summing the history. Movements moved out by
+    archive_ledger are read from StockTransactionArchive, or from the snapshots when they went to a file.
+    """
+
+    def _before(self, store, at):
+        return self.filter(store=store, created_at__lte=at).order_by('-created_at')
+
+    @staticmethod
+    def _archived(store, at):
+        return StockTransactionArchive.objects.filter(store=store, created_at__lte=at).order_by('-created_at')
+
+    @staticmethod
+    def _snapshots(store, at):
+        return StockSnapshot.objects.filter(store=store, taken_at__lte=at).order_by('-taken_at')
+
+    def balance_at(self, product, store, at):
+        balance = self._before(store, at).filter(product=product).values_list('balance_after', flat=True).first()
+        if balance is not None:
+            return balance
+        # no movement left in the hot ledger (never moved, or archived): the newer of the last archived
+        # movement and the nearest snapshot (which only includes movements strictly before taken_at)
+        archived = self._archived(store, at).filter(product=product).values_list('created_at', 'balance_after').first()
+        snapshot = self._snapshots(store, at).filter(product=product).values_list('taken_at', 'quantity').first()
+        if archived is not None and (snapshot is None or archived[0] >= snapshot[0]):
+            return archived[1]
+        return snapshot[1] if snapshot is not None else Decimal('0')
+
+    def balances_at(self, products, store, at):
+        """
+        Bulk balance_at: {product_id: balance} for many products, one correlated seek per product in one query.
+        """
+        last = self._before(store, at).filter(product=OuterRef('pk')).values('balance_after')[:1]
+        archived = self._archived(store, at).filter(product=OuterRef('pk'))
+        snapshot = self._snapshots(store, at).filter(product=OuterRef('pk'))
+        rows = Product.objects.filter(pk__in=products).alias(
+            archived_at=Subquery(archived.values('created_at')[:1]),
+            snapshot_at=Subquery(snapshot.values('taken_at')[:1]),
+        ).annotate(balance=Coalesce(
+            Subquery(last),
+            Case(When(Q(snapshot_at__isnull=True) | Q(archived_at__gte=F('snapshot_at')),
+                      then=Subquery(archived.values('balance_after')[:1])),
+                 default=Subquery(snapshot.values('quantity')[:1])),
+        )).values_list('pk', 'balance')
+        return {pk: balance if balance is not None else Decimal('0') for pk, balance in rows}
+
+    def daily_balances(self, product, store, start, end):
+        """
+        Closing balance of every day from start to end (dates, inclusive), carried forward over
+        days without movements. Only the last movement of each active day is read, from the hot
+        ledger and the archive; snapshots taken inside the range close the day before them.
+        """
+        tz = timezone.get_current_timezone()
+        start_at = timezone.make_aware(datetime.combine(start, time.min), tz)
+        end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+
+        def close(day, at, balance):
+            if day not in closing or closing[day][0] <= at:
+                closing[day] = (at, balance)
+
+        opening = self.balance_at(product, store, start_at - timedelta(microseconds=1))
+        closing = {}
+        snapshots = StockSnapshot.objects.filter(product=product, store=store, taken_at__gt=start_at,
+                                                 taken_at__lte=end_at)
+        for taken_at, quantity in snapshots.values_list('taken_at', 'quantity'):
+            at = taken_at - timedelta(microseconds=1)
+            close(timezone.localtime(at, tz).date(), at, quantity)
+        for ledger in (StockTransactionArchive.objects.all(), self):
+            movements = ledger.filter(product=product, store=store, created_at__gte=start_at, created_at__lt=end_at)
+            last_of_day = movements.order_by().annotate(day=TruncDate('created_at', tzinfo=tz)).values('day') \
+                .annotate(last_at=Max('created_at')).values('last_at')
+            for created_at, balance in movements.filter(created_at__in=Subquery(last_of_day)) \
+                    .values_list('created_at', 'balance_after'):
+                close(timezone.localtime(created_at, tz).date(), created_at, balance)
+
+        series, balance, day = [], opening, start
+        while day <= end:
+            balance = closing[day][1] if day in closing else balance
+            series.append((day, balance))
+            day += timedelta(days=1)
+        return series
+
+
 class StockTransaction(models.Model):
     """
     Immutable ledger of stock movements. Every inventory change must create one.
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # set explicitly only for movements posted after the fact (offline sales, see create_transactions)
+    created_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
     product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='stock_transactions')
     store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name='stock_transactions')
     quantity = models.DecimalField(max_digits=18, decimal_places=6)  # positive for IN, negative for OUT convention
@@ -97,30 +255,26 @@ class StockTransaction(models.Model):
     balance_after = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True,
                                         help_text="Inventory balance after this transaction (cached)")
 
+    objects = StockTransactionQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["product", "store", "created_at"]),
             models.Index(fields=["reference_type", "reference_id"]),
+            # keyset pagination (LedgerCursorPagination)
+            models.Index(fields=["created_at", "id"]),
         ]
-        # Prevent duplicate external refs; multiple NULLs allowed in PostgreSQL
+        # Prevent posting the same external ref twice for a product/store; multiple NULLs allowed in PostgreSQL.
+        # A multi-line document (sale, receipt, shipment) posts one movement per product.
         constraints = [
-            models.UniqueConstraint(fields=["reference_type", "reference_id"], name="uniq_stock_reference_pair"),
+            models.UniqueConstraint(fields=["reference_type", "reference_id", "product", "store"],
+                                    name="uniq_stock_reference_product_store"),
         ]
 
     def __str__(self):
         return f"{self.product.sku} {self.quantity} ({self.get_movement_type_display()}) @ {self.store.name}"
 
-    @staticmethod
-    def _get_inventory_row(product, store, for_update=True):
-        """
-        Helper to obtain Inventory row with or without select_for_update.
-        """
-        qs = Inventory.objects.filter(product=product, store=store)
-        if for_update:
-            return qs.select_for_update().first()
-        return qs.first()
-
     @staticmethod
     def _validate_movement_sign(movement_type, quantity):
         """
@@ -141,32 +295,678 @@ class StockTransaction(models.Model):
         Atomic creation of a StockTransaction + update Inventory.quantity (cached).
         Positive quantity = increase stock, negative = decrease stock.
         """
-        qty = Decimal(quantity)
-        cls._validate_movement_sign(movement_type, qty)
+        return cls.create_transactions([dict(
+            product=product,
+            store=store,
+            quantity=quantity,
+            created_by=created_by,
+            unit_cost=unit_cost,
+            movement_type=movement_type,
+            reference_type=reference_type,
+            reference_id=reference_id,
+            note=note,
+        )])[0]
+
+    @classmethod
+    @inventory_locks.retrying
+    def create_transactions(cls, lines):
+        """
+        Batched version of create_transaction for multi-line documents (receipts, shipments, ...).
+        `lines` is a list of dicts accepting the same keyword arguments as create_transaction.
+
+        All affected Inventory rows are locked in one query (in the lock manager's (store, product) order,
+        retried on deadlocks when called outside a transaction; rows a first movement needs are inserted
+        and the lock taken again), every balance is checked in memory,
+        then the ledger rows are written with bulk_create and the cached quantities with one upsert,
+        so the number of queries does not grow with the number of lines.
+        Lines touching the same product/store are applied in the given order.
+        A line may carry a past `created_at` (a sale the till made offline): the movement is then
+        dated when it happened and the later balances are restated (see _restate).
+        Returns the created StockTransactions in input order.
+        """
+        lines = list(lines)
+        if not lines:
+            return []
+
+        now = timezone.now()
+        for line in lines:
+            cls._validate_movement_sign(line.get("movement_type", MovementType.RECEIPT), line["quantity"])
+            if line.get("created_at") is not None and line["created_at"] > now:
+                raise ValidationError("A stock movement cannot be dated in the future.")
 
         with transaction.atomic():
-            inv = cls._get_inventory_row(product, store, for_update=True)
-            if not inv:
-                inv = Inventory.objects.create(product=product, store=store, quantity=Decimal("0"))
-
-            new_balance = (inv.quantity or Decimal("0")) + qty
-            if new_balance < 0:
-                raise ValidationError("Insufficient stock to perform transaction.")
-
-            tx = cls.objects.create(
-                product=product,
-                store=store,
-                quantity=qty,
-                unit_cost=unit_cost,
-                movement_type=movement_type,
-                reference_type=reference_type,
-                reference_id=reference_id,
-                created_by=created_by,
-                note=note,
-                balance_after=new_balance,
-            )
+            keys = {(line["product"].pk, line["store"].pk) for line in lines}
+            inventories = inventory_locks.lock(keys)
+            missing = sorted((key for key in keys if key not in inventories), key=lambda key: (key[1], key[0]))
+            if missing:
+                # a first movement: insert the row at 0 (a concurrent first posting's row is kept) and lock
+                # it like the others, so both postings queue on it instead of both starting from 0;
+                # 0% discount keeps it inside inventory_discount_rate_bounds
+                Inventory.objects.bulk_create([
+                    Inventory(product_id=product_id, store_id=store_id, quantity=Decimal("0"),
+                              discount_method="percentage")
+                    for product_id, store_id in missing
+                ], ignore_conflicts=True)
+                inventories = inventory_locks.lock(keys)
+
+            before = {key: inv.quantity or Decimal("0") for key, inv in inventories.items()}
+            txs, backdated = [], {}
+            for line in lines:
+                product, store = line["product"], line["store"]
+                inv = inventories[(product.pk, store.pk)]
+                new_balance = (inv.quantity or Decimal("0")) + Decimal(line["quantity"])
+                if new_balance < 0:
+                    raise ValidationError("Insufficient stock to perform transaction.")
+                inv.quantity = new_balance
+
+                tx = cls(
+                    product=product,
+                    store=store,
+                    quantity=Decimal(line["quantity"]),
+                    unit_cost=line.get("unit_cost"),
+                    movement_type=line.get("movement_type", MovementType.RECEIPT),
+                    reference_type=line.get("reference_type"),
+                    reference_id=line.get("reference_id"),
+                    created_by=line["created_by"],
+                    note=line.get("note", ""),
+                    balance_after=new_balance,
+                )
+                if line.get("created_at") is not None:
+                    tx.created_at = line["created_at"]
+                    key = (product.pk, store.pk)
+                    backdated[key] = min(backdated.get(key, tx.created_at), tx.created_at)
+                txs.append(tx)
+
+            cls.objects.bulk_create(txs)
+            if backdated:
+                restated = cls._restate(backdated)
+                for tx in txs:
+                    tx.balance_after = restated.get(tx.pk, tx.balance_after)
+
+            # one updated_at for the whole batch
+            for inv in inventories.values():
+                inv.updated_at = now
+            # every row is locked: an upsert on (product, store) rather than bulk_update(), whose
+            # CASE WHEN per row dominated large batches (transfers, big receipts)
+            Inventory.objects.bulk_create(inventories.values(), update_conflicts=True,
+                                          unique_fields=["product", "store"], update_fields=["quantity", "updated_at"])
+            StockAlert.record_crossings(inventories, before, {(tx.product_id, tx.store_id): tx for tx in txs})
+
+            # the upsert sends no post_save
+            transaction.on_commit(lambda: [scan_cache.forget(*key) for key in keys])
+            return txs
+
+    @classmethod
+    def _restate(cls, since):
+        """
+        Recompute the cached balances after movements were posted in the past: `since` maps
+        (product_id, store_id) to the oldest backdated movement. balance_after of every movement
+        from then on, and the snapshots taken since, are replayed from the balance just before it
+        (a few queries per store, not per product). The archive is not rewritten, so movements
+        older than the newest archived one are refused.
+        Returns {movement id: balance_after} of the rows changed.
+        """
+        by_store = {}
+        for (product_id, store_id), at in since.items():
+            by_store.setdefault(store_id, {})[product_id] = at
+
+        changed, restated_snapshots = [], []
+        for store_id, products in by_store.items():
+            start = min(products.values())
+            archived = StockTransactionArchive.objects.filter(store_id=store_id, product_id__in=products,
+                                                              created_at__gte=start).order_by() \
+                .values('product_id').annotate(last_at=Max('created_at')).values_list('product_id', 'last_at')
+            if any(last_at >= products[product_id] for product_id, last_at in archived):
+                raise ValidationError("Cannot post a stock movement dated before the archived ledger.")
+
+            balances = cls.objects.balances_at(products, store_id, start - timedelta(microseconds=1))
+            history = {product_id: ([], []) for product_id in products}  # (created_at, balance_after) series
+            movements = cls.objects.filter(store_id=store_id, product_id__in=products, created_at__gte=start) \
+                .order_by('product_id', 'created_at', 'id').only('id', 'product_id', 'created_at', 'quantity',
+                                                                 'balance_after')
+            for movement in movements:
+                balances[movement.product_id] += movement.quantity
+                if movement.balance_after != balances[movement.product_id]:
+                    movement.balance_after = balances[movement.product_id]
+                    changed.append(movement)
+                times, values = history[movement.product_id]
+                times.append(movement.created_at)
+                values.append((movement.created_at, movement.balance_after))
+
+            # a snapshot holds the balance of the last movement strictly before taken_at
+            for snapshot in StockSnapshot.objects.filter(store_id=store_id, product_id__in=products,
+                                                         taken_at__gt=start):
+                times, values = history[snapshot.product_id]
+                position = bisect.bisect_left(times, snapshot.taken_at)
+                if position and (snapshot.quantity, snapshot.last_movement_at) != values[position - 1][::-1]:
+                    snapshot.last_movement_at, snapshot.quantity = values[position - 1]
+                    restated_snapshots.append(snapshot)
+
+        cls.objects.bulk_update(changed, ["balance_after"], batch_size=500)
+        StockSnapshot.objects.bulk_update(restated_snapshots, ["quantity", "last_movement_at"], batch_size=500)
+        return {movement.pk: movement.balance_after for movement in changed}
+
+    @classmethod
+    @inventory_locks.retrying
+    def create_counts(cls, store, counts, created_by, reference_type="COUNT", reference_id=None, note=""):
+        """
+        Set absolute quantities (e.g. opening stock) through the ledger: `counts` maps products to
+        their counted quantity, and one COUNT transaction per product posts the difference to the
+        locked current balance. Products already at their count are skipped.
+        Returns the created StockTransactions.
+        """
+        with transaction.atomic():
+            current = inventory_locks.lock({(product.pk, store.pk) for product in counts})
+            lines = []
+            for product, counted in counts.items():
+                inv = current.get((product.pk, store.pk))
+                delta = Decimal(counted) - (inv.quantity if inv is not None else Decimal("0"))
+                if delta:
+                    lines.append(dict(product=product, store=store, quantity=delta, created_by=created_by,
+                                      unit_cost=product.unit_cost, movement_type=MovementType.COUNT,
+                                      reference_type=reference_type, reference_id=reference_id, note=note))
+            return cls.create_transactions(lines)
+
+
+class SnapshotPeriod(models.TextChoices):
+    DAILY = "DAILY", "Daily"
+    MONTHLY = "MONTHLY", "Monthly"
+
+
+class StockSnapshotQuerySet(models.QuerySet):
+    def take(self, taken_at, period, batch_size=2000):
+        """
+        Write the closing balance of every Inventory (product, store) as of `taken_at`
+        (movements created strictly before it). Balances come from the cached balance_after of
+        the ledger, then of the archive table, then from the previous snapshot (rows archived to files).
+        Re-taking the same boundary overwrites it. Returns the number of snapshots written.
+        """
+        def last_before(model, time_field):
+            return model.objects.filter(product=OuterRef('product'), store=OuterRef('store'),
+                                        **{f'{time_field}__lt': taken_at}).order_by(f'-{time_field}')
+
+        ledger = last_before(StockTransaction, 'created_at')
+        archive = last_before(StockTransactionArchive, 'created_at')
+        previous = last_before(self.model, 'taken_at')
+        rows = Inventory.objects.order_by().annotate(
+            balance=Coalesce(Subquery(ledger.values('balance_after')[:1]),
+                             Subquery(archive.values('balance_after')[:1]),
+                             Subquery(previous.values('quantity')[:1])),
+            last_movement_at=Coalesce(Subquery(ledger.values('created_at')[:1]),
+                                      Subquery(archive.values('created_at')[:1])),
+        ).values_list('product_id', 'store_id', 'balance', 'last_movement_at')
+
+        written, batch = 0, []
+        for product_id, store_id, balance, last_movement_at in rows.iterator(chunk_size=batch_size):
+            batch.append(self.model(product_id=product_id, store_id=store_id, period=period, taken_at=taken_at,
+                                    quantity=balance if balance is not None else Decimal("0"),
+                                    last_movement_at=last_movement_at))
+            if len(batch) >= batch_size:
+                written += self._upsert(batch)
+                batch = []
+        if batch:
+            written += self._upsert(batch)
+        return written
+
+    def _upsert(self, snapshots):
+        self.bulk_create(snapshots, update_conflicts=True, unique_fields=["product", "store", "taken_at"],
+                         update_fields=["period", "quantity", "last_movement_at"])
+        return len(snapshots)
+
+
+class StockSnapshot(models.Model):
+    """
+    Closing balance of a product in a store at a period boundary (daily / monthly).
+    Reconciliation and point-in-time reads start from the nearest snapshot instead of the
+    beginning of the ledger, and ledger rows older than a snapshot can be archived.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='stock_snapshots')
+    store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name='stock_snapshots')
+    period = models.CharField(max_length=16, choices=SnapshotPeriod.choices)
+    taken_at = models.DateTimeField(help_text="Boundary: includes every movement created before this moment")
+    quantity = models.DecimalField(max_digits=18, decimal_places=6)
+    last_movement_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StockSnapshotQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["-taken_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["product", "store", "taken_at"], name="uniq_stock_snapshot"),
+        ]
+        indexes = [
+            models.Index(fields=["taken_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.store_id}: {self.quantity} ({self.taken_at:%Y-%m-%d})"
+
+
+class StockTransactionArchive(models.Model):
+    """
+    Cold copy of ledger rows moved out of StockTransaction by `manage.py archive_ledger`.
+    Same columns, without foreign key constraints.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    created_at = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    store = models.ForeignKey(Store, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantity = models.DecimalField(max_digits=18, decimal_places=6)
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+    movement_type = models.CharField(max_length=24, choices=MovementType.choices)
+    reference_type = models.CharField(max_length=32, null=True, blank=True)
+    reference_id = models.UUIDField(null=True, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+                                   related_name='+')
+    note = models.TextField(blank=True)
+    balance_after = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["product", "store", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.quantity} ({self.get_movement_type_display()}) @ {self.store_id}"
+
+
+class SyncTombstone(models.Model):
+    """
+    Record of a deleted row, so /sync/ can tell terminals to drop it.
+    """
+    table = models.CharField(max_length=32)
+    object_id = models.CharField(max_length=64)
+    store_id = models.UUIDField(null=True, blank=True)  # for store-scoped tables
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["table", "deleted_at", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.table} {self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class StockAlert(models.Model):
+    """
+    A low-stock episode of an inventory row: opened by the ledger movement that takes the balance to or
+    below stock_alert, resolved by the one that takes it back above. At most one open alert per row.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name="stock_alerts")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="+")
+    threshold = models.DecimalField(max_digits=18, decimal_places=6)
+    quantity = models.DecimalField(max_digits=18, decimal_places=6)  # balance when the alert was opened
+    # ledger rows can be archived away, hence no database constraint
+    opened_by = models.ForeignKey(StockTransaction, on_delete=models.DO_NOTHING, db_constraint=False,
+                                  null=True, blank=True, related_name="+")
+    resolved_by = models.ForeignKey(StockTransaction, on_delete=models.DO_NOTHING, db_constraint=False,
+                                    null=True, blank=True, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["inventory"], condition=Q(resolved_at__isnull=True),
+                                    name="uniq_open_stock_alert"),
+        ]
+        indexes = [
+            models.Index(fields=["store", "created_at"]),
+        ]
+
+    def __str__(self):
+        state = "resolved" if self.resolved_at else "open"
+        return f"{self.product_id} @ {self.store_id}: {self.quantity} <= {self.threshold} ({state})"
+
+    @classmethod
+    def record_crossings(cls, inventories, before, movements):
+        """
+        Open / resolve alerts for locked Inventory rows whose balance moved from `before` to their
+        current quantity; `movements` maps (product_id, store_id) to the last StockTransaction applied.
+        Only rows that are or were low are looked at, so a batch without low stock costs no query.
+        """
+        touched = {key: inv for key, inv in inventories.items()
+                   if key in movements and (inv.is_low() or inv.is_low(before[key]))}
+        if not touched:
+            return
+        open_alerts = {alert.inventory_id: alert for alert in
+                       cls.objects.filter(inventory__in=[inv.pk for inv in touched.values()], resolved_at__isnull=True)}
+
+        now = timezone.now()
+        opened, resolved = [], []
+        for key, inv in touched.items():
+            alert = open_alerts.get(inv.pk)
+            if inv.is_low() and alert is None:
+                # also catches rows that became low by a stock_alert change rather than a movement
+                opened.append(cls(inventory=inv, product_id=inv.product_id, store_id=inv.store_id,
+                                  threshold=inv.stock_alert, quantity=inv.quantity, opened_by=movements[key]))
+            elif not inv.is_low() and alert is not None:
+                alert.resolved_at, alert.resolved_by = now, movements[key]
+                resolved.append(alert)
+        # writers of a row are serialised by its lock; the conflict guard only backs up uniq_open_stock_alert
+        cls.objects.bulk_create(opened, ignore_conflicts=True)
+        cls.objects.bulk_update(resolved, ["resolved_at", "resolved_by"])
+
+
+class TransferStatus(models.TextChoices):
+    DRAFT = "DRAFT", "Draft"
+    IN_TRANSIT = "IN_TRANSIT", "In transit"
+    RECEIVED = "RECEIVED", "Received"
+    CANCELLED = "CANCELLED", "Cancelled"
+
+
+class Transfer(models.Model):
+    """
+    Stock moved from one store to another: TRANSFER_OUT at the source when dispatched, TRANSFER_IN at
+    the destination when received; in between the quantities are in transit. Both legs use the
+    reference XFER / transfer id (the stores differ, so they never collide in the ledger).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    from_store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="transfers_out")
+    to_store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="transfers_in")
+    status = models.CharField(max_length=20, choices=TransferStatus.choices, default=TransferStatus.DRAFT)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name="transfers")
+    note = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=~Q(from_store=F("to_store")), name="transfer_distinct_stores"),
+        ]
+        indexes = [
+            models.Index(fields=["from_store", "status"]),
+            models.Index(fields=["to_store", "status"]),
+        ]
+
+    def __str__(self):
+        return f"Transfer {self.id} {self.from_store_id} -> {self.to_store_id} ({self.get_status_display()})"
+
+    @classmethod
+    def create_draft(cls, from_store, to_store, created_by, lines, note=""):
+        """
+        A DRAFT transfer with one line per product; `lines` maps products to quantities.
+        """
+        if from_store.pk == to_store.pk:
+            raise ValidationError("A transfer needs two different stores.")
+        if not lines:
+            raise ValidationError("A transfer needs at least one line.")
+        with transaction.atomic():
+            transfer = cls.objects.create(from_store=from_store, to_store=to_store, created_by=created_by, note=note)
+            TransferLine.objects.bulk_create([
+                TransferLine(transfer=transfer, product=product, quantity=quantity)
+                for product, quantity in lines.items()
+            ], batch_size=1000)
+        return transfer
+
+    def _lock(self, *statuses):
+        # serialises dispatch / receive / cancel of the same transfer
+        locked = Transfer.objects.select_for_update().get(pk=self.pk)
+        if locked.status not in statuses:
+            raise ValidationError(f"Transfer is {locked.get_status_display().lower()}.")
+        return locked
+
+    def _leg(self, line, store, quantity, movement_type, user):
+        return dict(product=line.product, store=store, quantity=quantity, unit_cost=line.product.unit_cost,
+                    movement_type=movement_type, created_by=user, reference_type="XFER", reference_id=self.id,
+                    note=f"Transfer {self.id}")
+
+    @inventory_locks.retrying
+    def dispatch(self, user, receive=False):
+        """
+        Post the TRANSFER_OUT leg of every line (stock must be available at the source).
+        With receive=True the TRANSFER_IN legs are posted in the same batch and the transfer is complete:
+        one create_transactions call locks the rows of both stores in the lock manager's (store, product)
+        order, like every other ledger write, so it cannot deadlock with sales on either side.
+        Returns the created StockTransactions.
+        """
+        with transaction.atomic():
+            self._lock(TransferStatus.DRAFT)
+            lines = list(self.lines.select_related("product"))
+            legs = [self._leg(line, self.from_store, -line.quantity, MovementType.TRANSFER_OUT, user) for line in lines]
+            if receive:
+                legs += [self._leg(line, self.to_store, line.quantity, MovementType.TRANSFER_IN, user) for line in lines]
+            txs = StockTransaction.create_transactions(legs)
+
+            self.dispatched_at = timezone.now()
+            self.status = TransferStatus.IN_TRANSIT
+            if receive:
+                for line in lines:
+                    line.received_quantity = line.quantity
+                TransferLine.objects.bulk_update(lines, ["received_quantity"], batch_size=1000)
+                self.received_at, self.status = self.dispatched_at, TransferStatus.RECEIVED
+            self.save(update_fields=["status", "dispatched_at", "received_at"])
+            return txs
+
+    @inventory_locks.retrying
+    def receive(self, user, quantities=None):
+        """
+        Post the TRANSFER_IN leg at the destination and complete the transfer. `quantities` maps products
+        (or their ids) to the quantity that arrived, at most the dispatched one; missing products arrived
+        in full, None means everything arrived. Shortfalls stay visible as quantity - received_quantity.
+        Returns the created StockTransactions.
+        """
+        quantities = {getattr(product, "pk", product): Decimal(quantity)
+                      for product, quantity in (quantities or {}).items()}
+        with transaction.atomic():
+            self._lock(TransferStatus.IN_TRANSIT)
+            lines = list(self.lines.select_related("product"))
+            unknown = set(quantities) - {line.product_id for line in lines}
+            if unknown:
+                raise ValidationError(f"{len(unknown)} products are not on this transfer.")
+            for line in lines:
+                line.received_quantity = quantities.get(line.product_id, line.quantity)
+                if not Decimal("0") <= line.received_quantity <= line.quantity:
+                    raise ValidationError(f"{line.product.sku}: between 0 and {line.quantity.normalize():f} "
+                                          f"can be received.")
+            txs = StockTransaction.create_transactions([
+                self._leg(line, self.to_store, line.received_quantity, MovementType.TRANSFER_IN, user)
+                for line in lines if line.received_quantity
+            ])
+            TransferLine.objects.bulk_update(lines, ["received_quantity"], batch_size=1000)
+
+            self.received_at, self.status = timezone.now(), TransferStatus.RECEIVED
+            self.save(update_fields=["status", "received_at"])
+            return txs
+
+    def cancel(self):
+        """
+        Cancel a transfer that was not dispatched yet (nothing was posted to the ledger).
+        """
+        with transaction.atomic():
+            self._lock(TransferStatus.DRAFT)
+            self.status = TransferStatus.CANCELLED
+            self.save(update_fields=["status"])
+
+
+class TransferLineQuerySet(models.QuerySet):
+    def in_transit(self, store=None):
+        """
+        {(to_store_id, product_id): quantity} dispatched but not yet received, optionally for one destination.
+        """
+        lines = self.filter(transfer__status=TransferStatus.IN_TRANSIT)
+        if store is not None:
+            lines = lines.filter(transfer__to_store=store)
+        rows = lines.order_by().values("transfer__to_store_id", "product_id").annotate(total=models.Sum("quantity"))
+        return {(row["transfer__to_store_id"], row["product_id"]): row["total"] for row in rows}
 
-            inv.quantity = new_balance
-            inv.save(update_fields=["quantity", "updated_at"])
 
-            return tx
+class TransferLine(models.Model):
+    transfer = models.ForeignKey(Transfer, on_delete=models.CASCADE, related_name="lines")
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="transfer_lines")
+    quantity = models.DecimalField(max_digits=18, decimal_places=6, validators=[MinValueValidator(Decimal("0.000001"))])
+    received_quantity = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)  # set on receive
+
+    objects = TransferLineQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["transfer", "product"], name="uniq_transfer_line_product"),
+            models.CheckConstraint(check=Q(quantity__gt=0), name="transfer_line_qty_positive"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity} (Transfer {self.transfer_id})"
+
+
+class StocktakeStatus(models.TextChoices):
+    OPEN = "OPEN", "Open"
+    POSTED = "POSTED", "Posted"
+    CANCELLED = "CANCELLED", "Cancelled"
+
+
+class Stocktake(models.Model):
+    """
+    A counting session of a store. Starting it freezes the stock of the counted products
+    (StocktakeLine.frozen_quantity); scanners then append counts (StocktakeCount) while the store keeps
+    selling; posting merges the counts and books counted - frozen per product as COUNT movements on top
+    of the current balance, so sales made during the count are not counted twice or lost.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    store = models.ForeignKey(Store, on_delete=models.PROTECT, related_name="stocktakes")
+    status = models.CharField(max_length=20, choices=StocktakeStatus.choices, default=StocktakeStatus.OPEN)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name="stocktakes")
+    note = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    posted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["store", "status"]),
+        ]
+
+    def __str__(self):
+        return f"Stocktake {self.id} @ {self.store_id} ({self.get_status_display()})"
+
+    @classmethod
+    def start(cls, store, created_by, products=None, note="", batch_size=5000):
+        """
+        Open a stocktake of `store` for `products` (a Product queryset, default: every product stocked
+        in the store) and freeze their current quantities.
+        """
+        with transaction.atomic():
+            stocktake = cls.objects.create(store=store, created_by=created_by, note=note)
+            rows = Inventory.objects.filter(store=store)
+            if products is not None:
+                rows = rows.filter(product__in=products)
+            frozen = rows.order_by().values_list("product_id", "quantity")
+            batch = []
+            for product_id, quantity in frozen.iterator(chunk_size=batch_size):
+                batch.append(StocktakeLine(stocktake=stocktake, product_id=product_id, frozen_quantity=quantity))
+                if len(batch) >= batch_size:
+                    StocktakeLine.objects.bulk_create(batch)
+                    batch = []
+            StocktakeLine.objects.bulk_create(batch)
+        return stocktake
+
+    def _lock(self):
+        locked = Stocktake.objects.select_for_update().get(pk=self.pk)
+        if locked.status != StocktakeStatus.OPEN:
+            raise ValidationError(f"Stocktake is {locked.get_status_display().lower()}.")
+        return locked
+
+    def counted(self):
+        """
+        {product_id: counted quantity} with the counts of every scanner summed.
+        """
+        return dict(self.counts.order_by().values("product_id").annotate(total=models.Sum("quantity"))
+                    .values_list("product_id", "total"))
+
+    def variances(self, zero_uncounted=False):
+        """
+        {product_id: (frozen, counted, counted - frozen)} of the counted products. Products counted but
+        not frozen (not stocked when the count started) had 0; frozen products without a count are left
+        alone, or counted as 0 with zero_uncounted.
+        """
+        counted = self.counted()
+        frozen = dict(self.lines.values_list("product_id", "frozen_quantity"))
+        products = set(counted) | (set(frozen) if zero_uncounted else set())
+        result = {}
+        for product_id in products:
+            before, after = frozen.get(product_id, Decimal("0")), counted.get(product_id, Decimal("0"))
+            result[product_id] = (before, after, after - before)
+        return result
+
+    @inventory_locks.retrying
+    def post(self, user, zero_uncounted=False):
+        """
+        Book the variances as COUNT movements (reference COUNT / stocktake id) in one batched ledger write.
+        A variance larger than what is left after the sales made meanwhile is capped at the current stock,
+        since a balance cannot go negative. Returns the created StockTransactions.
+        """
+        with transaction.atomic():
+            self._lock()
+            variances = self.variances(zero_uncounted)
+            changed = [product_id for product_id, (_, _, variance) in variances.items() if variance]
+            products = Product.objects.in_bulk(changed)
+            current = inventory_locks.lock({(product_id, self.store_id) for product_id in changed})
+
+            legs, lines = [], []
+            for product_id, (frozen, counted, variance) in variances.items():
+                if variance:
+                    inv = current.get((product_id, self.store_id))
+                    variance = max(variance, -(inv.quantity if inv is not None else Decimal("0")))
+                lines.append(StocktakeLine(stocktake=self, product_id=product_id, frozen_quantity=frozen,
+                                           counted_quantity=counted, posted_variance=variance))
+                if variance:
+                    legs.append(dict(product=products[product_id], store=self.store, quantity=variance,
+                                     unit_cost=products[product_id].unit_cost, movement_type=MovementType.COUNT,
+                                     created_by=user, reference_type="COUNT", reference_id=self.id,
+                                     note=f"Stocktake {self.id}"))
+            txs = StockTransaction.create_transactions(legs)
+            # record what was booked (and add the lines of products that were not frozen)
+            StocktakeLine.objects.bulk_create(lines, batch_size=1000, update_conflicts=True,
+                                              unique_fields=["stocktake", "product"],
+                                              update_fields=["counted_quantity", "posted_variance"])
+
+            self.status, self.posted_at = StocktakeStatus.POSTED, timezone.now()
+            self.save(update_fields=["status", "posted_at"])
+            return txs
+
+    def cancel(self):
+        with transaction.atomic():
+            self._lock()
+            self.status = StocktakeStatus.CANCELLED
+            self.save(update_fields=["status"])
+
+
+class StocktakeLine(models.Model):
+    stocktake = models.ForeignKey(Stocktake, on_delete=models.CASCADE, related_name="lines")
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="+")
+    frozen_quantity = models.DecimalField(max_digits=18, decimal_places=6)
+    # filled in when the stocktake is posted
+    counted_quantity = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
+    posted_variance = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["stocktake", "product"], name="uniq_stocktake_line_product"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.frozen_quantity} -> {self.counted_quantity}"
+
+
+class StocktakeCount(models.Model):
+    """
+    One scanned count, appended as uploaded; counts of the same product (several shelves or scanners) add up.
+    """
+    stocktake = models.ForeignKey(Stocktake, on_delete=models.CASCADE, related_name="counts")
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="+")
+    quantity = models.DecimalField(max_digits=18, decimal_places=6, validators=[MinValueValidator(Decimal("0"))])
+    device = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["stocktake", "product"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity} ({self.device or 'unknown device'})"
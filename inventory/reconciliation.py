@@ -0,0 +1,102 @@
+"""
+Inventory vs. ledger reconciliation.
+
+For every Inventory row three numbers must agree:
+- Inventory.quantity (the cached balance),
+- the nearest StockSnapshot plus the sum of the ledger movements after it,
+- the balance_after cached on the last ledger movement.
+`find_drift` computes all three with one set-based query per partition (correlated seeks on
+the (product, store, created_at) index), so partitions can be reconciled in parallel processes.
+"""
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value, DateTimeField
+from django.db.models.functions import Coalesce
+
+from inventory.locking import inventory_locks
+from inventory.models import Inventory, MovementType, StockSnapshot, StockTransaction
+
+BEGINNING = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+DRIFT_FIELDS = ('product_id', 'store_id', 'quantity', 'expected', 'last_balance')
+
+
+def _ledger_after_snapshot():
+    pair = dict(product=OuterRef('product'), store=OuterRef('store'))
+    amount = DecimalField(max_digits=18, decimal_places=6)
+
+    snapshot = StockSnapshot.objects.filter(**pair).order_by('-taken_at')
+    snapshot_at = Coalesce(Subquery(snapshot.values('taken_at')[:1]), Value(BEGINNING), output_field=DateTimeField())
+    snapshot_qty = Coalesce(Subquery(snapshot.values('quantity')[:1]), Decimal('0'), output_field=amount)
+
+    ledger = StockTransaction.objects.filter(**pair).order_by()
+    moved = ledger.filter(created_at__gte=OuterRef('snapshot_at')).values('product') \
+        .annotate(s=Sum('quantity')).values('s')
+    last = ledger.order_by('-created_at').values('balance_after')[:1]
+    return snapshot_at, snapshot_qty, moved, last, amount
+
+
+def drift_queryset(**partition):
+    """
+    Inventory rows (filtered by `partition`) whose cached quantity disagrees with the ledger,
+    annotated with `expected` (snapshot + movements since) and `last_balance`.
+    """
+    snapshot_at, snapshot_qty, moved, last, amount = _ledger_after_snapshot()
+    return Inventory.objects.filter(**partition).order_by().annotate(
+        snapshot_at=snapshot_at,
+        snapshot_qty=snapshot_qty,
+    ).annotate(
+        expected=F('snapshot_qty') + Coalesce(Subquery(moved), Decimal('0'), output_field=amount),
+        last_balance=Coalesce(Subquery(last), F('snapshot_qty'), output_field=amount),
+    ).filter(~Q(quantity=F('expected')) | ~Q(quantity=F('last_balance')))
+
+
+def find_drift(partition):
+    """
+    Drift rows of one partition as tuples of DRIFT_FIELDS. Safe to run in a worker process.
+    """
+    return list(drift_queryset(**partition).values_list(*DRIFT_FIELDS))
+
+
+@inventory_locks.retrying
+def repair_drift(keys, created_by):
+    """
+    Record the missing movement for drifted (product_id, store_id) keys as ADJUST transactions,
+    so that the ledger sums to, and ends at, the cached Inventory.quantity (typically changed
+    outside the ledger). Drift is re-checked under the row locks. A row whose quantity matches the
+    ledger sum but not the last balance_after gets that balance_after restated instead.
+    Returns the created transactions and the keys whose balance_after was restated.
+    """
+    with transaction.atomic():
+        inventory_locks.lock(keys)
+        by_store = {}
+        for product_id, store_id in keys:
+            by_store.setdefault(store_id, set()).add(product_id)
+        condition = Q()
+        for store_id, product_ids in by_store.items():
+            condition |= Q(store_id=store_id, product_id__in=product_ids)
+
+        lines, restated = [], []
+        for inv in drift_queryset().filter(condition).select_related('product', 'store'):
+            delta = inv.quantity - inv.expected
+            if delta == 0:
+                # only the cached balance_after of the last movement is off
+                last = StockTransaction.objects.filter(product_id=inv.product_id, store_id=inv.store_id) \
+                    .order_by('-created_at').values('pk')[:1]
+                StockTransaction.objects.filter(pk__in=Subquery(last)).update(balance_after=inv.quantity)
+                restated.append((inv.product_id, inv.store_id))
+                continue
+            # back to what the ledger says, so the ADJUST is posted (and alerts raised or resolved)
+            # like any other movement; the rows stay locked
+            Inventory.objects.filter(pk=inv.pk).update(quantity=inv.expected)
+            lines.append(dict(
+                product=inv.product,
+                store=inv.store,
+                quantity=delta,
+                movement_type=MovementType.ADJUST,
+                reference_type='RECON',
+                created_by=created_by,
+                note=f"Reconciliation: ledger {inv.expected} vs inventory {inv.quantity}",
+            ))
+        return StockTransaction.create_transactions(lines), restated
@@ -0,0 +1,108 @@
+"""
+Barcode scan lookup for the till: SKU -> product, the store's discount and stock, in one query,
+behind a per-process LRU cache keyed by (store, sku).
+
+Entries are dropped when the Product or Inventory row changes in this process (signals and the
+ledger), and expire after SCAN_CACHE["TTL"] seconds so changes made by other processes show up.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F, FilteredRelation, Q
+
+from core.models import Product
+
+DEFAULTS = {
+    "SIZE": 10000,  # entries
+    "TTL": 30,  # seconds
+}
+
+
+class ScanCache:
+    def __init__(self, **options):
+        conf = {**DEFAULTS, **getattr(settings, "SCAN_CACHE", {}), **options}
+        self.size = conf["SIZE"]
+        self.ttl = conf["TTL"]
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (store_id, sku) -> (expires, product_id, data)
+        self._by_product = {}  # product_id -> {(store_id, sku)}
+        self.hits = self.misses = 0
+
+    def get(self, store_id, sku):
+        key = (str(store_id), sku)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, store_id, sku, product_id, data):
+        key = (str(store_id), sku)
+        product_id = str(product_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, product_id, data)
+            self._entries.move_to_end(key)
+            self._by_product.setdefault(product_id, set()).add(key)
+            while len(self._entries) > self.size:
+                self._discard(*self._entries.popitem(last=False))
+
+    def _discard(self, key, entry):
+        keys = self._by_product.get(entry[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_product[entry[1]]
+
+    def forget(self, product_id, store_id=None):
+        """
+        Drop the entries of a product (in one store, or in all of them).
+        """
+        with self._lock:
+            for key in list(self._by_product.get(str(product_id), ())):
+                if store_id is None or key[0] == str(store_id):
+                    self._discard(key, self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_product.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+scan_cache = ScanCache()
+
+
+def _fetch(store_id, sku):
+    row = Product.objects.filter(sku=sku).annotate(
+        inv=FilteredRelation("inventories", condition=Q(inventories__store_id=store_id)),
+    ).values(
+        "id", "sku", "name", "unit_price", "tax_method", "tax_rate", "is_active",
+        inventory=F("inv__id"), quantity=F("inv__quantity"), stock_alert=F("inv__stock_alert"),
+        discount_method=F("inv__discount_method"), discount_rate=F("inv__discount_rate"),
+        inventory_active=F("inv__is_active"),
+    ).first()
+    if row is None:
+        return None
+    # JSON-ready, decimals as strings like the DRF serializers render them
+    return {key: str(value) if value is not None and not isinstance(value, (bool, str)) else value
+            for key, value in row.items()} | {"store": str(store_id)}
+
+
+def lookup(store_id, sku):
+    """
+    Scan data of `sku` in a store, or None for an unknown SKU (misses are not cached).
+    """
+    data = scan_cache.get(store_id, sku)
+    if data is None:
+        data = _fetch(store_id, sku)
+        if data is not None:
+            scan_cache.set(store_id, sku, data["id"], data)
+    return data
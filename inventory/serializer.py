@@ -1,9 +1,18 @@
+import uuid
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
-from inventory.models import Inventory, StockTransaction, MovementType
+from inventory.models import Inventory, StockTransaction, MovementType, StockAlert, Transfer, TransferLine, \
+    Stocktake
 
 ProductModel = Inventory._meta.get_field("product").remote_field.model
 StoreModel = Inventory._meta.get_field("store").remote_field.model
+CategoryModel = ProductModel._meta.get_field("category").remote_field.model
+BrandModel = ProductModel._meta.get_field("brand").remote_field.model
+DISCOUNT_METHODS = Inventory._meta.get_field("discount_method").choices
 
 
 class InventorySerializer(serializers.ModelSerializer):
@@ -40,6 +49,19 @@ class StockTransactionReadSerializer(serializers.ModelSerializer):
         ]
 
 
+class StockAlertSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source="product.name", read_only=True)
+    store_name = serializers.CharField(source="store.name", read_only=True)
+
+    class Meta:
+        model = StockAlert
+        fields = [
+            "id", "inventory", "product", "product_name", "store", "store_name",
+            "threshold", "quantity", "opened_by", "resolved_by", "created_at", "resolved_at",
+        ]
+        read_only_fields = fields
+
+
 class StockTransactionCreateSerializer(serializers.Serializer):
     # create-only payload (delta-based)
     product = serializers.PrimaryKeyRelatedField(queryset=ProductModel.objects.all())
@@ -71,3 +93,287 @@ class StockTransactionCreateSerializer(serializers.Serializer):
             note=validated.get("note", ""),
         )
         return tx
+
+
+class BalanceAtSerializer(serializers.Serializer):
+    # query params of GET /inventory/balance-at/
+    product = serializers.PrimaryKeyRelatedField(queryset=ProductModel.objects.all())
+    store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all())
+    at = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault("at", timezone.now())
+        return attrs
+
+
+class BulkBalanceAtSerializer(serializers.Serializer):
+    # body of POST /inventory/balance-at/bulk/
+    store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all())
+    at = serializers.DateTimeField(required=False)
+    products = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=1000)
+
+    def validate(self, attrs):
+        attrs.setdefault("at", timezone.now())
+        return attrs
+
+
+class StockHistorySerializer(serializers.Serializer):
+    # query params of GET /inventory/stock-history/
+    max_days = 366
+
+    product = serializers.PrimaryKeyRelatedField(queryset=ProductModel.objects.all())
+    store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all())
+    start = serializers.DateField()
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault("end", timezone.localdate())
+        if attrs["start"] > attrs["end"]:
+            raise serializers.ValidationError("start must be on or before end.")
+        if (attrs["end"] - attrs["start"]).days >= self.max_days:
+            raise serializers.ValidationError(f"At most {self.max_days} days per request.")
+        return attrs
+
+
+class BalanceSerializer(serializers.Serializer):
+    product = serializers.UUIDField()
+    balance = serializers.DecimalField(max_digits=18, decimal_places=6)
+
+
+class DailyBalanceSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    balance = serializers.DecimalField(max_digits=18, decimal_places=6)
+
+
+class OpeningStockSerializer(serializers.Serializer):
+    product = serializers.UUIDField()
+    quantity = serializers.DecimalField(max_digits=18, decimal_places=6, min_value=0)
+
+
+def _check_discount(attrs):
+    if attrs.get("discount_method") == "percentage" and attrs.get("discount_rate", 0) > 100:
+        raise serializers.ValidationError({"discount_rate": "A percentage discount must be between 0 and 100."})
+
+
+class InventorySeedSerializer(serializers.Serializer):
+    # body of POST /inventory/seed/: which products to stock in a store, row defaults, opening stock
+    store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all())
+    products = serializers.ListField(child=serializers.UUIDField(), required=False, max_length=10000)
+    category = serializers.PrimaryKeyRelatedField(queryset=CategoryModel.objects.all(), required=False)
+    brand = serializers.PrimaryKeyRelatedField(queryset=BrandModel.objects.all(), required=False)
+    active_only = serializers.BooleanField(default=True)
+    stock_alert = serializers.DecimalField(max_digits=18, decimal_places=6, min_value=0, default=0)
+    discount_method = serializers.ChoiceField(choices=DISCOUNT_METHODS, default="percentage")
+    discount_rate = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+    is_active = serializers.BooleanField(default=True)
+    opening_stock = OpeningStockSerializer(many=True, required=False, max_length=10000)
+
+    def validate(self, attrs):
+        _check_discount(attrs)
+        opening = attrs.pop("opening_stock", None) or []
+        products = ProductModel.objects.in_bulk([line["product"] for line in opening])
+        unknown = [str(line["product"]) for line in opening if line["product"] not in products]
+        if unknown:
+            raise serializers.ValidationError({"opening_stock": f"Unknown products: {', '.join(unknown)}"})
+        attrs["counts"] = {products[line["product"]]: line["quantity"] for line in opening}
+        return attrs
+
+    def product_queryset(self, attrs):
+        products = ProductModel.objects.all()
+        if "products" in attrs:
+            products = products.filter(pk__in=attrs["products"])
+        if "category" in attrs:
+            products = products.filter(category=attrs["category"])
+        if "brand" in attrs:
+            products = products.filter(brand=attrs["brand"])
+        if attrs["active_only"]:
+            products = products.filter(is_active=True)
+        return products
+
+    def create(self, validated):
+        store = validated["store"]
+        created = Inventory.objects.seed(
+            store, self.product_queryset(validated),
+            **{field: validated[field] for field in ("stock_alert", "discount_method", "discount_rate", "is_active")},
+        )
+
+        txs = []
+        if validated["counts"]:
+            try:
+                txs = StockTransaction.create_counts(store, validated["counts"], self.context["request"].user,
+                                                     reference_type="OPEN", reference_id=uuid.uuid4(),
+                                                     note="Opening stock")
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({"detail": exc.messages})
+        return {"store": store.pk, "created": created, "opening_transactions": len(txs)}
+
+
+class InventoryBulkUpdateSerializer(serializers.Serializer):
+    # body of POST /inventory/bulk-update/: row filter + values applied in one UPDATE
+    filter_fields = ("ids", "store", "products", "category", "brand")
+    update_fields = ("stock_alert", "discount_method", "discount_rate", "is_active")
+
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False, max_length=10000)
+    store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all(), required=False)
+    products = serializers.ListField(child=serializers.UUIDField(), required=False, max_length=10000)
+    category = serializers.PrimaryKeyRelatedField(queryset=CategoryModel.objects.all(), required=False)
+    brand = serializers.PrimaryKeyRelatedField(queryset=BrandModel.objects.all(), required=False)
+    stock_alert = serializers.DecimalField(max_digits=18, decimal_places=6, min_value=0, required=False)
+    discount_method = serializers.ChoiceField(choices=DISCOUNT_METHODS, required=False)
+    discount_rate = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    is_active = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if not any(field in attrs for field in self.filter_fields):
+            raise serializers.ValidationError(f"Give at least one of {', '.join(self.filter_fields)}.")
+        if not any(field in attrs for field in self.update_fields):
+            raise serializers.ValidationError(f"Give at least one of {', '.join(self.update_fields)}.")
+        _check_discount(attrs)
+        return attrs
+
+    def create(self, validated):
+        rows = Inventory.objects.all()
+        if "ids" in validated:
+            rows = rows.filter(pk__in=validated["ids"])
+        if "store" in validated:
+            rows = rows.filter(store=validated["store"])
+        if "products" in validated:
+            rows = rows.filter(product__in=validated["products"])
+        if "category" in validated:
+            rows = rows.filter(product__category=validated["category"])
+        if "brand" in validated:
+            rows = rows.filter(product__brand=validated["brand"])
+
+        try:
+            updated = rows.bulk_set(**{field: validated[field] for field in self.update_fields if field in validated})
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({"detail": exc.messages})
+        return {"updated": updated}
+
+
+class TransferLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TransferLine
+        fields = ["id", "product", "quantity", "received_quantity"]
+        read_only_fields = fields
+
+
+class TransferSerializer(serializers.ModelSerializer):
+    lines = TransferLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Transfer
+        fields = [
+            "id", "from_store", "to_store", "status", "note", "created_by",
+            "created_at", "dispatched_at", "received_at", "lines",
+        ]
+        read_only_fields = fields
+
+
+class TransferQuantitySerializer(serializers.Serializer):
+    product = serializers.UUIDField()
+    quantity = serializers.DecimalField(max_digits=18, decimal_places=6, min_value=0)
+
+
+def _line_quantities(lines):
+    # [{product, quantity}] -> {Product: quantity}, rejecting duplicates and unknown products
+    ids = [line["product"] for line in lines]
+    if len(ids) != len(set(ids)):
+        raise serializers.ValidationError("Each product can be given once.")
+    products = ProductModel.objects.in_bulk(ids)
+    unknown = [str(pk) for pk in ids if pk not in products]
+    if unknown:
+        raise serializers.ValidationError(f"Unknown products: {', '.join(unknown)}")
+    return {products[line["product"]]: line["quantity"] for line in lines}
+
+
+class TransferCreateSerializer(serializers.Serializer):
+    # body of POST /transfers/: a draft, optionally dispatched (and received) right away
+    from_store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all())
+    to_store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all())
+    lines = TransferQuantitySerializer(many=True, min_length=1, max_length=10000)
+    note = serializers.CharField(required=False, allow_blank=True, default="")
+    dispatch = serializers.BooleanField(default=False)
+    receive = serializers.BooleanField(default=False, help_text="With dispatch: post both legs at once.")
+
+    def validate_lines(self, lines):
+        if any(line["quantity"] <= 0 for line in lines):
+            raise serializers.ValidationError("Quantities must be positive.")
+        return _line_quantities(lines)
+
+    def validate(self, attrs):
+        if attrs["from_store"] == attrs["to_store"]:
+            raise serializers.ValidationError({"to_store": "Must differ from from_store."})
+        return attrs
+
+    def create(self, validated):
+        user = self.context["request"].user
+        try:
+            with transaction.atomic():
+                transfer = Transfer.create_draft(validated["from_store"], validated["to_store"], user,
+                                                 validated["lines"], note=validated["note"])
+                if validated["dispatch"]:
+                    transfer.dispatch(user, receive=validated["receive"])
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({"detail": exc.messages})
+        return transfer
+
+
+class TransferDispatchSerializer(serializers.Serializer):
+    receive = serializers.BooleanField(default=False, help_text="Post the receiving leg in the same batch.")
+
+
+class TransferReceiveSerializer(serializers.Serializer):
+    lines = TransferQuantitySerializer(many=True, required=False, max_length=10000,
+                                       help_text="Quantities that arrived; products not listed arrived in full.")
+
+    def validate_lines(self, lines):
+        return {product.pk: quantity for product, quantity in _line_quantities(lines).items()}
+
+
+class StocktakeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Stocktake
+        fields = ["id", "store", "status", "note", "created_by", "started_at", "posted_at"]
+        read_only_fields = fields
+
+
+class StocktakeCreateSerializer(serializers.Serializer):
+    # body of POST /stocktakes/: which products of the store to count (default: all stocked ones)
+    store = serializers.PrimaryKeyRelatedField(queryset=StoreModel.objects.all())
+    products = serializers.ListField(child=serializers.UUIDField(), required=False, max_length=10000)
+    category = serializers.PrimaryKeyRelatedField(queryset=CategoryModel.objects.all(), required=False)
+    brand = serializers.PrimaryKeyRelatedField(queryset=BrandModel.objects.all(), required=False)
+    note = serializers.CharField(required=False, allow_blank=True, default="")
+
+    def create(self, validated):
+        products = None
+        if any(field in validated for field in ("products", "category", "brand")):
+            products = ProductModel.objects.all()
+            if "products" in validated:
+                products = products.filter(pk__in=validated["products"])
+            if "category" in validated:
+                products = products.filter(category=validated["category"])
+            if "brand" in validated:
+                products = products.filter(brand=validated["brand"])
+        return Stocktake.start(validated["store"], self.context["request"].user, products=products,
+                               note=validated["note"])
+
+
+class StocktakeCountsSerializer(serializers.Serializer):
+    # JSON body of POST /stocktakes/<id>/counts/ (files are read as CSV / JSONL instead)
+    device = serializers.CharField(required=False, allow_blank=True, default="", max_length=64)
+    counts = serializers.ListField(child=serializers.DictField(), max_length=50000,
+                                   help_text="[{sku or product, quantity}]; bad rows are reported, not fatal")
+
+
+class StocktakePostSerializer(serializers.Serializer):
+    zero_uncounted = serializers.BooleanField(default=False,
+                                              help_text="Products frozen but never counted are booked as 0.")
+
+
+class StocktakeVarianceSerializer(serializers.Serializer):
+    product = serializers.UUIDField()
+    frozen = serializers.DecimalField(max_digits=18, decimal_places=6)
+    counted = serializers.DecimalField(max_digits=18, decimal_places=6)
+    variance = serializers.DecimalField(max_digits=18, decimal_places=6)
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Product
+from inventory.models import Inventory, SyncTombstone
+from inventory.scan import scan_cache
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def forget_product(sender, instance, **kwargs):
+    scan_cache.forget(instance.pk)
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def forget_inventory(sender, instance, **kwargs):
+    scan_cache.forget(instance.product_id, instance.store_id)
+
+
+@receiver(post_delete, sender=Product)
+def product_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.create(table="product", object_id=str(instance.pk))
+
+
+@receiver(post_delete, sender=Inventory)
+def inventory_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.create(table="inventory", object_id=str(instance.pk), store_id=instance.store_id)
@@ -0,0 +1,105 @@
+"""
+Bulk count upload for stocktakes (CSV / JSONL files or JSON lists), many scanners at once.
+
+Counts are only appended (StocktakeCount rows, bulk_create per batch), so concurrent uploads never
+contend for the same rows; they are merged by summing when the stocktake is posted. A batch is
+either merged or rolled back: it is never accepted after the stocktake was posted. Rows name the
+product by `sku` (or `product` id); SKUs are resolved per batch. A bad row is reported with its
+line number and skipped, like the catalog import.
+"""
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from core.catalog import RowError, _decimal
+from core.models import Product
+from inventory.models import Stocktake, StocktakeCount, StocktakeStatus
+
+
+class CountUploader:
+    def __init__(self, stocktake, device="", batch_size=2000, max_errors=1000):
+        self.stocktake = stocktake
+        self.device = device[:64]
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.accepted = 0
+        self.error_count = 0
+        self.errors = []  # first max_errors {line, error}
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def parse(self, row):
+        """
+        (("sku" | "id", key), quantity) of one row; the quantity is a count, so never negative.
+        """
+        quantity = _decimal(row, 'quantity')
+        sku = str(row.get('sku') or '').strip()
+        if sku:
+            return ('sku', sku), quantity
+        try:
+            return ('id', uuid.UUID(str(row.get('product') or ''))), quantity
+        except ValueError:
+            raise RowError("sku or product is required")
+
+    def flush(self, batch):
+        skus = {key for (kind, key), _, _ in batch if kind == 'sku'}
+        ids = {key for (kind, key), _, _ in batch if kind == 'id'}
+        by_sku = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'pk')) if skus else {}
+        known_ids = set(Product.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+        counts = []
+        for (kind, key), quantity, line_number in batch:
+            product_id = by_sku.get(key) if kind == 'sku' else (key if key in known_ids else None)
+            if product_id is None:
+                self.error(line_number, f"unknown {'SKU' if kind == 'sku' else 'product'}: {key}")
+                continue
+            counts.append(StocktakeCount(stocktake=self.stocktake, product_id=product_id, quantity=quantity,
+                                         device=self.device))
+        with transaction.atomic():
+            StocktakeCount.objects.bulk_create(counts)
+            # locked after the insert, so scanners only queue for their commit: a batch either commits
+            # before Stocktake.post() locks the row (and is merged), or waits for it and is rolled back
+            self.check_open(lock=True)
+        self.accepted += len(counts)
+
+    def check_open(self, lock=False):
+        open_stocktake = Stocktake.objects.filter(pk=self.stocktake.pk, status=StocktakeStatus.OPEN)
+        if lock:
+            open_stocktake = open_stocktake.select_for_update()
+        if open_stocktake.values_list('pk', flat=True).first() is None:
+            message = "Stocktake is not open."
+            if self.accepted:
+                message += f" The {self.accepted} counts uploaded before it closed were accepted."
+            raise ValidationError(message)
+
+    def run(self, rows):
+        """
+        Append the counts of `rows` ((line_number, row) pairs, e.g. core.catalog.read_rows); returns the summary.
+        Raises ValidationError when the stocktake is no longer open.
+        """
+        self.check_open()
+        batch = []
+        for line_number, row in rows:
+            try:
+                if isinstance(row, Exception):
+                    raise RowError(f"invalid JSON: {row}")
+                if not isinstance(row, dict):
+                    raise RowError("expected an object")
+                key, quantity = self.parse(row)
+            except RowError as exc:
+                self.error(line_number, str(exc))
+                continue
+            batch.append((key, quantity, line_number))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        return self.summary()
+
+    def summary(self):
+        return {'accepted': self.accepted, 'error_count': self.error_count, 'errors': self.errors}
@@ -0,0 +1,136 @@
+"""
+Delta sync for terminals: rows of a table changed since a high-water mark, plus tombstones.
+
+Every table is read in (updated_at, id) keyset order from where the client's mark stopped;
+deleted rows come from SyncTombstone, deactivated ones (is_active=False) are sent as deletes
+too. Rows changed in the last SYNC["LAG"] seconds are held back to the next pull, so a row
+written by a transaction that commits late cannot slip behind a mark already handed out.
+"""
+import base64
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import Product
+from inventory.models import Inventory, SyncTombstone
+
+DEFAULTS = {
+    "LAG": 5,  # seconds
+    "PAGE_SIZE": 1000,  # rows per table and request
+    "MAX_PAGE_SIZE": 10000,
+}
+CONF = {**DEFAULTS, **getattr(settings, "SYNC", {})}
+
+
+class InvalidMark(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SyncTable:
+    model: type
+    fields: tuple
+    store_scoped: bool = False
+
+
+SYNC_TABLES = {
+    "product": SyncTable(Product, ("id", "sku", "name", "category_id", "brand_id", "description", "unit_price",
+                                   "unit_cost", "tax_method", "tax_rate", "image", "is_active", "updated_at")),
+    "inventory": SyncTable(Inventory, ("id", "product_id", "store_id", "quantity", "stock_alert", "discount_method",
+                                       "discount_rate", "is_active", "updated_at"), store_scoped=True),
+}
+
+
+def encode_mark(mark):
+    return base64.urlsafe_b64encode(json.dumps(mark, default=str).encode()).decode()
+
+
+def decode_mark(token):
+    """
+    A mark is {"u": updated_at, "i": last id or None, "d": deleted_at, "t": last tombstone id or None}.
+    An empty token means "first pull".
+    """
+    if not token:
+        return None
+    try:
+        mark = json.loads(base64.urlsafe_b64decode(token.encode()))
+        for key in ("u", "d"):
+            mark[key] = parse_datetime(mark[key])
+            if mark[key] is None:
+                raise ValueError(key)
+        return mark
+    except (ValueError, KeyError, TypeError):
+        raise InvalidMark("Invalid high-water mark.")
+
+
+def _after(queryset, time_field, since, last_id):
+    if last_id is None:
+        return queryset.filter(**{f"{time_field}__gte": since})
+    return queryset.filter(Q(**{f"{time_field}__gt": since}) | Q(**{time_field: since, "id__gt": last_id}))
+
+
+def changes(name, mark, store=None, page_size=None, now=None):
+    """
+    Yield the change records of one table after `mark` (None: full pull of the active rows),
+    ending with {"table", "next", "more"}; `next` is the mark for the following pull.
+    """
+    table = SYNC_TABLES[name]
+    page_size = page_size or CONF["PAGE_SIZE"]
+    cutoff = (now or timezone.now()) - timedelta(seconds=CONF["LAG"])
+
+    rows = table.model.objects.filter(updated_at__lt=cutoff)
+    tombstones = SyncTombstone.objects.filter(table=name, deleted_at__lt=cutoff)
+    if table.store_scoped:
+        rows = rows.filter(store=store)
+        tombstones = tombstones.filter(store_id=store.pk)
+    if mark is None:
+        # a new terminal has nothing to delete
+        rows = rows.filter(is_active=True)
+        mark = {"u": None, "i": None, "d": cutoff, "t": None}
+    else:
+        rows = _after(rows, "updated_at", mark["u"], mark["i"])
+    tombstones = _after(tombstones, "deleted_at", mark["d"], mark["t"])
+
+    next_mark = dict(mark)
+    served = 0
+    for row in rows.order_by("updated_at", "id").values(*table.fields)[:page_size]:
+        served += 1
+        next_mark["u"], next_mark["i"] = row["updated_at"], row["id"]
+        if row["is_active"]:
+            yield {"table": name, "op": "upsert", "row": row}
+        else:
+            yield {"table": name, "op": "delete", "id": row["id"]}
+    more = served == page_size
+    if not more:
+        next_mark["u"], next_mark["i"] = cutoff, None
+
+    served = 0
+    for pk, object_id, deleted_at in tombstones.order_by("deleted_at", "id") \
+            .values_list("id", "object_id", "deleted_at")[:page_size]:
+        served += 1
+        next_mark["d"], next_mark["t"] = deleted_at, pk
+        yield {"table": name, "op": "delete", "id": object_id}
+    if served == page_size:
+        more = True
+    else:
+        next_mark["d"], next_mark["t"] = cutoff, None
+
+    yield {"table": name, "next": encode_mark(next_mark), "more": more}
+
+
+def gzip_jsonl(records):
+    """
+    Encode records as JSON lines and gzip them on the fly.
+    """
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for record in records:
+        chunk = compressor.compress((json.dumps(record, default=str, separators=(",", ":")) + "\n").encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
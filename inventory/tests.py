@@ -1,3 +1,387 @@
+import gzip
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from core.models import Store, Category, Brand, Product
+from inventory.locking import inventory_locks
+from inventory.models import Inventory, StockTransaction, StockTransactionArchive, StockSnapshot, MovementType, \
+    SnapshotPeriod, StockAlert, Stocktake, StocktakeCount, StocktakeStatus, Transfer, TransferLine, TransferStatus
+from inventory.reconciliation import find_drift, repair_drift
+from inventory.stocktake import CountUploader
+from inventory.sync import changes, decode_mark
+from user.models import User
+
+
+class InventoryFixtureMixin:
+    products_count = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='keeper', password='keeper', role='Admin')
+        cls.store = Store.objects.create(name='Main', creator=cls.user)
+        cls.other_store = Store.objects.create(name='Branch', creator=cls.user)
+        category = Category.objects.create(name='Grocery')
+        brand = Brand.objects.create(name='Acme')
+        cls.products = Product.objects.bulk_create([
+            Product(sku=f'SKU-{i}', name=f'Product {i}', category=category, brand=brand, unit_price=Decimal('10'),
+                    unit_cost=Decimal('6'), tax_method='exclusive')
+            for i in range(cls.products_count)
+        ])
+
+    def quantity(self, product, store=None):
+        row = Inventory.objects.filter(product=product, store=store or self.store).first()
+        return row.quantity if row is not None else Decimal('0')
+
+
+class LedgerPostingTests(InventoryFixtureMixin, TestCase):
+    def line(self, quantity, product=None, **fields):
+        return dict(product=product or self.products[0], store=self.store, quantity=Decimal(quantity),
+                    created_by=self.user, **fields)
+
+    def test_lines_are_applied_in_order_with_their_balance(self):
+        txs = StockTransaction.create_transactions([
+            self.line('10'), self.line('4', self.products[1]),
+            self.line('-3', movement_type=MovementType.ISSUE),
+        ])
+        self.assertEqual([tx.balance_after for tx in txs], [Decimal('10'), Decimal('4'), Decimal('7')])
+        self.assertEqual(list(StockTransaction.objects.filter(product=self.products[0]).order_by('balance_after')
+                              .values_list('balance_after', flat=True)), [Decimal('7'), Decimal('10')])
+        self.assertEqual((self.quantity(self.products[0]), self.quantity(self.products[1])),
+                         (Decimal('7'), Decimal('4')))
+
+    def test_insufficient_stock_writes_nothing(self):
+        StockTransaction.create_transactions([self.line('2')])
+        with self.assertRaises(ValidationError):
+            StockTransaction.create_transactions([self.line('5', self.products[1]),
+                                                  self.line('-3', movement_type=MovementType.ISSUE)])
+        self.assertEqual(StockTransaction.objects.count(), 1)
+        self.assertEqual(self.quantity(self.products[0]), Decimal('2'))
+        self.assertEqual(self.quantity(self.products[1]), Decimal('0'))
+
+    def test_wrong_sign_for_the_movement_type_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            StockTransaction.create_transactions([self.line('-1', movement_type=MovementType.RECEIPT)])
+
+    def test_concurrent_first_movement_is_not_overwritten(self):
+        lock, product = inventory_locks.lock, self.products[0]
+
+        def other_posting_commits_after_the_lock(keys):
+            rows = lock(keys)
+            if not rows:
+                # another transaction posts the first movement of the same product/store meanwhile
+                Inventory.objects.create(product=product, store=self.store, quantity=Decimal('5'),
+                                         discount_method='percentage')
+            return rows
+
+        with mock.patch.object(inventory_locks, 'lock', other_posting_commits_after_the_lock):
+            tx, = StockTransaction.create_transactions([self.line('3')])
+        self.assertEqual((tx.balance_after, self.quantity(product)), (Decimal('8'), Decimal('8')))
+
+    def test_a_reference_posts_once_per_product_and_store(self):
+        reference = dict(reference_type='PO', reference_id=uuid.uuid4())
+        StockTransaction.create_transactions([self.line('1', **reference), self.line('1', self.products[1],
+                                                                                     **reference)])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StockTransaction.create_transactions([self.line('1', **reference)])
+
+
+class LedgerPaginationTests(InventoryFixtureMixin, APITestCase):
+    products_count = 30
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        StockTransaction.create_transactions([
+            dict(product=product, store=self.store, quantity=Decimal('1'), created_by=self.user)
+            for product in self.products
+        ])
+        # one batch, one timestamp
+        self.moment = timezone.now()
+        StockTransaction.objects.update(created_at=self.moment)
+
+    def test_pages_are_keyed_on_created_at_and_id(self):
+        seen, url = [], '/v1/api/stock-transactions/?page_size=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.json()['results']]
+            url = response.json()['next']
+            # a row written between two requests with the same timestamp, sorting first, must not shift the pages
+            newest = StockTransaction.objects.create(id=uuid.UUID(int=2 ** 128 - 1 - len(seen)),
+                                                     product=self.products[0], store=self.other_store,
+                                                     quantity=Decimal('1'), created_by=self.user)
+            StockTransaction.objects.filter(pk=newest.pk).update(created_at=self.moment)
+
+        originals = {str(pk) for pk in StockTransaction.objects.filter(store=self.store).values_list('pk', flat=True)}
+        seen_originals = [pk for pk in seen if pk in originals]
+        self.assertEqual(len(seen_originals), len(set(seen_originals)))
+        self.assertEqual(set(seen_originals), originals)
+
+    def test_previous_link_returns_the_previous_page(self):
+        first = self.client.get('/v1/api/stock-transactions/?page_size=7').json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([row['id'] for row in back['results']], [row['id'] for row in first['results']])
+        self.assertIsNone(first['previous'])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/v1/api/stock-transactions/', {'cursor': 'cD1ub3BlfDE='})
+        self.assertEqual(response.status_code, 404)
+
+
+class ArchivedBalanceTests(InventoryFixtureMixin, TestCase):
+    def setUp(self):
+        self.product = self.products[0]
+        tz = timezone.get_current_timezone()
+        self.day = lambda day, hour=12: timezone.make_aware(datetime(2026, 3, day, hour), tz)
+        # +10 on the 1st, +5 on the 3rd, -3 on the 5th, +8 on the 9th
+        for day, quantity in ((1, 10), (3, 5), (5, -3), (9, 8)):
+            movement = StockTransaction.create_transaction(
+                product=self.product, store=self.store, quantity=Decimal(quantity), created_by=self.user,
+                movement_type=MovementType.ADJUST)
+            StockTransaction.objects.filter(pk=movement.pk).update(created_at=self.day(day))
+        # monthly snapshot on the 2nd, then everything before the 7th is archived
+        StockSnapshot.objects.take(self.day(2, 0), SnapshotPeriod.MONTHLY)
+        StockSnapshot.objects.take(self.day(7, 0), SnapshotPeriod.DAILY)
+        call_command('archive_ledger', f'--before={self.day(7, 0).isoformat()}', stdout=io.StringIO())
+        self.assertEqual(StockTransaction.objects.count(), 1)
+
+    def test_balance_at_reads_the_archive_between_snapshots(self):
+        balance_at = StockTransaction.objects.balance_at
+        self.assertEqual(balance_at(self.product, self.store, self.day(4)), Decimal('15'))
+        self.assertEqual(balance_at(self.product, self.store, self.day(6)), Decimal('12'))
+        self.assertEqual(balance_at(self.product, self.store, self.day(8)), Decimal('12'))
+        self.assertEqual(balance_at(self.product, self.store, self.day(10)), Decimal('20'))
+
+    def test_balances_at_reads_the_archive_between_snapshots(self):
+        balances = StockTransaction.objects.balances_at([self.product.pk, self.products[1].pk], self.store,
+                                                        self.day(4))
+        self.assertEqual(balances, {self.product.pk: Decimal('15'), self.products[1].pk: Decimal('0')})
+
+    def test_daily_balances_include_archived_days(self):
+        series = StockTransaction.objects.daily_balances(self.product, self.store, self.day(2).date(),
+                                                         self.day(10).date())
+        self.assertEqual([balance for _, balance in series],
+                         [Decimal(q) for q in ('10', '15', '15', '12', '12', '12', '12', '20', '20')])
+
+    def test_snapshots_stand_in_for_movements_archived_to_a_file(self):
+        StockTransactionArchive.objects.all().delete()
+        self.assertEqual(StockTransaction.objects.balance_at(self.product, self.store, self.day(4)), Decimal('10'))
+        series = StockTransaction.objects.daily_balances(self.product, self.store, self.day(5).date(),
+                                                         self.day(8).date())
+        self.assertEqual([balance for _, balance in series], [Decimal(q) for q in ('10', '12', '12', '12')])
+
+
+class ReconciliationTests(InventoryFixtureMixin, TestCase):
+    def setUp(self):
+        self.product = self.products[0]
+        self.key = (self.product.pk, self.store.pk)
+        StockTransaction.create_transaction(product=self.product, store=self.store, quantity=Decimal('10'),
+                                            created_by=self.user)
+        self.inventory = Inventory.objects.get(product=self.product, store=self.store)
+
+    def test_repair_posts_an_adjust_through_the_ledger(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=Decimal('2'), stock_alert=Decimal('3'))
+
+        (tx,), restated = repair_drift([self.key], self.user)
+
+        self.assertEqual((tx.quantity, tx.balance_after, restated), (Decimal('-8'), Decimal('2'), []))
+        self.assertEqual(self.quantity(self.product), Decimal('2'))
+        alert = StockAlert.objects.get(inventory=self.inventory)
+        self.assertEqual((alert.opened_by_id, alert.quantity), (tx.pk, Decimal('2')))
+        self.assertEqual(find_drift({'store_id': self.store.pk}), [])
+
+    def test_wrong_last_balance_is_restated(self):
+        StockTransaction.objects.update(balance_after=Decimal('7'))
+
+        created, restated = repair_drift([self.key], self.user)
+
+        self.assertEqual((created, restated), ([], [self.key]))
+        self.assertEqual(StockTransaction.objects.get().balance_after, Decimal('10'))
+        self.assertEqual(find_drift({'store_id': self.store.pk}), [])
+
+
+class StocktakeTests(InventoryFixtureMixin, TestCase):
+    def setUp(self):
+        StockTransaction.create_transactions([
+            dict(product=product, store=self.store, quantity=Decimal('10'), created_by=self.user)
+            for product in self.products
+        ])
+        self.stocktake = Stocktake.start(self.store, self.user)
+
+    def sell(self, product, quantity):
+        StockTransaction.create_transaction(product=product, store=self.store, quantity=-Decimal(quantity),
+                                            created_by=self.user, movement_type=MovementType.ISSUE)
+
+    def upload(self, *rows):
+        return CountUploader(self.stocktake, device='scanner-1').run(enumerate(rows, start=1))
+
+    def test_variance_is_booked_on_top_of_the_sales_made_during_the_count(self):
+        first, second, third = self.products
+        self.sell(first, 3)
+        self.sell(second, 3)
+        # two scanners counting the same shelf
+        self.upload({'sku': first.sku, 'quantity': '7'}, {'sku': first.sku, 'quantity': '5'})
+        self.upload({'sku': second.sku, 'quantity': '0'})
+
+        self.stocktake.post(self.user)
+
+        # first: counted 12 against 10 frozen, +2 on the 7 left; second: -10 capped at the 7 left
+        self.assertEqual(self.quantity(first), Decimal('9'))
+        self.assertEqual(self.quantity(second), Decimal('0'))
+        # third was not counted and is left alone
+        self.assertEqual(self.quantity(third), Decimal('10'))
+        self.assertEqual(dict(self.stocktake.lines.exclude(posted_variance=None)
+                              .values_list('product', 'posted_variance')),
+                         {first.pk: Decimal('2'), second.pk: Decimal('-7')})
+
+    def test_zero_uncounted_clears_the_products_not_counted(self):
+        self.upload({'sku': self.products[0].sku, 'quantity': '10'})
+        self.stocktake.post(self.user, zero_uncounted=True)
+        self.assertEqual([self.quantity(product) for product in self.products],
+                         [Decimal('10'), Decimal('0'), Decimal('0')])
+
+    def test_counts_are_refused_once_posted(self):
+        self.stocktake.post(self.user)
+        with self.assertRaises(ValidationError):
+            self.upload({'sku': self.products[0].sku, 'quantity': '1'})
+
+    def test_batch_racing_the_posting_is_rolled_back(self):
+        bulk_create = StocktakeCount.objects.bulk_create
+
+        def posted_meanwhile(counts):
+            created = bulk_create(counts)
+            Stocktake.objects.filter(pk=self.stocktake.pk).update(status=StocktakeStatus.POSTED)
+            return created
+
+        uploader = CountUploader(self.stocktake)
+        with mock.patch.object(StocktakeCount.objects, 'bulk_create', posted_meanwhile), \
+                self.assertRaises(ValidationError):
+            uploader.run([(1, {'sku': self.products[0].sku, 'quantity': '4'})])
+        self.assertEqual(uploader.accepted, 0)
+        self.assertFalse(StocktakeCount.objects.exists())
+
+    def test_negative_and_non_numeric_quantities_are_rejected(self):
+        summary = self.upload({'sku': self.products[0].sku, 'quantity': '-2'},
+                              {'sku': self.products[0].sku, 'quantity': 'NaN'},
+                              {'sku': self.products[0].sku, 'quantity': '3'})
+        self.assertEqual(summary['accepted'], 1)
+        self.assertEqual([error['line'] for error in summary['errors']], [1, 2])
+
+
+class SyncTests(InventoryFixtureMixin, APITestCase):
+    products_count = 5
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        # one bulk write, one timestamp: pages must be keyed on (updated_at, id)
+        self.moment = timezone.now() - timedelta(minutes=5)
+        Product.objects.update(updated_at=self.moment)
+
+    def pull(self, mark, page_size=2, now=None):
+        records = list(changes('product', mark, page_size=page_size, now=now))
+        return records[:-1], records[-1]
+
+    def test_pages_cover_every_row_once_then_nothing(self):
+        seen, mark, more = [], None, True
+        while more:
+            records, end = self.pull(mark)
+            seen += [record['row']['id'] for record in records]
+            mark, more = decode_mark(end['next']), end['more']
+        self.assertEqual(sorted(seen), sorted(product.pk for product in self.products))
+        self.assertEqual(self.pull(mark)[0], [])
+
+    def test_deactivated_and_deleted_rows_are_sent_as_deletes(self):
+        _, end = self.pull(None, page_size=100)
+        mark = decode_mark(end['next'])
+        first, second = self.products[0].pk, self.products[1].pk
+        Product.objects.filter(pk=first).update(is_active=False, updated_at=timezone.now())
+        Product.objects.get(pk=second).delete()
+
+        records, _ = self.pull(mark, page_size=100, now=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(sorted(str(record['id']) for record in records if record['op'] == 'delete'),
+                         sorted([str(first), str(second)]))
+
+    def test_rows_inside_the_lag_wait_for_the_next_pull(self):
+        _, end = self.pull(None, page_size=100)
+        Product.objects.filter(pk=self.products[0].pk).update(name='Renamed', updated_at=timezone.now())
+        records, _ = self.pull(decode_mark(end['next']), page_size=100)
+        self.assertEqual(records, [])
+
+    def test_endpoint_streams_gzipped_json_lines(self):
+        response = self.client.get('/v1/api/sync/', {'tables': 'product,inventory', 'store': str(self.store.pk)})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(len([line for line in lines if line.get('op') == 'upsert']), self.products_count)
+        self.assertEqual([line['table'] for line in lines if 'next' in line], ['product', 'inventory'])
+
+    def test_invalid_mark_is_rejected(self):
+        response = self.client.get('/v1/api/sync/', {'tables': 'product', 'product': 'bm9wZQ=='})
+        self.assertEqual(response.status_code, 400)
+
+
+class TransferTests(InventoryFixtureMixin, TestCase):
+    def setUp(self):
+        StockTransaction.create_transactions([
+            dict(product=product, store=self.store, quantity=Decimal('10'), created_by=self.user)
+            for product in self.products
+        ])
+        self.first, self.second = self.products[0], self.products[1]
+        self.transfer = Transfer.create_draft(self.store, self.other_store, self.user,
+                                              {self.first: Decimal('4'), self.second: Decimal('6')})
+
+    def test_dispatch_then_partial_receipt(self):
+        self.transfer.dispatch(self.user)
+        self.assertEqual(self.transfer.status, TransferStatus.IN_TRANSIT)
+        self.assertEqual((self.quantity(self.first), self.quantity(self.second)), (Decimal('6'), Decimal('4')))
+        self.assertEqual(TransferLine.objects.in_transit(self.other_store),
+                         {(self.other_store.pk, self.first.pk): Decimal('4'),
+                          (self.other_store.pk, self.second.pk): Decimal('6')})
+
+        # one of the six was lost on the way
+        self.transfer.receive(self.user, {self.second: Decimal('5')})
+        self.assertEqual(self.transfer.status, TransferStatus.RECEIVED)
+        self.assertEqual((self.quantity(self.first, self.other_store), self.quantity(self.second, self.other_store)),
+                         (Decimal('4'), Decimal('5')))
+        self.assertEqual(TransferLine.objects.in_transit(), {})
+        self.assertEqual(StockTransaction.objects.filter(reference_type='XFER', reference_id=self.transfer.pk)
+                         .count(), 4)
+
+    def test_dispatch_and_receive_in_one_step(self):
+        self.transfer.dispatch(self.user, receive=True)
+        self.assertEqual(self.transfer.status, TransferStatus.RECEIVED)
+        self.assertEqual((self.quantity(self.second), self.quantity(self.second, self.other_store)),
+                         (Decimal('4'), Decimal('6')))
+
+    def test_dispatch_without_stock_changes_nothing(self):
+        TransferLine.objects.filter(transfer=self.transfer, product=self.first).update(quantity=Decimal('11'))
+        with self.assertRaises(ValidationError):
+            self.transfer.dispatch(self.user)
+        self.transfer.refresh_from_db()
+        self.assertEqual(self.transfer.status, TransferStatus.DRAFT)
+        self.assertEqual(self.quantity(self.second), Decimal('10'))
+
+    def test_receiving_more_than_dispatched_is_rejected(self):
+        self.transfer.dispatch(self.user)
+        with self.assertRaises(ValidationError):
+            self.transfer.receive(self.user, {self.first: Decimal('5')})
+        self.assertEqual(self.quantity(self.first, self.other_store), Decimal('0'))
 
-# Create your tests here.
+    def test_only_drafts_can_be_cancelled(self):
+        self.transfer.dispatch(self.user)
+        with self.assertRaises(ValidationError):
+            self.transfer.cancel()
+        draft = Transfer.create_draft(self.store, self.other_store, self.user, {self.first: Decimal('1')})
+        draft.cancel()
+        self.assertEqual(Transfer.objects.get(pk=draft.pk).status, TransferStatus.CANCELLED)
@@ -1,11 +1,19 @@
+from django.urls import path
 from rest_framework import routers
 
-from inventory.views import InventoryViewSet, StockTransactionViewSet
+from inventory.views import InventoryViewSet, StockTransactionViewSet, ScanAPIView, SyncAPIView, \
+    StockAlertViewSet, TransferViewSet, StocktakeViewSet
 
 app_name = 'inventory'
 router = routers.DefaultRouter()
 
 router.register("inventory", InventoryViewSet, basename="inventory")
 router.register("stock-transactions", StockTransactionViewSet, basename="stocktransaction")
+router.register("stock-alerts", StockAlertViewSet, basename="stockalert")
+router.register("transfers", TransferViewSet, basename="transfer")
+router.register("stocktakes", StocktakeViewSet, basename="stocktake")
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path("scan/<str:code>/", ScanAPIView.as_view(), name="scan"),
+    path("sync/", SyncAPIView.as_view(), name="sync"),
+]
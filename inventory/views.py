@@ -1,10 +1,29 @@
-from drf_spectacular.utils import extend_schema
+import uuid
+from itertools import chain
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import mixins, status
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from inventory.models import Inventory, StockTransaction
-from inventory.serializer import InventorySerializer, StockTransactionCreateSerializer, StockTransactionReadSerializer
+from OptiPOS.custompagination import LedgerCursorPagination
+from core.models import Store
+from core import catalog
+from inventory.models import Inventory, StockTransaction, StockAlert, Transfer, TransferLine, Stocktake
+from inventory.scan import lookup
+from inventory.stocktake import CountUploader
+from inventory.sync import SYNC_TABLES, CONF as SYNC_CONF, InvalidMark, changes, decode_mark, gzip_jsonl
+from inventory.serializer import InventorySerializer, StockTransactionCreateSerializer, StockTransactionReadSerializer, \
+    BalanceAtSerializer, BulkBalanceAtSerializer, StockHistorySerializer, BalanceSerializer, DailyBalanceSerializer, \
+    InventorySeedSerializer, InventoryBulkUpdateSerializer, StockAlertSerializer, TransferSerializer, \
+    TransferCreateSerializer, TransferDispatchSerializer, TransferReceiveSerializer, StocktakeSerializer, \
+    StocktakeCreateSerializer, StocktakeCountsSerializer, StocktakePostSerializer, StocktakeVarianceSerializer
 
 
 @extend_schema(tags=['Inventory'])
@@ -18,6 +37,297 @@ class InventoryViewSet(ModelViewSet):
     ordering_fields = ["updated_at", "quantity", "stock_alert"]
     ordering = ["-updated_at"]
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name="product", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name="store", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name="at", type=OpenApiTypes.DATETIME, location=OpenApiParameter.QUERY,
+                             description="Point in time (default: now)", required=False),
+        ],
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(detail=False, methods=["get"], url_path="balance-at")
+    def balance_at(self, request):
+        """Stock of a product in a store at a point in time, read from the ledger's cached balance_after."""
+        params = BalanceAtSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        product, store, at = (params.validated_data[k] for k in ("product", "store", "at"))
+        balance = StockTransaction.objects.balance_at(product, store, at)
+        return Response({"store": store.pk, "at": at,
+                         **BalanceSerializer({"product": product.pk, "balance": balance}).data})
+
+    @extend_schema(request=BulkBalanceAtSerializer, responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=["post"], url_path="balance-at/bulk", serializer_class=BulkBalanceAtSerializer)
+    def bulk_balance_at(self, request):
+        """balance-at for many products of one store in a single query."""
+        params = BulkBalanceAtSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        store, at = params.validated_data["store"], params.validated_data["at"]
+        balances = StockTransaction.objects.balances_at(params.validated_data["products"], store, at)
+        return Response({
+            "store": store.pk,
+            "at": at,
+            "balances": BalanceSerializer([{"product": pk, "balance": balance} for pk, balance in balances.items()],
+                                          many=True).data,
+        })
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name="product", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name="store", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name="start", type=OpenApiTypes.DATE, location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name="end", type=OpenApiTypes.DATE, location=OpenApiParameter.QUERY,
+                             description="Last day, inclusive (default: today)", required=False),
+        ],
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(detail=False, methods=["get"], url_path="stock-history")
+    def stock_history(self, request):
+        """Daily closing stock of a product in a store, for charts."""
+        params = StockHistorySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        product, store = params.validated_data["product"], params.validated_data["store"]
+        series = StockTransaction.objects.daily_balances(product, store, params.validated_data["start"],
+                                                         params.validated_data["end"])
+        return Response({
+            "product": product.pk,
+            "store": store.pk,
+            "series": DailyBalanceSerializer([{"date": day, "balance": balance} for day, balance in series],
+                                             many=True).data,
+        })
+
+    @extend_schema(request=InventorySeedSerializer, responses={201: OpenApiTypes.OBJECT})
+    @action(detail=False, methods=["post"], serializer_class=InventorySeedSerializer)
+    def seed(self, request):
+        """Create the missing inventory rows of a store for a product filter; opening stock is posted as COUNT."""
+        serializer = InventorySeedSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_201_CREATED)
+
+    @extend_schema(request=InventoryBulkUpdateSerializer, responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=["post"], url_path="bulk-update", serializer_class=InventoryBulkUpdateSerializer)
+    def bulk_update(self, request):
+        """Set stock_alert / discount / is_active on every matching row in a single UPDATE."""
+        serializer = InventoryBulkUpdateSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save())
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name="store", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY, required=False),
+        ],
+        responses=InventorySerializer(many=True),
+    )
+    @action(detail=False, methods=["get"], url_path="low-stock")
+    def low_stock(self, request):
+        """Active rows at or below their stock_alert (a 0 stock_alert is never low), read from a partial index."""
+        rows = Inventory.objects.low_stock().select_related("product", "store").order_by("store_id", "product_id")
+        store = request.query_params.get("store")
+        if store:
+            try:
+                rows = rows.filter(store=uuid.UUID(store))
+            except ValueError:
+                return Response({"store": ["A valid store UUID is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(InventorySerializer(page, many=True).data)
+        return Response(InventorySerializer(rows, many=True).data)
+
+
+@extend_schema(
+    tags=['Inventory'],
+    parameters=[
+        OpenApiParameter(name="store", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY, required=False),
+        OpenApiParameter(name="open", type=OpenApiTypes.BOOL, location=OpenApiParameter.QUERY,
+                         description="true: only unresolved alerts, false: only resolved ones", required=False),
+    ],
+)
+class StockAlertViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, GenericViewSet):
+    """Low-stock alerts raised by ledger movements crossing Inventory.stock_alert, newest first."""
+    queryset = StockAlert.objects.select_related("product", "store").all()
+    serializer_class = StockAlertSerializer
+    pagination_class = LedgerCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if params.get("store"):
+            try:
+                queryset = queryset.filter(store=uuid.UUID(params["store"]))
+            except ValueError:
+                queryset = queryset.none()
+        if params.get("open") in ("true", "1"):
+            queryset = queryset.filter(resolved_at__isnull=True)
+        elif params.get("open") in ("false", "0"):
+            queryset = queryset.filter(resolved_at__isnull=False)
+        return queryset
+
+
+@extend_schema(tags=['Transfers'])
+class TransferViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, GenericViewSet):
+    """Inter-store transfers: draft -> dispatch (TRANSFER_OUT) -> receive (TRANSFER_IN)."""
+    queryset = Transfer.objects.prefetch_related("lines").all()
+    serializer_class = TransferSerializer
+    pagination_class = LedgerCursorPagination
+
+    def get_serializer_class(self):
+        return TransferCreateSerializer if self.action == "create" else TransferSerializer
+
+    @extend_schema(request=TransferCreateSerializer, responses={201: TransferSerializer})
+    def create(self, request, *args, **kwargs):
+        serializer = TransferCreateSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        transfer = serializer.save()
+        return Response(TransferSerializer(self.get_queryset().get(pk=transfer.pk)).data,
+                        status=status.HTTP_201_CREATED)
+
+    def _step(self, request, step, serializer_class=None):
+        data = {}
+        if serializer_class is not None:
+            serializer = serializer_class(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
+        transfer = self.get_object()
+        try:
+            step(transfer, data)
+        except DjangoValidationError as exc:
+            return Response({"detail": exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TransferSerializer(self.get_queryset().get(pk=transfer.pk)).data)
+
+    @extend_schema(request=TransferDispatchSerializer, responses=TransferSerializer)
+    @action(detail=True, methods=["post"], url_path="dispatch", serializer_class=TransferDispatchSerializer)
+    def dispatch_transfer(self, request, pk=None):
+        """Post the TRANSFER_OUT legs of a draft (and with receive=true the TRANSFER_IN legs, in one batch)."""
+        return self._step(request, lambda transfer, data: transfer.dispatch(request.user, receive=data["receive"]),
+                          TransferDispatchSerializer)
+
+    @extend_schema(request=TransferReceiveSerializer, responses=TransferSerializer)
+    @action(detail=True, methods=["post"], serializer_class=TransferReceiveSerializer)
+    def receive(self, request, pk=None):
+        """Post the TRANSFER_IN legs of a transfer in transit, with the quantities that arrived."""
+        return self._step(request, lambda transfer, data: transfer.receive(request.user, data.get("lines")),
+                          TransferReceiveSerializer)
+
+    @extend_schema(request=None, responses=TransferSerializer)
+    @action(detail=True, methods=["post"])
+    def cancel(self, request, pk=None):
+        """Cancel a transfer that was not dispatched."""
+        return self._step(request, lambda transfer, data: transfer.cancel())
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name="store", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY,
+                             description="Destination store", required=False),
+        ],
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(detail=False, methods=["get"], url_path="in-transit")
+    def in_transit(self, request):
+        """Quantities dispatched to a store and not received yet, per product."""
+        store = request.query_params.get("store")
+        try:
+            store = uuid.UUID(store) if store else None
+        except ValueError:
+            return Response({"store": ["A valid store UUID is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response([{"store": store_id, "product": product_id, "quantity": str(quantity)}
+                         for (store_id, product_id), quantity in TransferLine.objects.in_transit(store).items()])
+
+
+@extend_schema(tags=['Stocktakes'])
+class StocktakeViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, GenericViewSet):
+    """Stocktake sessions: start (freeze stock) -> upload counts (any number of scanners) -> post variances."""
+    queryset = Stocktake.objects.select_related("store").order_by("-started_at")
+    serializer_class = StocktakeSerializer
+
+    def get_serializer_class(self):
+        return StocktakeCreateSerializer if self.action == "create" else StocktakeSerializer
+
+    @extend_schema(request=StocktakeCreateSerializer, responses={201: StocktakeSerializer})
+    def create(self, request, *args, **kwargs):
+        serializer = StocktakeCreateSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response(StocktakeSerializer(serializer.save()).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request={
+            "application/json": StocktakeCountsSerializer,
+            "multipart/form-data": {"type": "object", "properties": {
+                "file": {"type": "string", "format": "binary"}, "device": {"type": "string"}}},
+        },
+        parameters=[
+            OpenApiParameter(name="file_type", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             enum=catalog.FORMATS, description="csv or jsonl (default: from the file name)",
+                             required=False),
+        ],
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(detail=True, methods=["post"], parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def counts(self, request, pk=None):
+        """
+        Append scanned counts (sku or product, quantity), as a CSV / JSONL file or a JSON list.
+        Counts add up per product across uploads; bad rows are reported with their line number.
+        """
+        stocktake = self.get_object()
+        upload = request.FILES.get("file")
+        if upload is not None:
+            fmt = request.query_params.get("file_type") or catalog.guess_format(upload.name)
+            if fmt not in catalog.FORMATS:
+                return Response({"file_type": [f'Must be one of {", ".join(catalog.FORMATS)}.']},
+                                status=status.HTTP_400_BAD_REQUEST)
+            device, rows = request.data.get("device", ""), catalog.read_rows(upload, fmt)
+        else:
+            serializer = StocktakeCountsSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            device = serializer.validated_data["device"]
+            rows = enumerate(serializer.validated_data["counts"], start=1)
+        try:
+            return Response(CountUploader(stocktake, device=device).run(rows))
+        except DjangoValidationError as exc:
+            return Response({"detail": exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name="zero_uncounted", type=OpenApiTypes.BOOL, location=OpenApiParameter.QUERY,
+                             required=False),
+        ],
+        responses=StocktakeVarianceSerializer(many=True),
+    )
+    @action(detail=True, methods=["get"])
+    def variance(self, request, pk=None):
+        """Preview of what posting would book: products whose merged count differs from the frozen stock."""
+        zero_uncounted = request.query_params.get("zero_uncounted") in ("true", "1")
+        rows = [{"product": product_id, "frozen": frozen, "counted": counted, "variance": variance}
+                for product_id, (frozen, counted, variance) in self.get_object().variances(zero_uncounted).items()
+                if variance]
+        return Response(StocktakeVarianceSerializer(rows, many=True).data)
+
+    @extend_schema(request=StocktakePostSerializer, responses=StocktakeSerializer)
+    @action(detail=True, methods=["post"], url_path="post", serializer_class=StocktakePostSerializer)
+    def post_variances(self, request, pk=None):
+        """
+        Book every variance (counted - frozen) as a COUNT movement in one ledger batch, on top of
+        the current stock, so sales made during the count are kept.
+        """
+        serializer = StocktakePostSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        stocktake = self.get_object()
+        try:
+            stocktake.post(request.user, zero_uncounted=serializer.validated_data["zero_uncounted"])
+        except DjangoValidationError as exc:
+            return Response({"detail": exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(StocktakeSerializer(stocktake).data)
+
+    @extend_schema(request=None, responses=StocktakeSerializer)
+    @action(detail=True, methods=["post"])
+    def cancel(self, request, pk=None):
+        """Close an open stocktake without booking anything."""
+        stocktake = self.get_object()
+        try:
+            stocktake.cancel()
+        except DjangoValidationError as exc:
+            return Response({"detail": exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(StocktakeSerializer(stocktake).data)
+
 
 @extend_schema(tags=['Stock Transactions'])
 class StockTransactionViewSet(mixins.CreateModelMixin,
@@ -29,8 +339,10 @@ class StockTransactionViewSet(mixins.CreateModelMixin,
     # filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     # filterset_fields = ["product", "store", "movement_type", "created_by", "reference_type", "reference_id"]
     search_fields = ["note", "product__name", "store__name", "reference_type"]
-    ordering_fields = ["created_at", "quantity", "movement_type"]
+    # keyset pages need a unique, monotonic order: (created_at, id), see LedgerCursorPagination
+    ordering_fields = ["created_at"]
     ordering = ["-created_at"]
+    pagination_class = LedgerCursorPagination
 
     def get_serializer_class(self):
         return StockTransactionCreateSerializer if self.action == "create" else StockTransactionReadSerializer
@@ -43,4 +355,74 @@ class StockTransactionViewSet(mixins.CreateModelMixin,
         return Response({"detail": "Method not allowed."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
     def destroy(self, request, *args, **kwargs):
-        return Response({"detail": "Method not allowed."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
\ No newline at end of file
+        return Response({"detail": "Method not allowed."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+@extend_schema(
+    tags=['Inventory'],
+    parameters=[
+        OpenApiParameter(name="store", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY, required=True),
+    ],
+    responses=OpenApiTypes.OBJECT,
+)
+class ScanAPIView(APIView):
+    """
+    Till barcode scan: SKU -> product, the store's discount and stock, in one (cached) query.
+    """
+
+    def get(self, request, code):
+        store = request.query_params.get("store")
+        try:
+            store = uuid.UUID(store)
+        except (TypeError, ValueError):
+            return Response({"store": ["A valid store UUID is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        data = lookup(store, code)
+        if data is None:
+            return Response({"detail": "Unknown SKU."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+
+@extend_schema(
+    tags=['Sync'],
+    parameters=[
+        OpenApiParameter(name="tables", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                         description=f"Comma separated, default: {','.join(SYNC_TABLES)}", required=False),
+        OpenApiParameter(name="store", type=OpenApiTypes.UUID, location=OpenApiParameter.QUERY,
+                         description="Required for store-scoped tables (inventory)", required=False),
+        *[OpenApiParameter(name=name, type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                           description=f"High-water mark of {name} from the previous pull; omit for a full pull",
+                           required=False) for name in SYNC_TABLES],
+        OpenApiParameter(name="page_size", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False),
+    ],
+    responses={(200, 'application/x-ndjson'): OpenApiTypes.BINARY},
+)
+class SyncAPIView(APIView):
+    """
+    Rows changed since the client's per-table high-water marks, as gzipped JSON lines:
+    {"table", "op": "upsert", "row"} / {"table", "op": "delete", "id"}, then one
+    {"table", "next", "more"} per table. Pull again with `next` while `more` is true.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        names = [name for name in params.get("tables", ",".join(SYNC_TABLES)).split(",") if name]
+        unknown = [name for name in names if name not in SYNC_TABLES]
+        if unknown or not names:
+            return Response({"tables": [f"Choose from {', '.join(SYNC_TABLES)}."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        store = None
+        if any(SYNC_TABLES[name].store_scoped for name in names):
+            try:
+                store = Store.objects.get(pk=uuid.UUID(params.get("store", "")))
+            except (ValueError, Store.DoesNotExist):
+                return Response({"store": ["A valid store is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page_size = min(max(int(params.get("page_size", SYNC_CONF["PAGE_SIZE"])), 1), SYNC_CONF["MAX_PAGE_SIZE"])
+            marks = {name: decode_mark(params.get(name)) for name in names}
+        except (ValueError, InvalidMark) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        records = chain.from_iterable(changes(name, marks[name], store, page_size) for name in names)
+        response = StreamingHttpResponse(gzip_jsonl(records), content_type="application/x-ndjson")
+        response["Content-Encoding"] = "gzip"
+        return response
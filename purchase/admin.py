@@ -1,9 +1,36 @@
 from django.contrib import admin
 
-from purchase.models import Supplier, PurchaseOrder, PurchaseOrderLine, PurchaseReceipt
+from purchase.models import Supplier, PurchaseOrder, PurchaseOrderLine, PurchaseReceipt, \
+    PurchaseReceiptLine
 
 # Register your models here.
 admin.site.register(Supplier)
-admin.site.register(PurchaseOrder)
-admin.site.register(PurchaseOrderLine)
-admin.site.register(PurchaseReceipt)
+
+
+@admin.register(PurchaseOrder)
+class PurchaseOrderAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'store', 'status', 'total', 'order_date')
+    list_select_related = ('supplier', 'store')
+    list_filter = ('status',)
+    raw_id_fields = ('supplier', 'store')
+
+
+@admin.register(PurchaseOrderLine)
+class PurchaseOrderLineAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'purchase', 'unit_price', 'line_total', 'received_quantity')
+    list_select_related = ('product', 'purchase__supplier')
+    raw_id_fields = ('purchase', 'product')
+
+
+@admin.register(PurchaseReceipt)
+class PurchaseReceiptAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'store', 'received_by', 'received_at')
+    list_select_related = ('store', 'received_by')
+    raw_id_fields = ('purchase', 'store', 'received_by')
+
+
+@admin.register(PurchaseReceiptLine)
+class PurchaseReceiptLineAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'receipt', 'unit_cost')
+    list_select_related = ('product',)
+    raw_id_fields = ('receipt', 'order_line', 'product')
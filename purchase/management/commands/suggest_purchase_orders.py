@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Store
+from purchase import replenishment
+
+
+class Command(BaseCommand):
+    help = "Suggest replenishment quantities from sales velocity and create draft (PENDING) purchase orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', action='append', help="Only this store id (repeatable; default: all).")
+        parser.add_argument('--workers', type=int, default=4, help="Stores planned in parallel.")
+        parser.add_argument('--dry-run', action='store_true', help="Print the suggestions, create no orders.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stores = Store.objects.filter(pk__in=options['store']) if options['store'] else None
+        suggestions = replenishment.plan(stores, workers=options['workers'])
+        unassigned = [suggestion for suggestion in suggestions if suggestion.supplier_id is None]
+
+        if options['dry_run']:
+            for suggestion in suggestions:
+                self.stdout.write(f"{suggestion.store_id} {suggestion.product_id} on_hand={suggestion.on_hand} "
+                                  f"on_order={suggestion.on_order} velocity={suggestion.velocity:.3f}/day "
+                                  f"cover={suggestion.days_of_cover:.1f}d order={suggestion.quantity} "
+                                  f"supplier={suggestion.supplier_id}")
+            orders = []
+        else:
+            orders = replenishment.create_drafts(suggestions)
+
+        if unassigned:
+            self.stdout.write(self.style.WARNING(f"{len(unassigned)} products have no supplier (never purchased)"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(suggestions)} suggestions, {len(orders)} draft orders in {time.monotonic() - started:.1f}s"))
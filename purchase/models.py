@@ -2,11 +2,15 @@ import uuid
 from decimal import Decimal
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Count, DecimalField, IntegerField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from core.models import Product, Store
+from inventory.locking import inventory_locks
 from inventory.models import StockTransaction, MovementType
 
 
@@ -25,10 +29,50 @@ class Supplier(models.Model):
 class PurchaseOrderStatus(models.TextChoices):
     PENDING = "PENDING", "Pending"
     ORDERED = "ORDERED", "Ordered"
+    PARTIALLY_RECEIVED = "PARTIALLY_RECEIVED", "Partially received"
     RECEIVED = "RECEIVED", "Received"
     CANCELLED = "CANCELLED", "Cancelled"
 
 
+class PurchaseOrderQuerySet(models.QuerySet):
+    @staticmethod
+    def _line_totals():
+        """
+        (subtotal, vat) expressions aggregated from the order's lines.
+        """
+        lines = PurchaseOrderLine.objects.filter(purchase=OuterRef('pk')).order_by().values('purchase')
+        amount = DecimalField(max_digits=18, decimal_places=6)
+        subtotal = Coalesce(Subquery(lines.annotate(s=Sum('line_total')).values('s')), Decimal('0'),
+                            output_field=amount)
+        vat = Coalesce(Subquery(lines.annotate(s=Sum('vat')).values('s')), Decimal('0'), output_field=amount)
+        return subtotal, vat
+
+    def with_totals(self):
+        """
+        Annotate line_count next to the stored subtotal / vat / total with a correlated subquery,
+        so a page of orders is a single query.
+        """
+        line_count = PurchaseOrderLine.objects.filter(purchase=OuterRef('pk')).order_by().values('purchase') \
+            .annotate(c=Count('pk')).values('c')
+        return self.annotate(line_count=Coalesce(Subquery(line_count), 0, output_field=IntegerField()))
+
+    def out_of_sync_totals(self):
+        """
+        Orders whose stored totals differ from their lines.
+        """
+        subtotal, vat = self._line_totals()
+        return self.alias(computed_subtotal=subtotal, computed_vat=vat).exclude(
+            subtotal=F('computed_subtotal'), vat=F('computed_vat'),
+            total=F('computed_subtotal') + F('computed_vat'))
+
+    def recalculate_totals(self):
+        """
+        Recompute the stored subtotal / vat / total from the lines in a single UPDATE.
+        """
+        subtotal, vat = self._line_totals()
+        return self.update(subtotal=subtotal, vat=vat, total=subtotal + vat)
+
+
 class PurchaseOrder(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     supplier = models.ForeignKey(Supplier, on_delete=models.PROTECT, related_name='purchase_orders')
@@ -39,6 +83,12 @@ class PurchaseOrder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     notes = models.TextField(blank=True)
+    # denormalized from the lines, kept in sync by PurchaseOrderLine (see PurchaseOrderQuerySet.recalculate_totals)
+    subtotal = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), editable=False)
+    vat = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), editable=False)
+    total = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), editable=False)
+
+    objects = PurchaseOrderQuerySet.as_manager()
 
     class Meta:
         indexes = [models.Index(fields=["supplier", "store", "status"])]
@@ -46,17 +96,30 @@ class PurchaseOrder(models.Model):
     def __str__(self):
         return f"PO {self.id} - {self.supplier.name}"
 
-    @property
-    def subtotal(self):
-        return sum([line.line_total for line in self.lines.all()]) if self.lines.exists() else Decimal('0')
-
     @property
     def total_vat(self):
-        return sum([line.vat for line in self.lines.all()]) if self.lines.exists() else Decimal('0')
+        return self.vat
 
-    @property
-    def total(self):
-        return self.subtotal + self.total_vat
+
+class PurchaseOrderLineQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for line in objs:
+            line.calculate_totals()
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            PurchaseOrder.objects.filter(pk__in={line.purchase_id for line in objs}).recalculate_totals()
+        return created
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            purchase_ids = set(self.values_list('purchase_id', flat=True))
+            deleted = super().delete()
+            PurchaseOrder.objects.filter(pk__in=purchase_ids).recalculate_totals()
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class PurchaseOrderLine(models.Model):
@@ -66,14 +129,33 @@ class PurchaseOrderLine(models.Model):
     unit_price = models.DecimalField(max_digits=14, decimal_places=4, validators=[MinValueValidator(0)])
     vat = models.DecimalField(max_digits=14, decimal_places=4, default=Decimal('0'))
     line_total = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    # sum of the PurchaseReceiptLines, kept by PurchaseReceipt.apply_to_inventory
+    received_quantity = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), editable=False)
 
-    def save(self, *args, **kwargs):
+    objects = PurchaseOrderLineQuerySet.as_manager()
+
+    def calculate_totals(self):
         self.line_total = (self.unit_price * self.quantity) + (self.vat or Decimal('0'))
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.calculate_totals()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            PurchaseOrder.objects.filter(pk=self.purchase_id).recalculate_totals()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            PurchaseOrder.objects.filter(pk=self.purchase_id).recalculate_totals()
+        return deleted
 
     def __str__(self):
         return f"{self.product.sku} x {self.quantity}"
 
+    @property
+    def outstanding_quantity(self):
+        return max(self.quantity - self.received_quantity, Decimal('0'))
+
 
 class PurchaseReceipt(models.Model):
     """
@@ -88,24 +170,97 @@ class PurchaseReceipt(models.Model):
     notes = models.TextField(blank=True)
 
     def __str__(self):
-        return f"Receipt {self.id} for PO {self.purchase.id}"
+        return f"Receipt {self.id} for PO {self.purchase_id}"
+
+    @classmethod
+    @inventory_locks.retrying
+    def receive(cls, purchase, received_by, lines=None, store=None, notes=''):
+        """
+        Record a delivery against `purchase` and post it to the stock ledger.
+        `lines` maps PurchaseOrderLines (or their ids) to the quantity delivered; None receives
+        everything still outstanding. Returns the receipt.
+        The whole transaction (receipt row included) is retried on deadlocks / serialization failures.
+        """
+        with transaction.atomic():
+            receipt = cls.objects.create(purchase=purchase, store=store or purchase.store, received_by=received_by,
+                                         notes=notes)
+            receipt.apply_to_inventory(lines)
+            return receipt
 
-    def apply_to_inventory(self):
+    def apply_to_inventory(self, lines=None):
         """
-        Create StockTransaction entries for each purchased line (atomic).
+        Create one PurchaseReceiptLine per delivered order line, post them in one batched ledger write
+        (reference RCPT / receipt line, so any number of receipts per order can be posted), add them to
+        the lines' received_quantity and move the order to PARTIALLY_RECEIVED or RECEIVED.
+        `lines` is as for receive(). Returns the created StockTransactions.
         """
         with transaction.atomic():
-            lines = self.purchase.lines.select_related('product').all()
-            for line in lines:
-                # increase stock by the purchased quantity
-                StockTransaction.create_transaction(
-                    product=line.product,
-                    store=self.store,
-                    quantity=line.quantity,
-                    unit_cost=line.unit_price,
-                    movement_type=MovementType.RECEIPT,
-                    created_by=self.received_by,
-                    reference_type='PO',
-                    reference_id=self.purchase.id,
-                    note=f"Receipt for PO {self.purchase.id}"
-                )
+            # concurrent receipts of the same order queue here instead of over-receiving
+            purchase = PurchaseOrder.objects.select_for_update().get(pk=self.purchase_id)
+            if purchase.status in (PurchaseOrderStatus.RECEIVED, PurchaseOrderStatus.CANCELLED):
+                raise ValidationError(f"Purchase order is {purchase.get_status_display().lower()}.")
+
+            order_lines = {line.pk: line for line in purchase.lines.select_related('product')}
+            if lines is None:
+                lines = {pk: line.outstanding_quantity for pk, line in order_lines.items()}
+            delivered = {}
+            for line, quantity in lines.items():
+                line = order_lines.get(getattr(line, 'pk', line))
+                if line is None:
+                    raise ValidationError("Line does not belong to this purchase order.")
+                quantity = Decimal(quantity)
+                if quantity < 0 or quantity > line.outstanding_quantity:
+                    raise ValidationError(f"{line.product.sku}: between 0 and "
+                                          f"{line.outstanding_quantity.normalize():f} can be received.")
+                if quantity:
+                    delivered[line] = quantity
+            if not delivered:
+                raise ValidationError("Nothing to receive.")
+
+            receipt_lines = PurchaseReceiptLine.objects.bulk_create([
+                PurchaseReceiptLine(receipt=self, order_line=line, product=line.product, quantity=quantity,
+                                    unit_cost=line.unit_price)
+                for line, quantity in delivered.items()
+            ])
+            txs = StockTransaction.create_transactions([line.ledger_line(self) for line in receipt_lines])
+
+            for line, quantity in delivered.items():
+                line.received_quantity += quantity
+            PurchaseOrderLine.objects.bulk_update(delivered, ['received_quantity'])
+
+            complete = all(line.received_quantity >= line.quantity for line in order_lines.values())
+            purchase.status = PurchaseOrderStatus.RECEIVED if complete else PurchaseOrderStatus.PARTIALLY_RECEIVED
+            purchase.save(update_fields=['status', 'updated_at'])
+            self.purchase = purchase
+            return txs
+
+
+class PurchaseReceiptLine(models.Model):
+    """
+    Quantity of one purchase order line delivered with a receipt; posted to the ledger on its own key.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    receipt = models.ForeignKey(PurchaseReceipt, on_delete=models.CASCADE, related_name='lines')
+    order_line = models.ForeignKey(PurchaseOrderLine, on_delete=models.PROTECT, related_name='receipt_lines')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+')
+    quantity = models.DecimalField(max_digits=18, decimal_places=6, validators=[MinValueValidator(Decimal('0.000001'))])
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4, validators=[MinValueValidator(0)])
+
+    def __str__(self):
+        return f"{self.product.sku} x {self.quantity} (Receipt {self.receipt_id})"
+
+    def ledger_line(self, receipt):
+        """
+        StockTransaction.create_transactions kwargs for this line (inflow).
+        """
+        return dict(
+            product=self.product,
+            store=receipt.store,
+            quantity=self.quantity,
+            unit_cost=self.unit_cost,
+            movement_type=MovementType.RECEIPT,
+            created_by=receipt.received_by,
+            reference_type='RCPT',
+            reference_id=self.id,
+            note=f"Receipt {receipt.id} for PO {receipt.purchase_id}",
+        )
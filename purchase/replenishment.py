@@ -0,0 +1,187 @@
+"""
+Replenishment suggestions: draft purchase orders from sales velocity and stock on hand.
+
+Per (store, product) the demand velocity is a weighted mean of the ISSUE quantities of the last
+REPLENISHMENT["WINDOWS"] days, summed by the database in one grouped pass over the ledger.
+A product needs ordering when its stock plus what is already on open purchase orders does not
+cover the lead time plus the review period (or is below its stock_alert); the suggested quantity
+tops it up to that cover plus stock_alert as safety stock. Lines are grouped into one
+draft (PENDING) order per store and supplier, the supplier being the one the product was last
+bought from.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+from core.models import Product, Store
+from inventory.models import Inventory, MovementType, StockTransaction
+from purchase.models import PurchaseOrder, PurchaseOrderLine, PurchaseOrderStatus
+
+DEFAULTS = {
+    "WINDOWS": (7, 28, 90),  # days
+    "WEIGHTS": (0.5, 0.3, 0.2),  # recent demand counts most
+    "LEAD_TIME_DAYS": 7,
+    "REVIEW_DAYS": 14,  # cover until the next run
+}
+CONF = {**DEFAULTS, **getattr(settings, "REPLENISHMENT", {})}
+CHUNK = 500
+VAT_PRECISION = Decimal('0.0001')
+OPEN_STATUSES = (PurchaseOrderStatus.PENDING, PurchaseOrderStatus.ORDERED, PurchaseOrderStatus.PARTIALLY_RECEIVED)
+
+
+@dataclass
+class Suggestion:
+    store_id: object
+    product_id: object
+    on_hand: Decimal
+    on_order: Decimal
+    velocity: float  # units per day
+    days_of_cover: float  # math.inf without demand
+    quantity: Decimal
+    supplier_id: object = None
+    unit_price: Decimal = None
+
+
+def velocities(store_ids, now=None):
+    """
+    {(store_id, product_id): units per day} from the ISSUE movements of the longest window.
+    Windows are nested, so every movement weighs a constant per age bucket (the sum of weight / days
+    of the windows it falls in); the weighted mean is then a single SUM per group, computed by the database.
+    """
+    now = now or timezone.now()
+    windows = sorted(zip(CONF["WINDOWS"], CONF["WEIGHTS"]))
+    buckets = [When(created_at__gte=now - timedelta(days=days),
+                    then=Value(sum(weight / length for length, weight in windows[index:])))
+               for index, (days, _) in enumerate(windows)]
+    rows = StockTransaction.objects.filter(
+        store_id__in=store_ids, movement_type=MovementType.ISSUE,
+        created_at__gte=now - timedelta(days=windows[-1][0]), created_at__lt=now,
+    ).order_by().values_list("store_id", "product_id").annotate(
+        # issues are negative quantities
+        velocity=Sum(Case(*buckets, output_field=FloatField()) * -Cast("quantity", FloatField())),
+    )
+    return {(store_id, product_id): velocity for store_id, product_id, velocity in rows.iterator(chunk_size=5000)}
+
+
+def on_order(store_ids):
+    """
+    {(store_id, product_id): quantity} still to be delivered on open purchase orders.
+    An over-received line counts as 0, not as a negative that would eat into the other lines.
+    """
+    outstanding = Greatest(F("quantity") - F("received_quantity"), Value(Decimal("0")),
+                           output_field=PurchaseOrderLine._meta.get_field("quantity"))
+    rows = PurchaseOrderLine.objects.filter(purchase__store_id__in=store_ids, purchase__status__in=OPEN_STATUSES) \
+        .order_by().values("purchase__store_id", "product_id") \
+        .annotate(quantity=Sum(outstanding))
+    return {(row["purchase__store_id"], row["product_id"]): row["quantity"] for row in rows}
+
+
+def suggest(store_id, now=None):
+    """
+    Suggestions of one store, without supplier; see the module docstring for the rule.
+    """
+    velocity = velocities([store_id], now)
+    ordered = on_order([store_id])
+    horizon = CONF["LEAD_TIME_DAYS"] + CONF["REVIEW_DAYS"]
+    suggestions = []
+    rows = Inventory.objects.filter(store_id=store_id, is_active=True, product__is_active=True) \
+        .values_list("product_id", "quantity", "stock_alert")
+    for product_id, quantity, stock_alert in rows.iterator(chunk_size=5000):
+        per_day = velocity.get((store_id, product_id), 0.0)
+        if not per_day and not stock_alert:
+            continue
+        pending = ordered.get((store_id, product_id), Decimal("0"))
+        available = float(quantity + pending)
+        cover = available / per_day if per_day else math.inf
+        if cover >= horizon and available > float(stock_alert):
+            continue
+        needed = math.ceil(per_day * horizon + float(stock_alert) - available)
+        if needed > 0:
+            suggestions.append(Suggestion(store_id, product_id, quantity, pending, per_day,
+                                          float(quantity) / per_day if per_day else math.inf, Decimal(needed)))
+    return suggestions
+
+
+def assign_suppliers(suggestions):
+    """
+    Fill supplier_id / unit_price from the product's most recent purchase order line (any store,
+    cancelled orders ignored), falling back to the product's unit_cost for the price.
+    Suggestions for products never bought keep supplier_id None.
+    """
+    product_ids = list({suggestion.product_id for suggestion in suggestions})
+    last_lines = PurchaseOrderLine.objects.filter(product=OuterRef("pk")) \
+        .exclude(purchase__status=PurchaseOrderStatus.CANCELLED) \
+        .order_by("-purchase__order_date", "-purchase__created_at")
+    sources = {}
+    for start in range(0, len(product_ids), CHUNK):
+        sources.update({
+            pk: (supplier_id, unit_price if unit_price is not None else unit_cost)
+            for pk, supplier_id, unit_price, unit_cost in Product.objects.filter(pk__in=product_ids[start:start + CHUNK])
+            .annotate(last_supplier=Subquery(last_lines.values("purchase__supplier_id")[:1]),
+                      last_price=Subquery(last_lines.values("unit_price")[:1]))
+            .values_list("pk", "last_supplier", "last_price", "unit_cost")
+        })
+    for suggestion in suggestions:
+        suggestion.supplier_id, suggestion.unit_price = sources.get(suggestion.product_id, (None, None))
+    return suggestions
+
+
+def _suggest_in_thread(store_id, now):
+    try:
+        return suggest(store_id, now)
+    finally:
+        # worker threads get their own connections; don't leave them open
+        connections.close_all()
+
+
+def plan(stores=None, workers=4, now=None):
+    """
+    Suggestions for `stores` (default: all), one store per worker thread, with suppliers assigned.
+    """
+    store_ids = [store.pk for store in stores] if stores is not None else list(Store.objects.values_list("pk", flat=True))
+    now = now or timezone.now()
+    if workers > 1 and len(store_ids) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            per_store = list(executor.map(lambda pk: _suggest_in_thread(pk, now), store_ids))
+    else:
+        per_store = [suggest(pk, now) for pk in store_ids]
+    return assign_suppliers([suggestion for suggestions in per_store for suggestion in suggestions])
+
+
+def create_drafts(suggestions, notes="Replenishment suggestion"):
+    """
+    One PENDING purchase order per (store, supplier) with a line per suggestion, in bulk.
+    Suggestions without supplier are skipped. Returns the created orders.
+    """
+    groups = {}
+    for suggestion in suggestions:
+        if suggestion.supplier_id is not None:
+            groups.setdefault((suggestion.store_id, suggestion.supplier_id), []).append(suggestion)
+    if not groups:
+        return []
+
+    products = Product.objects.in_bulk({suggestion.product_id for group in groups.values() for suggestion in group})
+    with transaction.atomic():
+        orders = PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(store_id=store_id, supplier_id=supplier_id, status=PurchaseOrderStatus.PENDING, notes=notes)
+            for store_id, supplier_id in groups
+        ])
+        lines = []
+        for order, group in zip(orders, groups.values()):
+            for suggestion in group:
+                product = products[suggestion.product_id]
+                unit_price = suggestion.unit_price or Decimal("0")
+                vat = (unit_price * suggestion.quantity * (product.tax_rate or 0) / 100).quantize(VAT_PRECISION)
+                lines.append(PurchaseOrderLine(purchase=order, product=product, quantity=suggestion.quantity,
+                                               unit_price=unit_price, vat=vat))
+        # totals of the orders are recalculated by PurchaseOrderLineQuerySet.bulk_create
+        PurchaseOrderLine.objects.bulk_create(lines, batch_size=1000)
+    return orders
@@ -1,5 +1,8 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from purchase.models import Supplier, PurchaseOrder, PurchaseOrderLine
+
+from core.models import Store
+from purchase.models import Supplier, PurchaseOrder, PurchaseOrderLine, PurchaseReceipt, PurchaseReceiptLine
 
 
 class SupplierSerializer(serializers.ModelSerializer):
@@ -10,6 +13,9 @@ class SupplierSerializer(serializers.ModelSerializer):
 
 
 class PurchaseOrderSerializer(serializers.ModelSerializer):
+    # annotated by PurchaseOrderQuerySet.with_totals()
+    line_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = PurchaseOrder
         fields = '__all__'
@@ -21,3 +27,50 @@ class PurchasedItemSerializer(serializers.ModelSerializer):
         model = PurchaseOrderLine
         fields = '__all__'
         read_only_fields = ('id',)
+
+
+class PurchaseReceiptLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PurchaseReceiptLine
+        fields = ('id', 'order_line', 'product', 'quantity', 'unit_cost')
+
+
+class PurchaseReceiptSerializer(serializers.ModelSerializer):
+    lines = PurchaseReceiptLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = PurchaseReceipt
+        fields = ('id', 'purchase', 'store', 'received_at', 'received_by', 'notes', 'lines')
+        read_only_fields = fields
+
+
+class ReceiveLineSerializer(serializers.Serializer):
+    line = serializers.IntegerField(help_text="PurchaseOrderLine id")
+    quantity = serializers.DecimalField(max_digits=18, decimal_places=6, min_value=0)
+
+
+class ReceiveSerializer(serializers.Serializer):
+    """
+    A delivery against the purchase order in the context; without lines, everything outstanding is received.
+    """
+    lines = ReceiveLineSerializer(many=True, required=False)
+    store = serializers.PrimaryKeyRelatedField(queryset=Store.objects.all(), required=False,
+                                               help_text="Receiving store (default: the order's store)")
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_lines(self, lines):
+        ids = [line['line'] for line in lines]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each line can be given once.")
+        return lines
+
+    def create(self, validated_data):
+        lines = validated_data.get('lines')
+        try:
+            return PurchaseReceipt.receive(
+                self.context['purchase'], self.context['request'].user,
+                lines=None if lines is None else {line['line']: line['quantity'] for line in lines},
+                store=validated_data.get('store'), notes=validated_data['notes'],
+            )
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({'detail': exc.messages})
@@ -1,3 +1,114 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase
+
+from core.models import Store, Category, Brand, Product
+from inventory.locking import inventory_locks
+from inventory.models import Inventory, StockTransaction
+from purchase.models import Supplier, PurchaseOrder, PurchaseOrderLine, PurchaseOrderStatus, PurchaseReceipt
+from purchase.replenishment import on_order
+from user.models import User
+
+
+class PurchaseFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='buyer', role='Admin')
+        cls.store = Store.objects.create(name='Main', creator=cls.user)
+        cls.supplier = Supplier.objects.create(name='Wholesale')
+        category = Category.objects.create(name='Grocery')
+        brand = Brand.objects.create(name='Acme')
+        cls.products = Product.objects.bulk_create([
+            Product(sku=f'SKU-{i}', name=f'Product {i}', category=category, brand=brand, unit_price=Decimal('10'),
+                    unit_cost=Decimal('6'), tax_method='exclusive')
+            for i in range(2)
+        ])
+
+    def order(self, *quantities, product=None, status=PurchaseOrderStatus.ORDERED):
+        purchase = PurchaseOrder.objects.create(supplier=self.supplier, store=self.store, status=status)
+        PurchaseOrderLine.objects.bulk_create([
+            PurchaseOrderLine(purchase=purchase, product=product or self.products[index], quantity=Decimal(quantity),
+                              unit_price=Decimal('6'))
+            for index, quantity in enumerate(quantities)
+        ])
+        return purchase
+
+
+class OnOrderTests(PurchaseFixtureMixin, TestCase):
+    def test_over_received_line_does_not_reduce_the_other_lines(self):
+        product = self.products[0]
+        purchase = self.order('10', '10', product=product)
+        first, second = purchase.lines.order_by('pk')
+        PurchaseOrderLine.objects.filter(pk=first.pk).update(received_quantity=Decimal('15'))
+        PurchaseOrderLine.objects.filter(pk=second.pk).update(received_quantity=Decimal('4'))
+
+        self.assertEqual(on_order([self.store.pk]), {(self.store.pk, product.pk): Decimal('6')})
+
+    def test_closed_orders_are_not_on_order(self):
+        self.order('5', status=PurchaseOrderStatus.RECEIVED)
+        self.order('3')
+        self.assertEqual(on_order([self.store.pk]), {(self.store.pk, self.products[0].pk): Decimal('3')})
+
+
+class ReceiptTests(PurchaseFixtureMixin, TestCase):
+    def quantity(self, product):
+        return Inventory.objects.get(product=product, store=self.store).quantity
+
+    def test_partial_receipts_until_complete(self):
+        purchase = self.order('10', '4')
+        first, second = purchase.lines.order_by('pk')
+
+        PurchaseReceipt.receive(purchase, self.user, lines={first.pk: Decimal('6')})
+        purchase.refresh_from_db()
+        self.assertEqual(purchase.status, PurchaseOrderStatus.PARTIALLY_RECEIVED)
+        self.assertEqual(self.quantity(self.products[0]), Decimal('6'))
+
+        # the rest of every line
+        PurchaseReceipt.receive(purchase, self.user)
+        purchase.refresh_from_db()
+        self.assertEqual(purchase.status, PurchaseOrderStatus.RECEIVED)
+        self.assertEqual((self.quantity(self.products[0]), self.quantity(self.products[1])),
+                         (Decimal('10'), Decimal('4')))
+        self.assertEqual(StockTransaction.objects.filter(reference_type='RCPT').count(), 3)
+
+    def test_two_lines_of_the_same_product_post_separately(self):
+        purchase = self.order('2', '3', product=self.products[0])
+        PurchaseReceipt.receive(purchase, self.user)
+        self.assertEqual(self.quantity(self.products[0]), Decimal('5'))
+
+    def test_over_receiving_is_rejected(self):
+        purchase = self.order('5')
+        line = purchase.lines.get()
+        with self.assertRaises(ValidationError):
+            PurchaseReceipt.receive(purchase, self.user, lines={line.pk: Decimal('6')})
+        self.assertFalse(PurchaseReceipt.objects.exists())
+
+
+class ReceiptRetryTests(PurchaseFixtureMixin, TransactionTestCase):
+    def setUp(self):
+        # TransactionTestCase has no setUpTestData
+        self.setUpTestData()
+
+    def test_deadlock_retries_the_whole_receipt(self):
+        purchase = self.order('5')
+        apply = PurchaseReceipt.apply_to_inventory
+        calls = []
+
+        def deadlock_once(receipt, lines=None):
+            calls.append(receipt.pk)
+            if len(calls) == 1:
+                raise OperationalError("deadlock detected")
+            return apply(receipt, lines)
+
+        with mock.patch.object(PurchaseReceipt, 'apply_to_inventory', deadlock_once), \
+                mock.patch.object(inventory_locks, 'backoff', return_value=0), \
+                self.assertLogs('inventory.locking', 'WARNING'):
+            receipt = PurchaseReceipt.receive(purchase, self.user)
+
+        self.assertEqual(len(calls), 2)
+        # the first attempt's receipt row was rolled back with it
+        self.assertEqual(list(PurchaseReceipt.objects.values_list('pk', flat=True)), [receipt.pk])
+        self.assertEqual(Inventory.objects.get(product=self.products[0]).quantity, Decimal('5'))
@@ -1,8 +1,12 @@
 from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
 from purchase.models import Supplier, PurchaseOrder
-from purchase.serializer import SupplierSerializer, PurchaseOrderSerializer
+from purchase.serializer import SupplierSerializer, PurchaseOrderSerializer, ReceiveSerializer, \
+    PurchaseReceiptSerializer
 
 
 # Create your views here.
@@ -14,5 +18,18 @@ class SupplierAPIView(ModelViewSet):
 
 @extend_schema(tags=['Purchase Order'])
 class PurchaseOrderAPIView(ModelViewSet):
-    queryset = PurchaseOrder.objects.all()
+    queryset = PurchaseOrder.objects.with_totals()
     serializer_class = PurchaseOrderSerializer
+
+    @extend_schema(request=ReceiveSerializer, responses={201: PurchaseReceiptSerializer})
+    @action(detail=True, methods=['post'], serializer_class=ReceiveSerializer)
+    def receive(self, request, pk=None):
+        """
+        Receive a (partial) delivery: posts the delivered quantities to the ledger and moves the order
+        to PARTIALLY_RECEIVED / RECEIVED. Any number of receipts can be posted until the order is complete.
+        """
+        serializer = ReceiveSerializer(data=request.data,
+                                       context={**self.get_serializer_context(), 'purchase': self.get_object()})
+        serializer.is_valid(raise_exception=True)
+        receipt = serializer.save()
+        return Response(PurchaseReceiptSerializer(receipt).data, status=status.HTTP_201_CREATED)
@@ -1,11 +1,61 @@
 from django.contrib import admin
 
-from sales.models import Customer, Sales, SalesLine, Payment, Shipment, ShipmentLine
+from sales.models import Customer, Sales, SalesLine, Payment, Shipment, ShipmentLine, DailySalesRollup, \
+    DailyPaymentRollup
 
 # Register your models here.
 admin.site.register(Customer)
-admin.site.register(Sales)
-admin.site.register(SalesLine)
-admin.site.register(Payment)
-admin.site.register(Shipment)
-admin.site.register(ShipmentLine)
\ No newline at end of file
+
+
+@admin.register(Sales)
+class SalesAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'customer', 'store', 'status', 'total', 'created_at')
+    list_select_related = ('customer', 'store')
+    list_filter = ('status', 'sales_type')
+    raw_id_fields = ('customer', 'store', 'created_by')
+
+
+@admin.register(SalesLine)
+class SalesLineAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'sales', 'unit_price', 'total')
+    list_select_related = ('product', 'sales')
+    raw_id_fields = ('sales', 'product', 'inventory')
+
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'sales', 'amount', 'method', 'created_at')
+    list_select_related = ('sales',)
+    list_filter = ('method',)
+    raw_id_fields = ('sales', 'created_by')
+
+
+@admin.register(Shipment)
+class ShipmentAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'store', 'shipped_at')
+    list_select_related = ('store',)
+    raw_id_fields = ('sales_order', 'store', 'created_by')
+
+
+@admin.register(ShipmentLine)
+class ShipmentLineAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'unit_price', 'created_at')
+    list_select_related = ('product',)
+    raw_id_fields = ('shipment', 'sales_line', 'product')
+
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'store', 'product', 'quantity', 'total', 'line_count')
+    list_select_related = ('store', 'product')
+    date_hierarchy = 'date'
+    raw_id_fields = ('store', 'product', 'category')
+
+
+@admin.register(DailyPaymentRollup)
+class DailyPaymentRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'store', 'method', 'amount', 'payment_count')
+    list_select_related = ('store',)
+    list_filter = ('method',)
+    date_hierarchy = 'date'
+    raw_id_fields = ('store',)
@@ -0,0 +1,201 @@
+"""
+Columnar extracts of the stock ledger, sales lines and payments for BI tools.
+
+Rows are read with values_list() from a server-side cursor in fixed-size chunks (no model
+instances, constant memory) and written per chunk as a Parquet row group or an Arrow IPC
+record batch when pyarrow is installed, CSV otherwise. Decimals keep their exact scale.
+"""
+import csv
+import io
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from inventory.models import StockTransaction
+from sales.models import SalesLine, Payment
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional: CSV only
+    pyarrow = None
+
+CHUNK_SIZE = 5000
+CONTENT_TYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'csv': 'text/csv',
+}
+
+
+class ExtractError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    path: str  # values_list() lookup
+    type: str  # uuid, string, int, datetime or "decimal:<precision>,<scale>"
+
+
+@dataclass(frozen=True)
+class Extract:
+    model: type
+    time_field: str
+    store_field: str
+    columns: tuple
+
+
+EXTRACTS = {
+    'stock_transaction': Extract(StockTransaction, 'created_at', 'store_id', (
+        Column('id', 'id', 'uuid'),
+        Column('created_at', 'created_at', 'datetime'),
+        Column('store_id', 'store_id', 'uuid'),
+        Column('product_id', 'product_id', 'uuid'),
+        Column('movement_type', 'movement_type', 'string'),
+        Column('quantity', 'quantity', 'decimal:18,6'),
+        Column('unit_cost', 'unit_cost', 'decimal:14,4'),
+        Column('balance_after', 'balance_after', 'decimal:18,6'),
+        Column('reference_type', 'reference_type', 'string'),
+        Column('reference_id', 'reference_id', 'uuid'),
+    )),
+    'sales_line': Extract(SalesLine, 'sales__created_at', 'sales__store_id', (
+        Column('id', 'id', 'int'),
+        Column('sales_id', 'sales_id', 'uuid'),
+        Column('created_at', 'sales__created_at', 'datetime'),
+        Column('store_id', 'sales__store_id', 'uuid'),
+        Column('status', 'sales__status', 'string'),
+        Column('product_id', 'product_id', 'uuid'),
+        Column('quantity', 'quantity', 'decimal:18,6'),
+        Column('unit_price', 'unit_price', 'decimal:14,4'),
+        Column('sub_total', 'sub_total', 'decimal:18,6'),
+        Column('vat_amount', 'vat_amount', 'decimal:14,4'),
+        Column('discount', 'discount', 'decimal:14,4'),
+        Column('total', 'total', 'decimal:18,6'),
+    )),
+    'payment': Extract(Payment, 'created_at', 'sales__store_id', (
+        Column('id', 'id', 'uuid'),
+        Column('sales_id', 'sales_id', 'uuid'),
+        Column('created_at', 'created_at', 'datetime'),
+        Column('store_id', 'sales__store_id', 'uuid'),
+        Column('status', 'sales__status', 'string'),
+        Column('method', 'method', 'string'),
+        Column('amount', 'amount', 'decimal:14,2'),
+    )),
+}
+
+
+def formats():
+    return ('parquet', 'arrow', 'csv') if pyarrow is not None else ('csv',)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def chunks(name, start, end, store=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of row tuples of an extract for the local days start..end (inclusive), in (time, id) order.
+    """
+    extract = EXTRACTS[name]
+    rows = extract.model.objects.filter(**{
+        f'{extract.time_field}__gte': _day_start(start),
+        f'{extract.time_field}__lt': _day_start(end + timedelta(days=1)),
+    })
+    if store is not None:
+        rows = rows.filter(**{extract.store_field: getattr(store, 'pk', store)})
+    rows = rows.order_by(extract.time_field, 'id').values_list(*(column.path for column in extract.columns))
+
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _arrow_type(column):
+    if column.type.startswith('decimal:'):
+        return pyarrow.decimal128(*map(int, column.type[8:].split(',')))
+    return {
+        'uuid': pyarrow.string(),
+        'string': pyarrow.string(),
+        'int': pyarrow.int64(),
+        'datetime': pyarrow.timestamp('us', tz='UTC'),
+    }[column.type]
+
+
+def _arrow_batch(extract, schema, chunk):
+    arrays = []
+    for column, values, field in zip(extract.columns, zip(*chunk), schema):
+        if column.type == 'uuid':
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Drain(io.RawIOBase):
+    """
+    Write-only file that keeps what was written until drain(), so a writer can be streamed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+
+def _stream_arrow(name, fmt, chunk_iter):
+    extract = EXTRACTS[name]
+    schema = pyarrow.schema([(column.name, _arrow_type(column)) for column in extract.columns])
+    sink = _Drain()
+    if fmt == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_stream(pyarrow.PythonFile(sink, mode='w'), schema)
+    for chunk in chunk_iter:
+        writer.write_batch(_arrow_batch(extract, schema, chunk))  # one row group / record batch per chunk
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _stream_csv(name, chunk_iter):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in EXTRACTS[name].columns])
+    for chunk in chunk_iter:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def stream(name, fmt, start, end, store=None, chunk_size=CHUNK_SIZE):
+    """
+    Encoded bytes of an extract in `fmt` (see formats()), chunk by chunk, for a StreamingHttpResponse or a file.
+    """
+    if name not in EXTRACTS:
+        raise ExtractError(f"Unknown extract {name!r}; choose from {', '.join(EXTRACTS)}.")
+    if fmt not in formats():
+        raise ExtractError(f"Unsupported format {fmt!r}; available: {', '.join(formats())}.")
+    chunk_iter = chunks(name, start, end, store, chunk_size)
+    if fmt == 'csv':
+        return _stream_csv(name, chunk_iter)
+    return _stream_arrow(name, fmt, chunk_iter)
@@ -0,0 +1,34 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from sales.models import Sales, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales / payment rollups from the sales lines and payments, one day at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (default: day of the first sale).")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day, inclusive (default: today).")
+        parser.add_argument('--store', help="Only this store id.")
+
+    def handle(self, *args, **options):
+        start = options['start']
+        if start is None:
+            first = Sales.objects.aggregate(first=Min('created_at'))['first']
+            if first is None:
+                self.stdout.write("no sales")
+                return
+            start = timezone.localtime(first).date()
+        end = options['end'] or timezone.localdate()
+        if start > end:
+            raise CommandError("--start must be on or before --end.")
+
+        day = start
+        while day <= end:
+            rebuild_rollups(day, store_id=options['store'])
+            day += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"rollups rebuilt from {start} to {end}"))
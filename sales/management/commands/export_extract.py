@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sales import extracts
+
+
+class Command(BaseCommand):
+    help = "Write a columnar extract (stock ledger, sales lines or payments) of a date range to a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=list(extracts.EXTRACTS))
+        parser.add_argument('output', help="Output file path.")
+        parser.add_argument('--start', type=date.fromisoformat, required=True)
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day, inclusive (default: today).")
+        parser.add_argument('--store', help="Only this store id.")
+        parser.add_argument('--format', choices=('parquet', 'arrow', 'csv'),
+                            help="Default: parquet when pyarrow is installed, csv otherwise.")
+        parser.add_argument('--chunk-size', type=int, default=extracts.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or extracts.formats()[0]
+        end = options['end'] or timezone.localdate()
+        try:
+            body = extracts.stream(options['table'], fmt, options['start'], end, options['store'],
+                                   options['chunk_size'])
+        except extracts.ExtractError as exc:
+            raise CommandError(str(exc))
+        size = 0
+        with open(options['output'], 'wb') as output:
+            for data in body:
+                output.write(data)
+                size += len(data)
+        self.stdout.write(self.style.SUCCESS(f"{options['table']}: {size} bytes of {fmt} written to {options['output']}"))
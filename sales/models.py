@@ -1,15 +1,18 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models, transaction
-from django.db.models import F
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Count, DecimalField, IntegerField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-from core.models import Store, Product
-from inventory.models import Inventory, StockTransaction, MovementType
+from core.models import Store, Product, Category
+from inventory.locking import inventory_locks
+from inventory.models import Inventory, StockTransaction, StockTransactionArchive, MovementType
 
 
 # Create your models here.
@@ -25,12 +28,61 @@ class Customer(models.Model):
         return self.name or self.name
 
 
+# unit_price / vat_amount / discount are stored with 4 decimal places
+AMOUNT_PRECISION = Decimal('0.0001')
+
+
 class SalesOrderStatus(models.TextChoices):
     PENDING = "PENDING", "Pending"
     COMPLETE = "COMPLETE", "Complete"
     CANCELLED = "CANCELLED", "Cancelled"
 
 
+class SalesQuerySet(models.QuerySet):
+    @staticmethod
+    def _line_totals():
+        """
+        (subtotal, vat, total) expressions aggregated from the order's lines.
+        """
+        lines = SalesLine.objects.filter(sales=OuterRef('pk')).order_by().values('sales')
+        amount = DecimalField(max_digits=18, decimal_places=6)
+        return tuple(
+            Coalesce(Subquery(lines.annotate(s=Sum(field)).values('s')), Decimal('0'), output_field=amount)
+            for field in ('sub_total', 'vat_amount', 'total')
+        )
+
+    def with_totals(self):
+        """
+        Annotate line_count, paid_amount (sum of payments) and balance_due next to the stored
+        subtotal / vat / total, using correlated subqueries so a page of orders is a single query.
+        """
+        line_count = SalesLine.objects.filter(sales=OuterRef('pk')).order_by().values('sales') \
+            .annotate(c=Count('pk')).values('c')
+        paid = Payment.objects.filter(sales=OuterRef('pk')).order_by().values('sales') \
+            .annotate(s=Sum('amount')).values('s')
+        paid_amount = Coalesce(Subquery(paid), Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+        return self.annotate(
+            line_count=Coalesce(Subquery(line_count), 0, output_field=IntegerField()),
+            paid_amount=paid_amount,
+            balance_due=F('total') - paid_amount,
+        )
+
+    def out_of_sync_totals(self):
+        """
+        Orders whose stored totals differ from their lines.
+        """
+        subtotal, vat, total = self._line_totals()
+        return self.alias(computed_subtotal=subtotal, computed_vat=vat, computed_total=total).exclude(
+            subtotal=F('computed_subtotal'), vat=F('computed_vat'), total=F('computed_total'))
+
+    def recalculate_totals(self):
+        """
+        Recompute the stored subtotal / vat / total from the lines in a single UPDATE.
+        """
+        subtotal, vat, total = self._line_totals()
+        return self.update(subtotal=subtotal, vat=vat, total=total)
+
+
 class Sales(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='sales_orders')
@@ -39,27 +91,257 @@ class Sales(models.Model):
     sales_type = models.CharField(max_length=20, choices=(('Online', 'Online'), ('Store', 'Store')), default='Store')
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT,
                                    related_name='sales_orders_created')
-    created_at = models.DateTimeField(auto_now_add=True)
+    # the till's sale time for sales recorded offline (see Sales.ingest)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     notes = models.TextField(blank=True)
+    # id generated by the till for sales recorded offline (see Sales.ingest)
+    client_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    # denormalized from the lines, kept in sync by SalesLine (see SalesQuerySet.recalculate_totals)
+    subtotal = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), editable=False)
+    vat = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), editable=False)
+    total = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'), editable=False)
+
+    objects = SalesQuerySet.as_manager()
 
     def __str__(self):
         return f"SO {self.id} ({self.get_sales_type_display()})"
 
-    @property
-    def subtotal(self):
-        return sum([l.sub_total for l in self.lines.all()]) if self.lines.exists() else Decimal('0')
-
     @property
     def total_vat(self):
-        return sum([l.vat_amount for l in self.lines.all()]) if self.lines.exists() else Decimal('0')
+        return self.vat
 
-    @property
-    def total(self):
-        return self.subtotal + self.total_vat
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.status in (SalesOrderStatus.COMPLETE, SalesOrderStatus.CANCELLED):
+            # completed sales count in the rollups, cancelled ones drop out again
+            transaction.on_commit(lambda: refresh_rollups([self.pk]))
+
+    @classmethod
+    def _priced(cls, inventories, created_by, customer, store, lines, payments=(), sales_type='Store', notes='',
+                **fields):
+        """
+        Unsaved sale, SalesLines and Payments, priced from `inventories` ({product_id: Inventory with
+        its product}); totals and status are set. Raises ValidationError for unavailable products.
+        """
+        sale = cls(customer=customer, store=store, created_by=created_by, sales_type=sales_type, notes=notes,
+                   **fields)
+        sales_lines = []
+        for line in lines:
+            inv = inventories.get(line['product'])
+            if inv is None or not inv.is_active or not inv.product.is_active:
+                raise ValidationError(f"Product {line['product']} is not available in store {store}.")
+            sales_lines.append(SalesLine.from_inventory(sale, inv, line['quantity']))
+
+        sale.subtotal = sum((line.sub_total for line in sales_lines), Decimal('0'))
+        sale.vat = sum((line.vat_amount for line in sales_lines), Decimal('0'))
+        sale.total = sum((line.total for line in sales_lines), Decimal('0'))
+        paid = sum((Decimal(payment['amount']) for payment in payments), Decimal('0'))
+        sale.status = SalesOrderStatus.COMPLETE if paid >= sale.total else SalesOrderStatus.PENDING
+
+        sale_payments = [
+            Payment(sales=sale, amount=payment['amount'], method=payment['method'],
+                    transaction_id=payment.get('transaction_id', ''), created_by=created_by)
+            for payment in payments
+        ]
+        return sale, sales_lines, sale_payments
+
+    @classmethod
+    @inventory_locks.retrying
+    def checkout(cls, customer, store, created_by, lines, payments=(), sales_type='Store', notes=''):
+        """
+        Create a whole POS sale in one atomic pass:
+        - prices every line from Product / Inventory (see SalesLine.from_inventory),
+        - bulk-inserts the lines and payments,
+        - posts the stock issue through one StockTransaction.create_transactions batch.
+        `lines` are dicts with `product` (id) and `quantity`; `payments` are dicts with
+        `amount`, `method` and optional `transaction_id`.
+        The sale is COMPLETE when the payments cover the total, PENDING otherwise.
+        """
+        with transaction.atomic():
+            inventories = {
+                inv.product_id: inv
+                for inv in Inventory.objects.select_related('product').filter(
+                    store=store, product_id__in={line['product'] for line in lines})
+            }
+
+            sale, sales_lines, sale_payments = cls._priced(inventories, created_by, customer, store, lines, payments,
+                                                           sales_type, notes)
+            sale.save()
+            SalesLine.objects.bulk_create(sales_lines)
+            Payment.objects.bulk_create(sale_payments)
+            StockTransaction.create_transactions(sale.ledger_lines(sales_lines))
+
+        return sale
+
+    @classmethod
+    def ingest(cls, sales, created_by):
+        """
+        Upload of sales recorded offline by a till. Every sale is a dict like checkout()'s arguments
+        (`customer` and `store` given as ids) plus the till-generated `client_id`, which makes
+        re-sending the same batch harmless: a client_id already stored is reported as duplicate.
+        An optional `sold_at` dates the sale and its stock issue when the till made it.
+        Sales are written per store in one transaction, with one bulk ledger pass per store.
+        Returns one result per input sale, in order:
+        {"client_id", "status": "created" | "duplicate" | "rejected", "sale", "errors"}.
+        """
+        customers = Customer.objects.in_bulk({data['customer'] for data in sales})
+        stores = Store.objects.in_bulk({data['store'] for data in sales})
+
+        results, first, by_store = [None] * len(sales), {}, {}
+        for index, data in enumerate(sales):
+            client_id = data['client_id']
+            if client_id in first:
+                results[index] = {'client_id': client_id, 'status': 'duplicate', 'sale': None, 'errors': []}
+                continue
+            first[client_id] = index
+            missing = [f"Unknown {field} {data[field]}." for field, known in (('customer', customers),
+                                                                             ('store', stores))
+                       if data[field] not in known]
+            if missing:
+                results[index] = {'client_id': client_id, 'status': 'rejected', 'sale': None, 'errors': missing}
+                continue
+            entry = dict(data, customer=customers[data['customer']], store=stores[data['store']])
+            by_store.setdefault(data['store'], []).append((index, entry))
+
+        for entries in by_store.values():
+            for index, result in cls._ingest_store(entries, created_by).items():
+                results[index] = result
+        # a sale repeated inside the batch points at its first occurrence
+        for result in results:
+            if result['sale'] is None and result['status'] == 'duplicate':
+                result['sale'] = results[first[result['client_id']]]['sale']
+        return results
+
+    @classmethod
+    @inventory_locks.retrying
+    def _ingest_store(cls, entries, created_by):
+        """
+        ingest() for the sales of one store: {index: result}.
+        """
+        store = entries[0][1]['store']
+        results, accepted, backdated = {}, [], set()
+        with transaction.atomic():
+            product_ids = {line['product'] for _, data in entries for line in data['lines']}
+            # lock before looking for duplicates, so a concurrent upload of the same batch waits here
+            locked = inventory_locks.lock({(product_id, store.pk) for product_id in product_ids})
+            existing = dict(cls.objects.filter(client_id__in=[data['client_id'] for _, data in entries])
+                            .values_list('client_id', 'pk'))
+            products = Product.objects.in_bulk(product_ids)
+            inventories = {}
+            for (product_id, _), inv in locked.items():
+                inv.product = products[product_id]
+                inventories[product_id] = inv
+            balances = {product_id: inv.quantity for product_id, inv in inventories.items()}
+            # the archive is not restated (StockTransaction._restate)
+            archived_until = None
+            if any(data.get('sold_at') for _, data in entries):
+                archived_until = StockTransactionArchive.objects.filter(
+                    store=store, product_id__in=product_ids).aggregate(last=Max('created_at'))['last']
+
+            for index, data in entries:
+                client_id = data['client_id']
+                if client_id in existing:
+                    results[index] = {'client_id': client_id, 'status': 'duplicate', 'sale': existing[client_id],
+                                      'errors': []}
+                    continue
+                data = dict(data)
+                sold_at = data.pop('sold_at', None)
+                if sold_at is not None and archived_until is not None and sold_at <= archived_until:
+                    results[index] = {'client_id': client_id, 'status': 'rejected', 'sale': None,
+                                      'errors': ["sold_at is older than the archived stock ledger."]}
+                    continue
+                try:
+                    sale, sales_lines, payments = cls._priced(inventories, created_by, **data)
+                except ValidationError as exc:
+                    results[index] = {'client_id': client_id, 'status': 'rejected', 'sale': None,
+                                      'errors': exc.messages}
+                    continue
+
+                needed = {}
+                for line in sales_lines:
+                    needed[line.product_id] = needed.get(line.product_id, Decimal('0')) + line.quantity
+                short = [product_id for product_id, quantity in needed.items() if balances[product_id] < quantity]
+                if short:
+                    results[index] = {'client_id': client_id, 'status': 'rejected', 'sale': None,
+                                      'errors': [f"Insufficient stock of product {pk}." for pk in short]}
+                    continue
+                for product_id, quantity in needed.items():
+                    balances[product_id] -= quantity
+
+                if sold_at is not None:
+                    sale.created_at = sold_at
+                    backdated.add(sale.pk)
+                accepted.append((sale, sales_lines, payments))
+                results[index] = {'client_id': client_id, 'status': 'created', 'sale': sale.pk, 'errors': []}
+
+            if accepted:
+                cls.objects.bulk_create([sale for sale, _, _ in accepted])
+                SalesLine.objects.bulk_create([line for _, lines, _ in accepted for line in lines])
+                Payment.objects.bulk_create([payment for _, _, payments in accepted for payment in payments])
+                StockTransaction.create_transactions(
+                    [dict(movement, created_at=sale.created_at) if sale.pk in backdated else movement
+                     for sale, lines, _ in accepted for movement in sale.ledger_lines(lines)])
+                # bulk_create skips Sales.save()
+                created = [sale.pk for sale, _, _ in accepted if sale.status == SalesOrderStatus.COMPLETE]
+                transaction.on_commit(lambda: refresh_rollups(created))
+        return results
+
+    def ledger_lines(self, lines):
+        """
+        StockTransaction.create_transactions kwargs issuing the stock of the given SalesLines,
+        one movement per product (the ledger reference is unique per product/store).
+        """
+        products, quantities = {}, {}
+        for line in lines:
+            products[line.product_id] = line.product
+            quantities[line.product_id] = quantities.get(line.product_id, Decimal('0')) + line.quantity
+        return [
+            dict(
+                product=product,
+                store=self.store,
+                quantity=-quantities[product_id],
+                unit_cost=product.unit_cost,
+                movement_type=MovementType.ISSUE,
+                created_by=self.created_by,
+                reference_type='SO',
+                reference_id=self.id,
+                note=f"Sale {self.id}",
+            )
+            for product_id, product in products.items()
+        ]
 
     class Meta:
         verbose_name_plural = 'Sales'
         verbose_name = 'Sale'
+        indexes = [
+            # keyset pagination (LedgerCursorPagination)
+            models.Index(fields=["created_at", "id"]),
+            # daily rollups (sales.rollups)
+            models.Index(fields=["store", "status", "created_at"]),
+        ]
+
+
+class SalesLineQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for line in objs:
+            line.calculate_totals()
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            Sales.objects.filter(pk__in={line.sales_id for line in objs}).recalculate_totals()
+        return created
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            rows = set(self.values_list('sales_id', 'product_id'))
+            sales_ids = {sales_id for sales_id, _ in rows}
+            deleted = super().delete()
+            Sales.objects.filter(pk__in=sales_ids).recalculate_totals()
+            transaction.on_commit(lambda: refresh_rollups(sales_ids, {product_id for _, product_id in rows}, set()))
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class SalesLine(models.Model):
@@ -73,11 +355,59 @@ class SalesLine(models.Model):
     discount = models.DecimalField(max_digits=14, decimal_places=4, default=Decimal('0'))
     total = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
 
-    def save(self, *args, **kwargs):
+    objects = SalesLineQuerySet.as_manager()
+
+    @classmethod
+    def from_inventory(cls, sales, inventory, quantity):
+        """
+        Build an (unsaved) line priced from the product and the store's Inventory row:
+        - tax-inclusive shelf prices have the VAT backed out so unit_price is always net,
+        - the inventory discount (percentage of the line, or flat per unit) is capped at the line amount,
+        - VAT is charged on the discounted amount.
+        """
+        product = inventory.product
+        quantity = Decimal(quantity)
+        tax_rate = product.tax_rate or Decimal('0')
+
+        unit_price = product.unit_price
+        if product.tax_method == 'inclusive' and tax_rate:
+            unit_price = unit_price * 100 / (100 + tax_rate)
+        unit_price = unit_price.quantize(AMOUNT_PRECISION)
+
+        gross = unit_price * quantity
+        if inventory.discount_method == 'percentage':
+            discount = gross * inventory.discount_rate / 100
+        else:
+            discount = inventory.discount_rate * quantity
+        discount = min(discount, gross).quantize(AMOUNT_PRECISION)
+        vat_amount = ((gross - discount) * tax_rate / 100).quantize(AMOUNT_PRECISION)
+
+        line = cls(sales=sales, product=product, inventory=inventory, quantity=quantity, unit_price=unit_price,
+                   vat_amount=vat_amount, discount=discount)
+        line.calculate_totals()
+        return line
+
+    def calculate_totals(self):
         self.sub_total = self.unit_price * self.quantity
         # VAT and discount logic should be improved per tax rules
         self.total = self.sub_total + (self.vat_amount or Decimal('0')) - (self.discount or Decimal('0'))
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.calculate_totals()
+        with transaction.atomic():
+            # a line moved to another product leaves the old product's rollup row too
+            previous = None if self._state.adding else \
+                SalesLine.objects.filter(pk=self.pk).values_list('product_id', flat=True).first()
+            super().save(*args, **kwargs)
+            Sales.objects.filter(pk=self.sales_id).recalculate_totals()
+            _refresh_sale_rollups(self.sales, {self.product_id, previous} - {None}, set())
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Sales.objects.filter(pk=self.sales_id).recalculate_totals()
+            _refresh_sale_rollups(self.sales, {self.product_id}, set())
+        return deleted
 
     def __str__(self):
         return f"{self.product.sku} x {self.quantity}"
@@ -97,9 +427,28 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
 
+    class Meta:
+        indexes = [
+            # keyset pagination (LedgerCursorPagination)
+            models.Index(fields=["created_at", "id"]),
+        ]
+
     def __str__(self):
         return self.transaction_id
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None if self._state.adding else \
+                Payment.objects.filter(pk=self.pk).values_list('method', flat=True).first()
+            super().save(*args, **kwargs)
+            _refresh_sale_rollups(self.sales, set(), {self.method, previous} - {None})
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            _refresh_sale_rollups(self.sales, set(), {self.method})
+        return deleted
+
 
 class Shipment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -109,30 +458,57 @@ class Shipment(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
 
     def __str__(self):
-        return f"Shipment {self.id} for SO {self.sales_order.id}"
+        return f"Shipment {self.id} for SO {self.sales_order_id}"
 
+    @inventory_locks.retrying
     def ship(self, shipped_by_user):
         """
-        Process the shipment by applying each ShipmentLine to inventory (atomic).
-        - Creates StockTransaction entries for each line via StockTransaction.create_transaction.
+        Process the shipment by applying all ShipmentLines to inventory (atomic).
+        - Posts one StockTransaction per product through a single StockTransaction.create_transactions batch.
         - Marks shipped_at and saves.
         - This function expects that ShipmentLines were created beforehand (one or more).
         """
         with transaction.atomic():
-            # select_for_update is handled inside StockTransaction.create_transaction for Inventory row
-            lines = self.lines.select_related("product", "sales_line").all()
-            if not lines.exists():
+            # row locking is handled inside StockTransaction.create_transactions for all Inventory rows at once
+            lines = list(self.lines.select_related("product", "sales_line").all())
+            if not lines:
                 raise ValueError("Shipment has no lines to process")
 
+            # Ensure logic to avoid double-shipping the same line (caller responsibility),
+            # but the StockTransaction helper will block negative inventory.
+            StockTransaction.create_transactions(self.ledger_lines(lines, shipped_by_user))
             for line in lines:
-                # Ensure logic to avoid double-shipping the same line (caller responsibility),
-                # but the StockTransaction helper will block negative inventory.
-                line.apply_to_inventory(shipped_by_user)
+                line.mark_sales_line_shipped()
 
             # mark shipped
             self.shipped_at = timezone.now()
             self.save(update_fields=["shipped_at"])
 
+    def ledger_lines(self, lines, shipped_by_user):
+        """
+        StockTransaction.create_transactions kwargs issuing the given ShipmentLines, one movement per
+        product (the ledger reference is unique per product/store), at the quantity-weighted unit price.
+        """
+        products, quantities, amounts = {}, {}, {}
+        for line in lines:
+            products[line.product_id] = line.product
+            quantities[line.product_id] = quantities.get(line.product_id, Decimal('0')) + line.quantity
+            amounts[line.product_id] = amounts.get(line.product_id, Decimal('0')) + line.quantity * line.unit_price
+        return [
+            dict(
+                product=product,
+                store=self.store,
+                quantity=-quantities[product_id],  # negative => reduce physical stock
+                unit_cost=(amounts[product_id] / quantities[product_id]).quantize(AMOUNT_PRECISION),
+                movement_type=MovementType.ISSUE,
+                created_by=shipped_by_user,
+                reference_type='SHIP',
+                reference_id=self.id,
+                note=f"Shipment {self.id} for SO {self.sales_order_id}",
+            )
+            for product_id, product in products.items()
+        ]
+
 
 class ShipmentLine(models.Model):
     """
@@ -162,17 +538,13 @@ class ShipmentLine(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.product.sku} x {self.quantity} (Shipment {self.shipment.id})"
+        return f"{self.product.sku} x {self.quantity} (Shipment {self.shipment_id})"
 
-    def apply_to_inventory(self, shipped_by_user):
+    def ledger_line(self, shipped_by_user):
         """
-        Create a negative stock transaction for this shipment line (outflow).
-        Uses the central StockTransaction.create_transaction helper for safety.
-        Returns the created StockTransaction.
+        Build the StockTransaction.create_transaction(s) kwargs for this line (negative outflow).
         """
-        from inventory.models import StockTransaction, MovementType
-
-        tx = StockTransaction.create_transaction(
+        return dict(
             product=self.product,
             store=self.shipment.store,
             quantity=-self.quantity,  # negative => reduce physical stock
@@ -180,10 +552,11 @@ class ShipmentLine(models.Model):
             movement_type=MovementType.ISSUE,
             created_by=shipped_by_user,
             reference_type='SHIP',
-            reference_id=self.shipment.id,
-            note=f"ShipmentLine {self.id} for SO {self.shipment.sales_order.id}"
+            reference_id=self.shipment_id,
+            note=f"ShipmentLine {self.id} for SO {self.shipment.sales_order_id}"
         )
 
+    def mark_sales_line_shipped(self):
         # Optionally update shipped quantity on SalesLine if present and model has field.
         if self.sales_line is not None:
             try:
@@ -195,4 +568,152 @@ class ShipmentLine(models.Model):
                 # don't raise from here — caller should handle/report
                 pass
 
+    def apply_to_inventory(self, shipped_by_user):
+        """
+        Create a negative stock transaction for this shipment line (outflow).
+        Uses the central StockTransaction.create_transaction helper for safety.
+        Returns the created StockTransaction.
+        """
+        tx = StockTransaction.create_transaction(**self.ledger_line(shipped_by_user))
+        self.mark_sales_line_shipped()
         return tx
+
+
+class DailySalesRollup(models.Model):
+    """
+    Completed sales lines summed per (day, store, product); maintained by refresh_rollups().
+    The day is the local date of the sale; category is the product's category at rollup time.
+    """
+    date = models.DateField()
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    quantity = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    subtotal = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    vat = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    discount = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    total = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal('0'))
+    line_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "store", "product"], name="uniq_sales_rollup_day_store_product"),
+        ]
+        indexes = [
+            models.Index(fields=["store", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.store_id} {self.product_id}: {self.total}"
+
+
+class DailyPaymentRollup(models.Model):
+    """
+    Payments of completed sales summed per (day, store, method); maintained by refresh_rollups().
+    """
+    date = models.DateField()
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='+')
+    method = models.CharField(max_length=30, choices=Payment._meta.get_field('method').choices)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0'))
+    payment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "store", "method"], name="uniq_payment_rollup_day_store_method"),
+        ]
+        indexes = [
+            models.Index(fields=["store", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.store_id} {self.method}: {self.amount}"
+
+
+def _day_range(day):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    return start, start + timedelta(days=1)
+
+
+def _replace_rows(model, stale, rows, unique_fields, update_fields):
+    # delete + upsert: a concurrent refresh of the same scope ends in the same rows instead of a conflict
+    with transaction.atomic():
+        stale.delete()
+        model.objects.bulk_create(rows, update_conflicts=True, unique_fields=unique_fields,
+                                  update_fields=update_fields)
+
+
+def rebuild_rollups(day, store_id=None, product_ids=None, methods=None):
+    """
+    Recompute the rollup rows of one (local) day from the completed sales: all stores or one,
+    all products or the given ones, all payment methods or the given ones (an empty set leaves
+    that table alone). Idempotent; rows whose sales no longer count are removed.
+    """
+    start, end = _day_range(day)
+    completed = dict(sales__status=SalesOrderStatus.COMPLETE, sales__created_at__gte=start,
+                     sales__created_at__lt=end)
+    if store_id is not None:
+        completed['sales__store_id'] = store_id
+
+    if product_ids is None or product_ids:
+        lines = SalesLine.objects.filter(**completed).order_by()
+        stale_lines = DailySalesRollup.objects.filter(date=day)
+        if store_id is not None:
+            stale_lines = stale_lines.filter(store_id=store_id)
+        if product_ids is not None:
+            lines = lines.filter(product_id__in=product_ids)
+            stale_lines = stale_lines.filter(product_id__in=product_ids)
+        _replace_rows(DailySalesRollup, stale_lines, [
+            DailySalesRollup(date=day, store_id=row['sales__store_id'], product_id=row['product_id'],
+                             category_id=row['product__category_id'], quantity=row['quantity_sum'],
+                             subtotal=row['subtotal_sum'], vat=row['vat_sum'], discount=row['discount_sum'],
+                             total=row['total_sum'], line_count=row['lines'])
+            for row in lines.values('sales__store_id', 'product_id', 'product__category_id').annotate(
+                quantity_sum=Sum('quantity'), subtotal_sum=Sum('sub_total'), vat_sum=Sum('vat_amount'),
+                discount_sum=Sum('discount'), total_sum=Sum('total'), lines=Count('pk'))
+        ], ['date', 'store', 'product'], ['category', 'quantity', 'subtotal', 'vat', 'discount', 'total',
+                                          'line_count'])
+
+    if methods is None or methods:
+        payments = Payment.objects.filter(**completed).order_by()
+        stale_payments = DailyPaymentRollup.objects.filter(date=day)
+        if store_id is not None:
+            stale_payments = stale_payments.filter(store_id=store_id)
+        if methods is not None:
+            payments = payments.filter(method__in=methods)
+            stale_payments = stale_payments.filter(method__in=methods)
+        _replace_rows(DailyPaymentRollup, stale_payments, [
+            DailyPaymentRollup(date=day, store_id=row['sales__store_id'], method=row['method'],
+                               amount=row['amount_sum'], payment_count=row['payments'])
+            for row in payments.values('sales__store_id', 'method').annotate(amount_sum=Sum('amount'),
+                                                                            payments=Count('pk'))
+        ], ['date', 'store', 'method'], ['amount', 'payment_count'])
+
+
+def refresh_rollups(sales_ids, product_ids=None, methods=None):
+    """
+    Incremental rollup update for sales that changed (completed, cancelled, a line or payment
+    saved or deleted): only the rows of each sale's (day, store) are recomputed, and in them only
+    the products and payment methods given, or by default those of the sales' lines and payments.
+    """
+    tz = timezone.get_current_timezone()
+    scopes, scope_of = {}, {}
+    for pk, store_id, created_at in Sales.objects.filter(pk__in=sales_ids).values_list('pk', 'store_id',
+                                                                                       'created_at'):
+        scope_of[pk] = scopes.setdefault((timezone.localtime(created_at, tz).date(), store_id),
+                                         (set(product_ids or ()), set(methods or ())))
+    if product_ids is None:
+        for sales_id, product_id in SalesLine.objects.filter(sales__in=scope_of).values_list('sales_id',
+                                                                                             'product_id'):
+            scope_of[sales_id][0].add(product_id)
+    if methods is None:
+        for sales_id, method in Payment.objects.filter(sales__in=scope_of).values_list('sales_id', 'method'):
+            scope_of[sales_id][1].add(method)
+    for (day, store_id), (scope_products, scope_methods) in scopes.items():
+        rebuild_rollups(day, store_id, scope_products, scope_methods)
+
+
+def _refresh_sale_rollups(sale, product_ids=None, methods=None):
+    # lines and payments only count in the rollups of a completed sale
+    if sale.status == SalesOrderStatus.COMPLETE:
+        transaction.on_commit(lambda: refresh_rollups([sale.pk], product_ids, methods))
@@ -0,0 +1,74 @@
+"""
+Sales reports. They read only the daily rollup tables (see DailySalesRollup), never the
+sales lines or payments, so their cost depends on the number of days / stores / products
+reported, not on the number of sales.
+"""
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+
+from sales.models import DailySalesRollup, DailyPaymentRollup
+
+PERIODS = {
+    'day': lambda: F('date'),
+    'week': lambda: TruncWeek('date'),
+    'month': lambda: TruncMonth('date'),
+    'year': lambda: TruncYear('date'),
+}
+SALES_GROUPS = {
+    'none': (),
+    'store': ('store_id',),
+    'product': ('product_id',),
+    'category': ('category_id',),
+}
+MAX_ROWS = 10000
+
+
+def _rollups(model, start, end, store):
+    rows = model.objects.filter(date__gte=start, date__lte=end)
+    if store is not None:
+        rows = rows.filter(store=store)
+    return rows
+
+
+def sales_report(start, end, period='day', group_by='none', store=None):
+    """
+    Sales totals per period (and store / product / category), oldest first.
+    """
+    dims = SALES_GROUPS[group_by]
+    rows = _rollups(DailySalesRollup, start, end, store).annotate(period=PERIODS[period]()) \
+        .values('period', *dims).annotate(
+            quantity_sum=Sum('quantity'), subtotal_sum=Sum('subtotal'), vat_sum=Sum('vat'),
+            discount_sum=Sum('discount'), total_sum=Sum('total'), lines=Sum('line_count'),
+        ).order_by('period', *dims)[:MAX_ROWS]
+    return [
+        {
+            'period': row['period'],
+            **{dim.removesuffix('_id'): row[dim] for dim in dims},
+            'quantity': row['quantity_sum'],
+            'subtotal': row['subtotal_sum'],
+            'vat': row['vat_sum'],
+            'discount': row['discount_sum'],
+            'total': row['total_sum'],
+            'line_count': row['lines'],
+        }
+        for row in rows
+    ]
+
+
+def payments_report(start, end, period='day', group_by='none', store=None):
+    """
+    Payment totals per period and method (and store), oldest first.
+    """
+    dims = ('store_id', 'method') if group_by == 'store' else ('method',)
+    rows = _rollups(DailyPaymentRollup, start, end, store).annotate(period=PERIODS[period]()) \
+        .values('period', *dims).annotate(amount_sum=Sum('amount'), payments=Sum('payment_count')) \
+        .order_by('period', *dims)[:MAX_ROWS]
+    return [
+        {
+            'period': row['period'],
+            **{dim.removesuffix('_id'): row[dim] for dim in dims},
+            'amount': row['amount_sum'],
+            'payment_count': row['payments'],
+        }
+        for row in rows
+    ]
@@ -1,4 +1,10 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
 from rest_framework import serializers
+
+from core.models import Store
 from sales.models import Customer, Sales, SalesLine, Payment
 
 
@@ -10,6 +16,11 @@ class CustomerSerializer(serializers.ModelSerializer):
 
 
 class SalesSerializer(serializers.ModelSerializer):
+    # annotated by SalesQuerySet.with_totals()
+    line_count = serializers.IntegerField(read_only=True)
+    paid_amount = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    balance_due = serializers.DecimalField(max_digits=18, decimal_places=6, read_only=True)
+
     class Meta:
         model = Sales
         fields = '__all__'
@@ -27,4 +38,119 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+
+class CheckoutLineSerializer(serializers.Serializer):
+    product = serializers.UUIDField()
+    quantity = serializers.DecimalField(max_digits=18, decimal_places=6, min_value=Decimal('0.000001'))
+
+
+class CheckoutPaymentSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2, min_value=Decimal('0'))
+    method = serializers.ChoiceField(choices=Payment._meta.get_field('method').choices)
+    transaction_id = serializers.CharField(max_length=256, required=False, allow_blank=True)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    # header + lines + payments in one payload; lines are priced server side
+    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all())
+    store = serializers.PrimaryKeyRelatedField(queryset=Store.objects.all())
+    sales_type = serializers.ChoiceField(choices=Sales._meta.get_field('sales_type').choices, default='Store')
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    lines = CheckoutLineSerializer(many=True, allow_empty=False)
+    payments = CheckoutPaymentSerializer(many=True, required=False, default=list)
+
+    def create(self, validated):
+        try:
+            return Sales.checkout(created_by=self.context['request'].user, **validated)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({'detail': exc.messages})
+
+
+class IngestSaleSerializer(serializers.Serializer):
+    # one offline sale; customer / store are resolved in bulk by Sales.ingest
+    client_id = serializers.UUIDField()
+    customer = serializers.IntegerField(min_value=1)
+    store = serializers.UUIDField()
+    sales_type = serializers.ChoiceField(choices=Sales._meta.get_field('sales_type').choices, default='Store')
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    lines = CheckoutLineSerializer(many=True, allow_empty=False)
+    payments = CheckoutPaymentSerializer(many=True, required=False, default=list)
+    # when the till made the sale; the upload time if omitted
+    sold_at = serializers.DateTimeField(required=False)
+
+    def validate_sold_at(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("sold_at cannot be in the future.")
+        return value
+
+
+class SalesIngestSerializer(serializers.Serializer):
+    max_sales = 1000
+
+    sales = IngestSaleSerializer(many=True, allow_empty=False, max_length=max_sales)
+
+    def create(self, validated):
+        return {'results': Sales.ingest(validated['sales'], created_by=self.context['request'].user)}
+
+
+class ReportParamsSerializer(serializers.Serializer):
+    # query params of GET /reports/sales/ and /reports/payments/
+    max_days = 3 * 366
+
+    start = serializers.DateField()
+    end = serializers.DateField(required=False)
+    store = serializers.PrimaryKeyRelatedField(queryset=Store.objects.all(), required=False, default=None)
+    period = serializers.ChoiceField(choices=['day', 'week', 'month', 'year'], default='day')
+    group_by = serializers.ChoiceField(choices=['none', 'store', 'product', 'category'], default='none')
+    compare = serializers.BooleanField(default=False, help_text="Also return the same range one year earlier.")
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("start must be on or before end.")
+        if (attrs['end'] - attrs['start']).days >= self.max_days:
+            raise serializers.ValidationError(f"At most {self.max_days} days per request.")
+        return attrs
+
+
+class PaymentReportParamsSerializer(ReportParamsSerializer):
+    # payments carry no product, so they are not split per product or category
+    group_by = serializers.ChoiceField(choices=['none', 'store'], default='none')
+
+
+class SalesReportRowSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    store = serializers.UUIDField(required=False)
+    product = serializers.UUIDField(required=False)
+    category = serializers.IntegerField(required=False)
+    quantity = serializers.DecimalField(max_digits=18, decimal_places=6)
+    subtotal = serializers.DecimalField(max_digits=18, decimal_places=6)
+    vat = serializers.DecimalField(max_digits=18, decimal_places=6)
+    discount = serializers.DecimalField(max_digits=18, decimal_places=6)
+    total = serializers.DecimalField(max_digits=18, decimal_places=6)
+    line_count = serializers.IntegerField()
+
+
+class PaymentReportRowSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    store = serializers.UUIDField(required=False)
+    method = serializers.CharField()
+    amount = serializers.DecimalField(max_digits=18, decimal_places=2)
+    payment_count = serializers.IntegerField()
+
+
+class ExtractParamsSerializer(serializers.Serializer):
+    # query params of GET /extract/<table>/
+    start = serializers.DateField()
+    end = serializers.DateField(required=False)
+    store = serializers.PrimaryKeyRelatedField(queryset=Store.objects.all(), required=False, default=None)
+    file_type = serializers.ChoiceField(choices=['parquet', 'arrow', 'csv'], default='csv',
+                                        help_text="parquet and arrow need pyarrow on the server.")
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("start must be on or before end.")
+        return attrs
@@ -1,3 +1,223 @@
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from core.models import Store, Category, Brand, Product
+from inventory.models import Inventory, StockTransaction, StockSnapshot, SnapshotPeriod
+from sales.models import Customer, Sales, SalesLine, Payment, Shipment, ShipmentLine, DailySalesRollup, \
+    DailyPaymentRollup, SalesOrderStatus
+from user.models import User
+
+
+class SalesFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cashier', password='cashier', role='Admin')
+        cls.store = Store.objects.create(name='Main', creator=cls.user)
+        cls.customer = Customer.objects.create(name='Walk-in', phone='0000')
+        category = Category.objects.create(name='Grocery')
+        brand = Brand.objects.create(name='Acme')
+        cls.products = Product.objects.bulk_create([
+            Product(sku=f'SKU-{i}', name=f'Product {i}', category=category, brand=brand, unit_price=Decimal('10'),
+                    unit_cost=Decimal('6'), tax_method='exclusive', tax_rate=Decimal('0'))
+            for i in range(3)
+        ])
+        StockTransaction.create_transactions([
+            dict(product=product, store=cls.store, quantity=Decimal('100'), created_by=cls.user)
+            for product in cls.products
+        ])
+
+    def quantity(self, product):
+        return Inventory.objects.get(product=product, store=self.store).quantity
+
+
+class CheckoutTests(SalesFixtureMixin, APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        taxed, flat = self.products[0], self.products[1]
+        Product.objects.filter(pk=taxed.pk).update(unit_price=Decimal('115'), tax_method='inclusive',
+                                                   tax_rate=Decimal('15'))
+        Inventory.objects.filter(product=taxed).update(discount_method='percentage', discount_rate=Decimal('10'))
+        Inventory.objects.filter(product=flat).update(discount_method='flat', discount_rate=Decimal('1'))
+
+    def checkout(self, lines, payments=()):
+        return self.client.post('/v1/api/sales/checkout/', {
+            'customer': self.customer.pk, 'store': str(self.store.pk),
+            'lines': [{'product': str(product.pk), 'quantity': quantity} for product, quantity in lines],
+            'payments': list(payments),
+        }, format='json')
+
+    def test_lines_are_priced_server_side(self):
+        taxed, flat = self.products[0], self.products[1]
+        response = self.checkout([(taxed, '2'), (flat, '3')], [{'amount': '234', 'method': 'Cash'}])
+        self.assertEqual(response.status_code, 201, response.content)
+
+        sale = Sales.objects.get(pk=response.json()['id'])
+        lines = {line.product_id: line for line in sale.lines.all()}
+        # 115 inclusive of 15% VAT is 100 net; 10% off the 200, VAT on the 180 left
+        self.assertEqual((lines[taxed.pk].unit_price, lines[taxed.pk].discount, lines[taxed.pk].vat_amount,
+                          lines[taxed.pk].total), (Decimal('100'), Decimal('20'), Decimal('27'), Decimal('207')))
+        # 1 off per unit
+        self.assertEqual((lines[flat.pk].discount, lines[flat.pk].total), (Decimal('3'), Decimal('27')))
+        self.assertEqual((sale.total, sale.status), (Decimal('234'), SalesOrderStatus.COMPLETE))
+        self.assertEqual((self.quantity(taxed), self.quantity(flat)), (Decimal('98'), Decimal('97')))
+        self.assertEqual(StockTransaction.objects.filter(reference_type='SO', reference_id=sale.pk).count(), 2)
+
+    def test_underpaid_sale_is_pending(self):
+        response = self.checkout([(self.products[2], '1')], [{'amount': '5', 'method': 'Cash'}])
+        self.assertEqual(response.json()['status'], SalesOrderStatus.PENDING)
+        self.assertEqual(Decimal(response.json()['balance_due']), Decimal('5'))
+
+    def test_insufficient_stock_creates_nothing(self):
+        response = self.checkout([(self.products[2], '1'), (self.products[1], '101')])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Sales.objects.exists())
+        self.assertEqual(self.quantity(self.products[2]), Decimal('100'))
+
+    def test_inactive_product_is_rejected(self):
+        Inventory.objects.filter(product=self.products[2]).update(is_active=False)
+        response = self.checkout([(self.products[2], '1')])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('detail', response.json())
+
+
+class ShipmentTests(SalesFixtureMixin, TestCase):
+    def test_lines_of_the_same_product_post_one_movement(self):
+        product = self.products[0]
+        sale = Sales.objects.create(customer=self.customer, store=self.store, created_by=self.user)
+        shipment = Shipment.objects.create(sales_order=sale, store=self.store, created_by=self.user)
+        ShipmentLine.objects.bulk_create([
+            ShipmentLine(shipment=shipment, product=product, quantity=Decimal('2'), unit_price=Decimal('10')),
+            ShipmentLine(shipment=shipment, product=product, quantity=Decimal('3'), unit_price=Decimal('20')),
+        ])
+
+        shipment.ship(self.user)
+
+        movement = StockTransaction.objects.get(reference_type='SHIP', reference_id=shipment.pk)
+        self.assertEqual(movement.quantity, Decimal('-5'))
+        self.assertEqual(movement.unit_cost, Decimal('16'))
+        self.assertEqual(self.quantity(product), Decimal('95'))
+        self.assertIsNotNone(shipment.shipped_at)
+
+
+class IngestTests(SalesFixtureMixin, APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now()
+        # the opening stock was received three days ago
+        StockTransaction.objects.update(created_at=self.now - timedelta(days=3))
+
+    def sale(self, client_id=None, quantity='2', **fields):
+        return dict(client_id=str(client_id or uuid.uuid4()), customer=self.customer.pk, store=str(self.store.pk),
+                    lines=[{'product': str(self.products[0].pk), 'quantity': quantity}],
+                    payments=[{'amount': '20', 'method': 'Cash'}], **fields)
+
+    def ingest(self, *sales):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/v1/api/sales/ingest/', {'sales': list(sales)}, format='json')
+
+    def test_client_id_is_deduplicated_within_and_across_batches(self):
+        first = self.sale()
+        response = self.ingest(first, first, self.sale(quantity='1000'))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'duplicate', 'rejected'])
+        self.assertEqual(results[1]['sale'], results[0]['sale'])
+
+        again = self.ingest(first).json()['results']
+        self.assertEqual(again[0]['status'], 'duplicate')
+        self.assertEqual(again[0]['sale'], results[0]['sale'])
+        self.assertEqual(Sales.objects.count(), 1)
+        self.assertEqual(self.quantity(self.products[0]), Decimal('98'))
+
+    def test_sold_at_dates_the_sale_the_ledger_and_the_rollup(self):
+        product, sold_at = self.products[0], self.now - timedelta(days=1)
+        StockSnapshot.objects.take(self.now - timedelta(hours=12), SnapshotPeriod.DAILY)
+        # received online after the till went offline
+        StockTransaction.create_transaction(product=product, store=self.store, quantity=Decimal('5'),
+                                            created_by=self.user)
+
+        result = self.ingest(self.sale(sold_at=sold_at.isoformat())).json()['results'][0]
+
+        sale = Sales.objects.get(pk=result['sale'])
+        self.assertEqual(sale.created_at, sold_at)
+        issue = StockTransaction.objects.get(reference_type='SO', reference_id=sale.pk)
+        self.assertEqual((issue.created_at, issue.balance_after), (sold_at, Decimal('98')))
+        # every later balance includes the sale
+        self.assertEqual(list(StockTransaction.objects.filter(product=product).order_by('created_at')
+                              .values_list('balance_after', flat=True)), [Decimal('100'), Decimal('98'),
+                                                                          Decimal('103')])
+        self.assertEqual(StockSnapshot.objects.get(product=product, store=self.store).quantity, Decimal('98'))
+        self.assertEqual(self.quantity(product), Decimal('103'))
+        self.assertEqual(DailySalesRollup.objects.get(product=product).date, timezone.localdate(sold_at))
+
+    def test_sold_at_in_the_future_is_rejected(self):
+        response = self.ingest(self.sale(sold_at=(self.now + timedelta(hours=1)).isoformat()))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Sales.objects.exists())
+
+
+class RollupMaintenanceTests(SalesFixtureMixin, APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.today = timezone.localdate()
+
+    def complete_sale(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Sales.objects.create(customer=self.customer, store=self.store, created_by=self.user,
+                                        status=SalesOrderStatus.COMPLETE)
+
+    def payments(self):
+        return dict(DailyPaymentRollup.objects.filter(date=self.today, store=self.store)
+                    .values_list('method', 'amount'))
+
+    def test_payments_of_a_sale_without_lines_are_rolled_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = Sales.objects.create(customer=self.customer, store=self.store, created_by=self.user,
+                                        status=SalesOrderStatus.COMPLETE)
+            Payment.objects.bulk_create([Payment(sales=sale, amount=Decimal('15'), method='Cash',
+                                                 created_by=self.user)])
+        self.assertEqual(self.payments(), {'Cash': Decimal('15')})
+
+    def test_payment_added_later_reaches_only_its_method_row(self):
+        sale = self.complete_sale()
+        # a row of another method is left alone (not recomputed)
+        DailyPaymentRollup.objects.create(date=self.today, store=self.store, method='Card', amount=Decimal('7'),
+                                          payment_count=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/v1/api/transaction/', {
+                'sales': str(sale.pk), 'amount': '12.50', 'method': 'Cash', 'created_by': self.user.pk,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.payments(), {'Cash': Decimal('12.50'), 'Card': Decimal('7')})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/v1/api/transaction/{response.json()['id']}/")
+        self.assertEqual(self.payments(), {'Card': Decimal('7')})
+
+    def test_line_added_and_moved_later_updates_the_product_rows(self):
+        sale = self.complete_sale()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/v1/api/sales_item/', {
+                'sales': str(sale.pk), 'product': str(self.products[0].pk), 'quantity': '3', 'unit_price': '10',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        rows = DailySalesRollup.objects.filter(date=self.today, store=self.store)
+        self.assertEqual(list(rows.values_list('product', 'quantity', 'total')),
+                         [(self.products[0].pk, Decimal('3'), Decimal('30'))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            line = SalesLine.objects.get(pk=response.json()['id'])
+            line.product = self.products[1]
+            line.save()
+        self.assertEqual(list(rows.values_list('product', 'quantity')), [(self.products[1].pk, Decimal('3'))])
 
-# Create your tests here.
+    def test_payments_report_rejects_a_product_or_category_split(self):
+        url = f'/v1/api/reports/payments/?start={self.today}'
+        for group_by in ('product', 'category'):
+            self.assertEqual(self.client.get(f'{url}&group_by={group_by}').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}&group_by=store').status_code, 200)
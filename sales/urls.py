@@ -1,6 +1,8 @@
+from django.urls import path
 from rest_framework import routers
 
-from sales.views import CustomerAPIView, SalesAPIView, SalesItemAPIView, TransactionAPIView
+from sales.views import CustomerAPIView, SalesAPIView, SalesItemAPIView, TransactionAPIView, ReportAPIView, \
+    ExtractAPIView
 
 app_name = 'sales'
 router = routers.DefaultRouter()
@@ -8,4 +10,7 @@ router.register('customer', CustomerAPIView, basename='customer')
 router.register('sales', SalesAPIView, basename='sales')
 router.register('sales_item', SalesItemAPIView, basename='sales_item')
 router.register('transaction', TransactionAPIView, basename='transaction')
-urlpatterns = router.urls
+router.register('reports', ReportAPIView, basename='reports')
+urlpatterns = router.urls + [
+    path('extract/<str:table>/', ExtractAPIView.as_view(), name='extract'),
+]
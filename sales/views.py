@@ -1,9 +1,20 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from drf_spectacular.utils import extend_schema
-from rest_framework.viewsets import ModelViewSet
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, inline_serializer, OpenApiParameter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework import serializers
+from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
+from OptiPOS.custompagination import LedgerCursorPagination
 from sales.models import Customer, Sales, SalesLine, Payment
-from sales.serializer import CustomerSerializer, SalesSerializer, SalesItemSerializer, TransactionSerializer
+from sales.serializer import CustomerSerializer, SalesSerializer, SalesItemSerializer, TransactionSerializer, \
+    CheckoutSerializer, SalesIngestSerializer, ReportParamsSerializer, PaymentReportParamsSerializer, \
+    SalesReportRowSerializer, PaymentReportRowSerializer, ExtractParamsSerializer
+from sales import reports, extracts
 
 
 # Create your views here.
@@ -15,8 +26,33 @@ class CustomerAPIView(ModelViewSet):
 
 @extend_schema(tags=['Sales'])
 class SalesAPIView(ModelViewSet):
-    queryset = Sales.objects.all()
+    queryset = Sales.objects.with_totals()
     serializer_class = SalesSerializer
+    pagination_class = LedgerCursorPagination
+
+    @extend_schema(request=CheckoutSerializer, responses={201: SalesSerializer})
+    @action(detail=False, methods=['post'], serializer_class=CheckoutSerializer)
+    def checkout(self, request):
+        """
+        Single-request POS checkout: header, lines and payments are validated, priced,
+        stored and posted to the stock ledger in one transaction.
+        """
+        serializer = CheckoutSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        sale = serializer.save()
+        return Response(SalesSerializer(self.get_queryset().get(pk=sale.pk)).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(request=SalesIngestSerializer, responses=OpenApiTypes.OBJECT)
+    @action(detail=False, methods=['post'], serializer_class=SalesIngestSerializer)
+    def ingest(self, request):
+        """
+        Batch upload of sales recorded offline, deduplicated by the till's client_id (safe to retry).
+        Returns one result per sale: created, duplicate or rejected (with errors).
+        """
+        serializer = SalesIngestSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_200_OK)
+
 
 @extend_schema(tags=['Sales Item'])
 class SalesItemAPIView(ModelViewSet):
@@ -28,3 +64,90 @@ class SalesItemAPIView(ModelViewSet):
 class TransactionAPIView(ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = TransactionSerializer
+    pagination_class = LedgerCursorPagination
+
+
+def _previous_year(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+
+def _report_response(name, row_serializer):
+    return inline_serializer(name, {
+        'start': serializers.DateField(), 'end': serializers.DateField(),
+        'rows': row_serializer(many=True), 'previous_year': row_serializer(many=True, required=False),
+    })
+
+
+@extend_schema(tags=['Reports'])
+class ReportAPIView(GenericViewSet):
+    """
+    Sales and payment reports, served from the daily rollups (rebuilt with backfill_sales_rollups).
+    """
+    serializer_class = ReportParamsSerializer
+
+    def _report(self, request, report, row_serializer, params_serializer=ReportParamsSerializer):
+        params = params_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = dict(params.validated_data)
+        compare, start, end = options.pop('compare'), options.pop('start'), options.pop('end')
+
+        data = {'start': start, 'end': end, 'rows': row_serializer(report(start, end, **options), many=True).data}
+        if compare:
+            rows = report(_previous_year(start), _previous_year(end), **options)
+            data['previous_year'] = row_serializer(rows, many=True).data
+        return Response(data)
+
+    @extend_schema(parameters=[ReportParamsSerializer],
+                   responses=_report_response('SalesReport', SalesReportRowSerializer))
+    @action(detail=False, methods=['get'])
+    def sales(self, request):
+        """
+        Quantity, amounts and line count of completed sales per day / week / month / year,
+        optionally per store, product or category.
+        """
+        return self._report(request, reports.sales_report, SalesReportRowSerializer)
+
+    @extend_schema(parameters=[PaymentReportParamsSerializer],
+                   responses=_report_response('PaymentReport', PaymentReportRowSerializer))
+    @action(detail=False, methods=['get'])
+    def payments(self, request):
+        """
+        Payments of completed sales per period and method, optionally per store (group_by=store).
+        """
+        return self._report(request, reports.payments_report, PaymentReportRowSerializer,
+                            PaymentReportParamsSerializer)
+
+
+@extend_schema(
+    tags=['Reports'],
+    parameters=[
+        OpenApiParameter(name="table", type=OpenApiTypes.STR, location=OpenApiParameter.PATH,
+                         enum=list(extracts.EXTRACTS)),
+        ExtractParamsSerializer,
+    ],
+    responses={(200, content_type): OpenApiTypes.BINARY for content_type in extracts.CONTENT_TYPES.values()},
+)
+class ExtractAPIView(APIView):
+    """
+    Bulk extract of the stock ledger, sales lines or payments for a date range (and store),
+    streamed as Parquet / Arrow IPC (when pyarrow is installed) or CSV.
+    """
+
+    def get(self, request, table):
+        if table not in extracts.EXTRACTS:
+            return Response({'detail': "Unknown extract."}, status=status.HTTP_404_NOT_FOUND)
+        params = ExtractParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+        fmt = options['file_type']
+        try:
+            body = extracts.stream(table, fmt, options['start'], options['end'], options['store'])
+        except extracts.ExtractError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(body, content_type=extracts.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = (f'attachment; filename="{table}-{options["start"]}-{options["end"]}.'
+                                           f'{fmt}"')
+        return response
@@ -40,5 +40,7 @@ echo "migrating sales"
 sleep 2
 python manage.py makemigrations user core inventory purchase sales
 python manage.py migrate
+echo "creating the cache table"
+python manage.py createcachetable
 sleep 1
 echo "✅ Migrations completed successfully!"